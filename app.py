@@ -1,15 +1,63 @@
 import streamlit as st
+from streamlit import config as st_config
+from streamlit.errors import StreamlitAPIException
+import pandas as pd
+import numpy as np
 from supabase import create_client, Client
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from collections import OrderedDict
+import csv
+import functools
+import hashlib
+import io
+import json
+import logging
 import os
-from typing import Optional
+import re
+import shutil
+import sqlite3
+import random
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Callable, Optional
 
 # OpenAI API (선택적)
 try:
-    from openai import OpenAI
+    from openai import OpenAI, APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
     OPENAI_AVAILABLE = True
+    # 재시도할 일시적 오류 (요청 한도 초과, 네트워크, 서버 오류)
+    RETRYABLE_AI_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
 except ImportError:
     OPENAI_AVAILABLE = False
+    RETRYABLE_AI_ERRORS = ()
+
+# Parquet 내보내기 (선택적)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Excel 가져오기 (선택적)
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# 비슷한 상담기록 색인 (선택적)
+try:
+    import scipy.sparse as sp
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
 
 # 페이지 설정
 st.set_page_config(
@@ -18,111 +66,2576 @@ st.set_page_config(
     layout="wide"
 )
 
+# 성능 측정 설정
+PERF_LOG_PATH = os.getenv("PERF_LOG_PATH", os.path.join(".cache", "perf", "metrics.jsonl"))  # 빈 값이면 기록 안 함
+PERF_LOG_MAX_BYTES = 5 * 1024 * 1024
+PERF_LOG_BACKUP_COUNT = 5
+PERF_PROM_PATH = os.getenv("PERF_PROM_PATH", "")  # Prometheus textfile collector용 (.prom), 빈 값이면 기록 안 함
+
+def payload_size(data) -> int:
+    """결과를 JSON으로 직렬화했을 때의 크기 (전송량 추정치, 바이트)"""
+    return len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+
+class PerfMetrics:
+    """Supabase 쿼리, AI 호출, 스크립트 실행 시간 측정
+
+    각 측정 결과를 JSON Lines 로그(크기 기준 순환)에 한 줄씩 기록하고, 종류/이름별 누적값을
+    Prometheus textfile 형식으로 내보낼 수 있습니다. 스크립트 실행(rerun) 중에 측정된 항목은
+    관리자 패널에 표시하기 위해 실행 단위로도 모읍니다.
+    """
+    
+    def __init__(self, log_path: str = PERF_LOG_PATH, prom_path: str = PERF_PROM_PATH):
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._local = threading.local()
+        self._logger = None
+        if log_path:
+            if os.path.dirname(log_path):
+                os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            handler = RotatingFileHandler(log_path, maxBytes=PERF_LOG_MAX_BYTES, backupCount=PERF_LOG_BACKUP_COUNT, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"counseling.perf.{id(self)}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._logger.addHandler(handler)
+    
+    def start_rerun(self):
+        """현재 스레드에서 스크립트 실행 단위 수집 시작"""
+        self._local.events = []
+    
+    def finish_rerun(self) -> list:
+        """현재 스크립트 실행에서 수집한 측정 결과 반환 후 수집 종료"""
+        events = getattr(self._local, "events", None) or []
+        self._local.events = None
+        return events
+    
+    def current_events(self) -> Optional[list]:
+        """현재 스레드에서 수집 중인 스크립트 실행의 측정 결과 목록 (수집 중이 아니면 None)"""
+        return getattr(self._local, "events", None)
+    
+    @contextmanager
+    def collect_into(self, events: Optional[list]):
+        """다른 스레드에서 측정한 결과도 events(호출한 스크립트 실행의 목록)에 모음"""
+        previous = getattr(self._local, "events", None)
+        self._local.events = events
+        try:
+            yield
+        finally:
+            self._local.events = previous
+    
+    def record(self, kind: str, name: str, seconds: float, rows: Optional[int] = None,
+               size: Optional[int] = None, error: Optional[str] = None, **extra):
+        event = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "kind": kind,
+            "name": name,
+            "ms": round(seconds * 1000, 2),
+            "rows": rows,
+            "bytes": size,
+            "error": error,
+            **extra,
+        }
+        with self._lock:
+            total = self._totals.setdefault((kind, name), {"count": 0, "seconds": 0.0, "errors": 0, "rows": 0, "bytes": 0})
+            total["count"] += 1
+            total["seconds"] += seconds
+            total["errors"] += 1 if error else 0
+            total["rows"] += rows or 0
+            total["bytes"] += size or 0
+        events = getattr(self._local, "events", None)
+        if events is not None:
+            events.append(event)
+        if self._logger:
+            self._logger.info(json.dumps(event, ensure_ascii=False))
+    
+    @contextmanager
+    def span(self, kind: str, name: str):
+        """with 블록 실행 시간 측정 - 블록 안에서 span["rows"], span["bytes"]를 채우면 함께 기록"""
+        span = {"rows": None, "bytes": None}
+        error = None
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.record(kind, name, time.perf_counter() - started, span["rows"], span["bytes"], error)
+    
+    def totals(self) -> dict:
+        with self._lock:
+            return {key: dict(value) for key, value in self._totals.items()}
+    
+    def write_prometheus(self):
+        """누적값을 Prometheus textfile 형식으로 저장 (임시 파일에 쓴 뒤 교체)"""
+        if not self.prom_path:
+            return
+        metrics = [
+            ("counseling_app_operations_total", "Number of measured operations", "count"),
+            ("counseling_app_operation_seconds_total", "Total time spent in operations", "seconds"),
+            ("counseling_app_operation_errors_total", "Number of failed operations", "errors"),
+            ("counseling_app_rows_total", "Rows returned by operations", "rows"),
+            ("counseling_app_payload_bytes_total", "Approximate payload bytes of operations", "bytes"),
+        ]
+        totals = self.totals()
+        lines = []
+        for metric, help_text, field in metrics:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for (kind, name), total in sorted(totals.items()):
+                lines.append(f'{metric}{{kind="{kind}",name="{name}"}} {total[field]}')
+        if os.path.dirname(self.prom_path):
+            os.makedirs(os.path.dirname(self.prom_path), exist_ok=True)
+        tmp_path = f"{self.prom_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.prom_path)
+
+@st.cache_resource
+def get_perf_metrics() -> PerfMetrics:
+    """프로세스 전체에서 공유되는 성능 측정기"""
+    return PerfMetrics()
+
+# 설정 읽기 (환경 변수 > Streamlit secrets > 기본값)
+CONFIG_DEFAULTS = {
+    "OPENAI_API_KEY": "",
+    "OPENAI_BASE_URL": "",
+    "SUPABASE_URL": "",
+    "SUPABASE_KEY": "",
+    "ADMIN_PASSWORD": "1234",
+    "STORAGE_BACKEND": "supabase",
+}
+CONFIG_CHECK_INTERVAL = 1.0  # 초 (환경 변수와 secrets.toml 변경 확인 주기)
+
+# 클라이언트별로 사용하는 설정 - 이 설정이 바뀐 클라이언트만 다시 만듦
+CLIENT_SETTINGS = {
+    "openai": ("OPENAI_API_KEY", "OPENAI_BASE_URL"),
+    "supabase": ("SUPABASE_URL", "SUPABASE_KEY"),
+}
+
+class AppConfig:
+    """설정 값과 설정으로 만든 클라이언트(OpenAI, Supabase) 캐시
+
+    설정은 한 번 읽은 뒤 재사용하고, 환경 변수 값이나 secrets.toml 파일의 수정 시각이 바뀌었을 때
+    (또는 Streamlit이 secrets.toml 변경을 알렸을 때)만 다시 읽습니다. 클라이언트는 만들 때 사용한
+    설정이 그대로이면 같은 객체(HTTP 연결 풀 포함)를 계속 사용합니다.
+    """
+    
+    def __init__(self, defaults: dict = CONFIG_DEFAULTS, check_interval: float = CONFIG_CHECK_INTERVAL):
+        self.defaults = dict(defaults)
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._values = None
+        self._sources = {}
+        self._signature = None
+        self._checked = 0.0
+        self._clients = {}
+        try:
+            st.secrets.file_change_listener.connect(self._on_secrets_changed, weak=False)
+        except AttributeError:
+            pass
+    
+    def _on_secrets_changed(self, *args, **kwargs):
+        with self._lock:
+            self._values = None
+    
+    def _secrets_signature(self) -> tuple:
+        signature = []
+        for path in st_config.get_option("secrets.files"):
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+    
+    def _read(self, names: list) -> tuple:
+        try:
+            secrets = {name: st.secrets[name] for name in names if name in st.secrets}
+        except FileNotFoundError:
+            secrets = {}
+        values, sources = {}, {}
+        for name in names:
+            env_value = os.environ.get(name, "").strip()
+            secret_value = str(secrets.get(name, "")).strip()
+            # Streamlit은 secrets의 문자열 값을 환경 변수로도 등록하므로, 같은 값이면 secrets로 표시
+            if env_value and env_value != secret_value:
+                values[name], sources[name] = env_value, "env"
+            elif secret_value:
+                values[name], sources[name] = secret_value, "secrets"
+            else:
+                values[name], sources[name] = self.defaults.get(name, ""), None
+        return values, sources
+    
+    def _current(self) -> dict:
+        """현재 설정 값 (확인 주기마다 변경 여부를 확인하고, 바뀌었으면 다시 읽음)"""
+        now = time.monotonic()
+        with self._lock:
+            if self._values is not None and now - self._checked < self.check_interval:
+                return self._values
+            names = list(self.defaults)
+        signature = (tuple(os.environ.get(name) for name in names), self._secrets_signature())
+        with self._lock:
+            if self._values is not None and signature == self._signature:
+                self._checked = now
+                return self._values
+        values, sources = self._read(names)
+        with self._lock:
+            self._values, self._sources, self._signature, self._checked = values, sources, signature, now
+            self.reloads += 1
+            return values
+    
+    def get(self, name: str, default: Optional[str] = None) -> str:
+        """설정 값 (설정되지 않았으면 default 또는 CONFIG_DEFAULTS의 기본값)"""
+        if name not in self.defaults:
+            with self._lock:
+                self.defaults[name] = ""
+                self._values = None
+        value = self._current().get(name, "")
+        if default is not None and self._sources.get(name) is None:
+            return default
+        return value
+    
+    def source(self, name: str) -> Optional[str]:
+        """설정 값을 읽은 곳 ("env", "secrets", 없으면 None)"""
+        self.get(name)
+        return self._sources.get(name)
+    
+    def client(self, name: str, factory: Callable):
+        """CLIENT_SETTINGS[name]의 설정으로 factory(*값)를 호출해 만든 클라이언트 (설정이 바뀌었을 때만 새로 만듦)"""
+        settings = tuple(self.get(setting) for setting in CLIENT_SETTINGS[name])
+        with self._lock:
+            cached = self._clients.get(name)
+            if cached is not None and cached[0] == settings:
+                return cached[1]
+        client = factory(*settings)
+        with self._lock:
+            # 이전 클라이언트는 닫지 않음 (백그라운드 작업이 아직 사용 중일 수 있음)
+            self._clients[name] = (settings, client)
+        return client
+
+@st.cache_resource
+def get_app_config() -> AppConfig:
+    """프로세스 전체에서 공유되는 설정"""
+    return AppConfig()
+
+def get_setting(name: str, default: Optional[str] = None) -> str:
+    """설정 값 읽기 (환경 변수 > Streamlit secrets > 기본값)"""
+    return get_app_config().get(name, default)
+
+def _create_openai_client(api_key: str, base_url: str):
+    # 간단한 유효성 검사 (API 키 형식 확인)
+    if not api_key.startswith("sk-"):
+        return None
+    try:
+        return OpenAI(api_key=api_key, base_url=base_url or None)
+    except Exception:
+        return None
+
 # OpenAI 클라이언트 초기화 (선택적)
-# 캐시를 사용하지 않음 (secrets 변경 시 즉시 반영되도록)
+# 설정이 바뀌면 다음 실행에서 새 클라이언트를 만듦 (secrets 변경 시 즉시 반영)
 def init_openai():
-    """OpenAI 클라이언트 초기화"""
+    """OpenAI 클라이언트 (API 키가 없거나 형식이 맞지 않으면 None)"""
     if not OPENAI_AVAILABLE:
         return None
+    return get_app_config().client("openai", _create_openai_client)
+
+# AI 텍스트 개선 설정
+AI_MODEL = "gpt-4o-mini"  # 또는 "gpt-3.5-turbo" 사용 가능
+AI_TEMPERATURE = 0.7
+AI_MAX_TOKENS = 500
+AI_SYSTEM_PROMPT = "당신은 초등학교 상담 기록을 전문적으로 작성하는 교육 전문가입니다."
+AI_PROMPT_TEMPLATE = """초등학교 상담 기록의 상담 내용을 더 정교하고 상세하게 작성해주세요.
+다음은 간단히 작성된 상담 내용입니다:
+"{text}"
+
+요구사항:
+- 상담 내용을 더 구체적이고 상세하게 작성
+- 전문적이면서도 이해하기 쉬운 문장으로 표현
+- 초등학교 상담 기록에 적합한 톤으로 작성
+- 원본 내용의 핵심은 유지하면서 더 풍부하게 설명
+- 2-3문단 정도의 적절한 분량으로 작성
+
+개선된 상담 내용:"""
+
+# 프롬프트를 수정하면 버전이 바뀌어 이전 캐시 항목은 자동으로 사용되지 않음
+AI_PROMPT_VERSION = hashlib.sha256((AI_SYSTEM_PROMPT + AI_PROMPT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+
+# AI 개선 결과 캐시 설정
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", os.path.join(".cache", "ai_cache.sqlite3"))
+AI_CACHE_MAX_ENTRIES = 2000
+
+def normalize_ai_input(text: str) -> str:
+    """캐시 키용 입력 정규화 (유니코드 NFC, 공백/줄바꿈 차이 무시)"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def ai_cache_key(text: str, model: str = AI_MODEL, temperature: float = AI_TEMPERATURE,
+                 prompt_version: str = AI_PROMPT_VERSION) -> str:
+    """입력 텍스트, 프롬프트 버전, 모델, temperature로 만든 캐시 키 (SHA-256)"""
+    payload = json.dumps([normalize_ai_input(text), prompt_version, model, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AICache:
+    """AI 개선 결과 영구 캐시 (SQLite 파일, LRU 제거, 적중/실패 횟수 기록)"""
+    
+    def __init__(self, path: str = AI_CACHE_PATH, max_entries: int = AI_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS ai_cache (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache(last_used)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS ai_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._conn.execute("INSERT OR IGNORE INTO ai_cache_stats VALUES ('hits', 0), ('misses', 0)")
+    
+    def get(self, key: str) -> Optional[str]:
+        """캐시된 결과 반환 (없으면 None)"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT result FROM ai_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                self._conn.execute("UPDATE ai_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            counter = "hits" if row else "misses"
+            self._conn.execute("UPDATE ai_cache_stats SET value = value + 1 WHERE name = ?", (counter,))
+        return row[0] if row else None
+    
+    def put(self, key: str, result: str, model: str = AI_MODEL, prompt_version: str = AI_PROMPT_VERSION):
+        """결과 저장 후 최대 개수를 넘으면 가장 오래 사용하지 않은 항목부터 제거"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, result, model, prompt_version, now, now)
+            )
+            self._conn.execute(
+                "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+    
+    def stats(self) -> dict:
+        """적중/실패 횟수와 저장된 항목 수"""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM ai_cache_stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+        return {"hits": counters.get("hits", 0), "misses": counters.get("misses", 0), "entries": entries}
+
+@st.cache_resource
+def get_ai_cache() -> AICache:
+    """프로세스 전체에서 공유되는 AI 개선 결과 캐시"""
+    return AICache()
+
+def build_improve_messages(text: str) -> list:
+    """상담 내용 개선 요청 메시지 구성"""
+    return [
+        {"role": "system", "content": AI_SYSTEM_PROMPT},
+        {"role": "user", "content": AI_PROMPT_TEMPLATE.format(text=text)}
+    ]
+
+def stream_improved_text(client, text: str, stats: dict, cache: Optional[AICache] = None,
+                         metrics: Optional[PerfMetrics] = None, limiter: Optional["RateLimiter"] = None):
+    """AI 개선 결과를 토큰 단위로 생성하는 제너레이터
+
+    stats에는 첫 토큰까지의 시간(ttft)과 전체 소요 시간(total)이 초 단위로 기록됩니다.
+    캐시에 있으면 API를 호출하지 않고 저장된 결과를 바로 반환하며 (stats['cached']),
+    끝까지 생성된 결과만 캐시에 저장합니다.
+    limiter가 있으면 API를 호출하기 전에 요청 1회분을 얻을 때까지 기다립니다 (캐시 적중은 제외).
+    중간에 close()하면 (사용자 중지 등) 서버와의 스트리밍 연결도 닫습니다.
+    """
+    started = time.perf_counter()
+    cache = cache or get_ai_cache()
+    metrics = metrics or get_perf_metrics()
+    cache_key = ai_cache_key(text)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        stats['cached'] = True
+        stats['ttft'] = stats['total'] = time.perf_counter() - started
+        yield cached
+        return
+    
+    parts = []
+    error = None
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        stream = client.chat.completions.create(
+            model=AI_MODEL,
+            messages=build_improve_messages(text),
+            temperature=AI_TEMPERATURE,
+            max_tokens=AI_MAX_TOKENS,
+            stream=True
+        )
+    except Exception as e:
+        metrics.record("openai", "stream_improved_text", time.perf_counter() - started, error=f"{type(e).__name__}: {e}")
+        raise
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if 'ttft' not in stats:
+                    stats['ttft'] = time.perf_counter() - started
+                parts.append(delta)
+                yield delta
+        
+        improved_text = "".join(parts).strip()
+        if improved_text:
+            cache.put(cache_key, improved_text)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stats['total'] = time.perf_counter() - started
+        stream.close()
+        metrics.record(
+            "openai", "stream_improved_text", stats['total'],
+            size=len("".join(parts).encode("utf-8")), error=error, ttft_ms=round(stats.get('ttft', 0) * 1000, 2)
+        )
+
+# 학생 상담 이력 요약 설정 (기록별 요약 → 묶음별 합치기 → 최종 요약)
+AI_SUMMARY_TEMPERATURE = 0.3
+AI_SUMMARY_MAX_TOKENS = 200  # 기록 한 건 요약
+AI_SUMMARY_MERGE_MAX_TOKENS = 800  # 합친 요약
+AI_SUMMARY_MERGE_GROUP = 10  # 한 번에 합칠 요약 수
+AI_SUMMARY_MAX_WORKERS = 4  # 동시에 실행할 요약 요청 수 (모든 작업 공통)
+AI_RATE_LIMIT_PER_MINUTE = int(os.getenv("AI_RATE_LIMIT_PER_MINUTE", "60"))
+AI_SUMMARY_SYSTEM_PROMPT = "당신은 초등학교 상담 기록을 정리하는 교육 전문가입니다. 기록에 없는 내용은 추측하지 않습니다."
+AI_RECORD_SUMMARY_TEMPLATE = """다음은 한 학생의 상담 기록 한 건입니다.
+{text}
+
+핵심 내용(상담 계기, 관찰 내용, 조치 및 후속 계획)을 2~3문장으로 요약해주세요.
+
+요약:"""
+AI_SUMMARY_MERGE_TEMPLATE = """다음은 한 학생의 상담 기록 요약들입니다 (오래된 순).
+{text}
+
+시간 순서와 중요한 변화를 유지하면서 하나의 요약으로 합쳐주세요 (5문장 이내).
+
+합친 요약:"""
+AI_SUMMARY_FINAL_TEMPLATE = """다음은 {student_name} 학생의 상담 기록 요약입니다 (오래된 순).
+{text}
+
+학부모 상담과 학년 말 인수인계에 사용할 종합 요약을 작성해주세요.
+- 주요 상담 주제와 시기별 변화
+- 현재 상태와 지속적으로 지원이 필요한 부분
+- 다음 담임 교사를 위한 참고 사항
+기록에 없는 내용은 쓰지 말고, 3~4문단으로 작성해주세요.
+
+종합 요약:"""
+AI_SUMMARY_PROMPT_VERSION = hashlib.sha256(
+    (AI_SUMMARY_SYSTEM_PROMPT + AI_RECORD_SUMMARY_TEMPLATE + AI_SUMMARY_MERGE_TEMPLATE + AI_SUMMARY_FINAL_TEMPLATE).encode("utf-8")
+).hexdigest()[:12]
+
+class RateLimiter:
+    """분당 요청 수 제한 (토큰 버킷, 여러 스레드가 공유)"""
+    
+    def __init__(self, per_minute: int = AI_RATE_LIMIT_PER_MINUTE):
+        self.rate = per_minute / 60.0
+        self.capacity = max(per_minute // 6, 1)  # 최대 10초 분량까지 몰아서 요청 가능
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
     
-    api_key = None
+    def acquire(self):
+        """요청 1회분을 얻을 때까지 대기"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def ai_retry_delay(error: Exception, attempt: int) -> float:
+    """재시도 전 대기 시간 - 서버가 Retry-After를 알려주면 그만큼, 아니면 지수 백오프 + 지터"""
+    delay = AI_JOB_RETRY_BASE_DELAY * 2 ** (attempt - 1) + random.uniform(0, 1)
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after and retry_after.replace(".", "", 1).isdigit():
+        delay = float(retry_after)
+    return delay
+
+def complete_with_retry(client, prompt: str, max_tokens: int, limiter: RateLimiter, metrics: PerfMetrics, name: str) -> str:
+    """요약 요청 1회 (요청 수 제한 적용, 일시적 오류는 재시도)"""
+    messages = [
+        {"role": "system", "content": AI_SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    for attempt in range(1, AI_JOB_MAX_ATTEMPTS + 1):
+        limiter.acquire()
+        try:
+            with metrics.span("openai", name) as span:
+                response = client.chat.completions.create(
+                    model=AI_MODEL,
+                    messages=messages,
+                    temperature=AI_SUMMARY_TEMPERATURE,
+                    max_tokens=max_tokens
+                )
+                text = (response.choices[0].message.content or "").strip()
+                span["bytes"] = len(text.encode("utf-8"))
+            return text
+        except RETRYABLE_AI_ERRORS as e:
+            if attempt == AI_JOB_MAX_ATTEMPTS:
+                raise
+            time.sleep(ai_retry_delay(e, attempt))
+
+def format_record_for_summary(record: dict) -> str:
+    """요약 요청에 넣을 상담기록 한 건 (캐시 키에도 사용)"""
+    text = (
+        f"[{record.get('consult_date')} · {record.get('grade')}학년 {record.get('class_num')}반 · 상담자 {record.get('counselor')}]\n"
+        f"{record.get('consult_content') or ''}"
+    )
+    if record.get('notes'):
+        text += f"\n비고: {record['notes']}"
+    return text
+
+def summarize_student_records(client, student_name: str, records: list, cache: AICache, limiter: RateLimiter,
+                              executor: ThreadPoolExecutor, metrics: PerfMetrics,
+                              on_progress: Optional[Callable] = None, is_cancelled: Optional[Callable] = None) -> Optional[dict]:
+    """한 학생의 상담기록을 map-reduce로 요약 (records는 오래된 순)
+
+    기록별 요약과 묶음별 합친 요약은 입력 내용으로 캐시하므로, 기록이 하나 추가되면 새 기록과
+    그 기록이 속한 마지막 묶음, 최종 요약만 다시 요청합니다. 취소되면 None을 반환합니다.
+    """
+    stats = {"records": len(records), "requests": 0}
+    stats_lock = threading.Lock()
     
-    # 1. 환경 변수에서 확인 (서버 환경)
-    api_key = os.getenv("OPENAI_API_KEY", "")
+    def cached_completion(prompt: str, max_tokens: int, name: str) -> str:
+        key = ai_cache_key(prompt, temperature=AI_SUMMARY_TEMPERATURE, prompt_version=AI_SUMMARY_PROMPT_VERSION)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        result = complete_with_retry(client, prompt, max_tokens, limiter, metrics, name)
+        with stats_lock:
+            stats["requests"] += 1
+        if result:
+            cache.put(key, result, prompt_version=AI_SUMMARY_PROMPT_VERSION)
+        return result
     
-    # 2. Streamlit secrets에서 확인 (로컬 개발 및 Cloud)
-    if not api_key:
+    def run_all(prompts: list, max_tokens: int, name: str, label: str) -> Optional[list]:
+        """프롬프트들을 동시에 요청하고 입력 순서대로 결과 반환 (취소되면 None)"""
+        futures = [executor.submit(cached_completion, prompt, max_tokens, name) for prompt in prompts]
         try:
-            # Streamlit secrets 접근 방식
-            if hasattr(st, 'secrets'):
-                # st.secrets는 dict-like 또는 object-like일 수 있음
-                if isinstance(st.secrets, dict):
-                    api_key = st.secrets.get("OPENAI_API_KEY", "")
-                else:
-                    # object-like 접근 (st.secrets.OPENAI_API_KEY)
-                    try:
-                        api_key = getattr(st.secrets, "OPENAI_API_KEY", "")
-                    except:
-                        api_key = st.secrets.get("OPENAI_API_KEY", "") if hasattr(st.secrets, 'get') else ""
-        except (KeyError, AttributeError, FileNotFoundError, TypeError) as e:
-            # 디버깅을 위해 오류는 무시하되 로그는 남기지 않음
-            api_key = ""
-    
-    # API 키가 없으면 None 반환
-    if not api_key or not api_key.strip():
+            for done, future in enumerate(futures, start=1):
+                while True:
+                    if is_cancelled and is_cancelled():
+                        return None
+                    if wait([future], timeout=AI_JOB_POLL_INTERVAL).done:
+                        break
+                future.result()  # 요청이 실패했으면 여기서 예외 발생
+                if on_progress:
+                    on_progress(f"{label} {done}/{len(futures)}")
+            return [f.result() for f in futures]
+        finally:
+            # 취소되거나 실패하면 아직 시작하지 않은 요청은 보내지 않음
+            for f in futures:
+                f.cancel()
+    
+    # map: 기록별 요약
+    summaries = run_all(
+        [AI_RECORD_SUMMARY_TEMPLATE.format(text=format_record_for_summary(r)) for r in records],
+        AI_SUMMARY_MAX_TOKENS, "summarize_record", "기록 요약"
+    )
+    # reduce: 묶음별로 합치기를 반복한 뒤 최종 요약
+    while summaries is not None and len(summaries) > AI_SUMMARY_MERGE_GROUP:
+        groups = [summaries[i:i + AI_SUMMARY_MERGE_GROUP] for i in range(0, len(summaries), AI_SUMMARY_MERGE_GROUP)]
+        summaries = run_all(
+            [AI_SUMMARY_MERGE_TEMPLATE.format(text="\n\n".join(g)) for g in groups],
+            AI_SUMMARY_MERGE_MAX_TOKENS, "merge_summaries", "요약 합치기"
+        )
+    if summaries is None or (is_cancelled and is_cancelled()):
         return None
     
-    # OpenAI 클라이언트 생성
-    try:
-        client = OpenAI(api_key=api_key.strip())
-        # 간단한 유효성 검사 (API 키 형식 확인)
-        if api_key.startswith("sk-"):
-            return client
+    if on_progress:
+        on_progress("최종 요약 작성 중")
+    stats["summary"] = cached_completion(
+        AI_SUMMARY_FINAL_TEMPLATE.format(student_name=student_name, text="\n\n".join(summaries)),
+        AI_SUMMARY_MERGE_MAX_TOKENS, "final_summary"
+    )
+    return stats
+
+# AI 개선 작업 큐 설정
+AI_JOBS_PATH = os.getenv("AI_JOBS_PATH", os.path.join(".cache", "ai_jobs.sqlite3"))
+AI_MAX_WORKERS = 4  # 동시에 실행할 최대 AI 요청 수
+AI_JOB_MAX_ATTEMPTS = 4
+AI_JOB_RETRY_BASE_DELAY = 2.0  # 초 (재시도마다 2배씩 증가)
+AI_JOB_POLL_INTERVAL = 0.5  # 초
+AI_JOB_RETENTION = 24 * 60 * 60  # 초
+
+class AIJobQueue:
+    """AI 개선 작업 큐 (SQLite에 작업 상태 저장, 스레드 풀로 동시 실행 수 제한)
+
+    작업 상태: queued(대기/재시도 대기) → running → done | failed | cancelled
+    실행 중에는 생성된 내용을 partial_text에 주기적으로 저장하므로 화면에서
+    진행 상황을 조회할 수 있습니다.
+    작업 종류(kind)와 입력(payload)도 저장하므로, 서버가 재시작되면 끝나지 못한 작업을
+    client_factory()로 만든 클라이언트로 다시 실행합니다 (결과는 AI 캐시에 남음).
+    """
+    
+    def __init__(self, path: str = AI_JOBS_PATH, max_workers: int = AI_MAX_WORKERS,
+                 cache: Optional[AICache] = None, metrics: Optional[PerfMetrics] = None,
+                 rate_limiter: Optional[RateLimiter] = None, client_factory: Optional[Callable] = None):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.cache = cache
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS ai_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    input_text TEXT NOT NULL,
+                    partial_text TEXT NOT NULL DEFAULT '',
+                    result_text TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    ttft REAL,
+                    total REAL,
+                    cached INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            # 이전 버전에서 만든 파일에는 작업 종류와 입력 컬럼 추가
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ai_jobs)")}
+            if "kind" not in columns:
+                self._conn.execute("ALTER TABLE ai_jobs ADD COLUMN kind TEXT NOT NULL DEFAULT 'improve'")
+            if "payload" not in columns:
+                self._conn.execute("ALTER TABLE ai_jobs ADD COLUMN payload TEXT")
+            self._conn.execute("DELETE FROM ai_jobs WHERE updated_at < ?", (time.time() - AI_JOB_RETENTION,))
+            interrupted = self._conn.execute(
+                "SELECT id, kind, payload FROM ai_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self._summary_executor = ThreadPoolExecutor(max_workers=AI_SUMMARY_MAX_WORKERS, thread_name_prefix="ai-summary")
+        self._resume(interrupted, client_factory)
+    
+    def _create_job(self, kind: str, input_text: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO ai_jobs (id, status, kind, input_text, payload, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, input_text, json.dumps(payload, ensure_ascii=False, default=str), now, now)
+            )
+        return job_id
+    
+    def _start(self, client, job_id: str, kind: str, payload: dict):
+        if kind == "summary":
+            self._executor.submit(self._run_summary, client, job_id, payload["student_name"], payload["records"])
         else:
+            self._executor.submit(self._run, client, job_id, payload["text"])
+    
+    def _resume(self, jobs: list, client_factory: Optional[Callable]):
+        """이전 프로세스에서 끝나지 못한 작업을 저장된 입력으로 다시 실행
+        (클라이언트를 만들 수 없거나 입력이 저장되지 않은 작업은 실패 처리)"""
+        client = client_factory() if client_factory and jobs else None
+        for job_id, kind, payload in jobs:
+            if client is None or payload is None:
+                self._update(job_id, status="failed", error="서버가 재시작되어 작업이 중단되었습니다.")
+                continue
+            self._update(job_id, status="queued", partial_text="", error=None)
+            self._start(client, job_id, kind, json.loads(payload))
+    
+    def submit(self, client, text: str) -> str:
+        """작업을 등록하고 작업 id 반환"""
+        payload = {"text": text}
+        job_id = self._create_job("improve", text, payload)
+        self._start(client, job_id, "improve", payload)
+        return job_id
+    
+    def submit_summary(self, client, student_name: str, records: list) -> str:
+        """학생 상담 이력 요약 작업을 등록하고 작업 id 반환 (records는 오래된 순)"""
+        payload = {"student_name": student_name, "records": records}
+        job_id = self._create_job("summary", student_name, payload)
+        self._start(client, job_id, "summary", payload)
+        return job_id
+    
+    def get(self, job_id: str) -> Optional[dict]:
+        """작업 상태 조회"""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM ai_jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            columns = [c[0] for c in cursor.description]
+        return dict(zip(columns, row)) if row else None
+    
+    def cancel(self, job_id: str):
+        """대기 중이거나 실행 중인 작업 취소"""
+        self._update(job_id, status="cancelled", only_active=True)
+    
+    def _update(self, job_id: str, only_active: bool = False, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        sql = f"UPDATE ai_jobs SET {assignments} WHERE id = ?"
+        if only_active:
+            sql += " AND status IN ('queued', 'running')"
+        with self._lock, self._conn:
+            self._conn.execute(sql, (*fields.values(), job_id))
+    
+    def _is_cancelled(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is None or job["status"] == "cancelled"
+    
+    def _run(self, client, job_id: str, text: str):
+        """작업 실행 (워커 스레드) - 일시적 오류는 지수 백오프로 재시도"""
+        for attempt in range(1, AI_JOB_MAX_ATTEMPTS + 1):
+            if self._is_cancelled(job_id):
+                return
+            self._update(job_id, status="running", attempts=attempt, partial_text="", error=None)
+            
+            stats = {}
+            parts = []
+            last_flush = time.monotonic()
+            tokens = stream_improved_text(client, text, stats, cache=self.cache, metrics=self.metrics, limiter=self.rate_limiter)
+            try:
+                for token in tokens:
+                    parts.append(token)
+                    if time.monotonic() - last_flush >= AI_JOB_POLL_INTERVAL / 2:
+                        last_flush = time.monotonic()
+                        if self._is_cancelled(job_id):
+                            return
+                        self._update(job_id, partial_text="".join(parts))
+                
+                self._update(
+                    job_id,
+                    only_active=True,
+                    status="done",
+                    partial_text="".join(parts),
+                    result_text="".join(parts).strip(),
+                    ttft=stats.get("ttft"),
+                    total=stats.get("total"),
+                    cached=int(bool(stats.get("cached")))
+                )
+                return
+            except RETRYABLE_AI_ERRORS as e:
+                if attempt == AI_JOB_MAX_ATTEMPTS:
+                    self._update(job_id, only_active=True, status="failed", error=str(e))
+                    return
+                delay = ai_retry_delay(e, attempt)
+                self._update(
+                    job_id,
+                    only_active=True,
+                    status="queued",
+                    error=f"일시적 오류로 {delay:.0f}초 후 다시 시도합니다 ({attempt}/{AI_JOB_MAX_ATTEMPTS}): {e}"
+                )
+                time.sleep(delay)
+            except Exception as e:
+                self._update(job_id, only_active=True, status="failed", error=str(e))
+                return
+            finally:
+                tokens.close()
+
+    def _run_summary(self, client, job_id: str, student_name: str, records: list):
+        """학생 상담 이력 요약 실행 (워커 스레드) - 진행 상황은 partial_text에 기록"""
+        started = time.perf_counter()
+        self._update(job_id, only_active=True, status="running", attempts=1)
+        try:
+            result = summarize_student_records(
+                client, student_name, records,
+                cache=self.cache or get_ai_cache(),
+                limiter=self.rate_limiter,
+                executor=self._summary_executor,
+                metrics=self.metrics or get_perf_metrics(),
+                on_progress=lambda message: self._update(job_id, only_active=True, partial_text=message),
+                is_cancelled=lambda: self._is_cancelled(job_id)
+            )
+        except Exception as e:
+            self._update(job_id, only_active=True, status="failed", error=str(e))
+            return
+        if result is None:
+            return
+        self._update(
+            job_id,
+            only_active=True,
+            status="done",
+            partial_text=f"기록 {result['records']}건 · 새로 요청 {result['requests']}회",
+            result_text=result["summary"],
+            total=time.perf_counter() - started,
+            cached=int(result["requests"] == 0)
+        )
+
+@st.cache_resource
+def get_ai_job_queue() -> AIJobQueue:
+    """프로세스 전체에서 공유되는 AI 개선 작업 큐 (재시작 전에 끝나지 못한 작업은 현재 설정의 클라이언트로 다시 실행)"""
+    return AIJobQueue(cache=get_ai_cache(), metrics=get_perf_metrics(), client_factory=init_openai)
+
+def _create_supabase_client(url: str, key: str):
+    return create_client(url, key) if url and key else None
+
+def init_supabase():
+    """Supabase 클라이언트 (SUPABASE_URL/SUPABASE_KEY가 바뀌었을 때만 새로 만듦)"""
+    client = get_app_config().client("supabase", _create_supabase_client)
+    if client is None:
+        st.error("⚠️ Supabase 설정이 필요합니다. 환경 변수 또는 Streamlit secrets에 SUPABASE_URL과 SUPABASE_KEY를 설정해주세요.")
+        st.stop()
+    return client
+
+# 조회 결과 캐시 설정
+QUERY_CACHE_TTL = 60  # 초
+QUERY_CACHE_MAX_ENTRIES = 256
+
+class QueryCache:
+    """조회 결과 캐시 (TTL + LRU 제거, 쓰기 시 명시적 무효화)
+
+    모든 세션이 공유하며, 무효화 이전에 시작된 조회 결과는 저장하지 않아
+    쓰기 직후 오래된 데이터가 다시 캐시되지 않도록 합니다.
+    """
+    
+    def __init__(self, ttl: float = QUERY_CACHE_TTL, max_entries: int = QUERY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+    
+    def get_or_fetch(self, key: tuple, fetch: Callable):
+        """캐시에 유효한 결과가 있으면 반환하고, 없으면 fetch()로 조회 후 저장"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        
+        value = fetch()
+        
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+    
+    def invalidate(self):
+        """캐시 전체 무효화 (insert/update/delete 후 호출)"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+    
+    def patch(self, update: Callable):
+        """저장된 결과를 update(key, value)가 반환한 값으로 교체 (None을 반환하면 제거)
+        
+        다시 조회하지 않고 쓰기 결과를 캐시에 반영할 때 사용하며, 무효화와 마찬가지로
+        patch 이전에 시작된 조회 결과는 저장하지 않습니다.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                cached_at, value = self._entries[key]
+                new_value = update(key, value)
+                if new_value is None:
+                    del self._entries[key]
+                else:
+                    self._entries[key] = (cached_at, new_value)
+            self._generation += 1
+
+@st.cache_resource
+def get_query_cache() -> QueryCache:
+    """세션 간 공유되는 조회 결과 캐시"""
+    return QueryCache()
+
+def invalidate_query_cache():
+    """상담기록 쓰기 후 조회 캐시 무효화"""
+    get_query_cache().invalidate()
+
+# 동시 조회 설정 (1이면 순서대로 조회)
+QUERY_CONCURRENCY = int(os.getenv("QUERY_CONCURRENCY", "8"))
+
+@st.cache_resource
+def get_query_executor() -> ThreadPoolExecutor:
+    """세션 간 공유되는 조회용 스레드 풀"""
+    return ThreadPoolExecutor(max_workers=max(QUERY_CONCURRENCY, 1), thread_name_prefix="query")
+
+def fetch_concurrently(calls: list) -> list:
+    """서로 독립적인 조회 함수들을 동시에 실행하고 결과를 같은 순서로 반환
+
+    Supabase 클라이언트는 하나의 HTTP 연결 풀(httpx)을 공유하므로 스레드마다 연결을 새로 맺지
+    않으며, 전체 소요 시간은 각 조회 시간의 합이 아니라 가장 느린 조회 시간에 가까워집니다.
+    조회 중 하나가 실패하면 그 예외를 그대로 발생시킵니다.
+    """
+    if len(calls) <= 1 or QUERY_CONCURRENCY <= 1:
+        return [call() for call in calls]
+    metrics = get_perf_metrics()
+    events = metrics.current_events()
+    
+    def run(call):
+        with metrics.collect_into(events):
+            return call()
+    
+    futures = [get_query_executor().submit(run, call) for call in calls]
+    return [future.result() for future in futures]
+
+# 이 컬럼이 바뀌면 목록 포함 여부와 순서, 학생 연결이 달라지므로 수정 후 캐시 전체를 무효화
+RECORD_LIST_KEY_FIELDS = {"student_name", "grade", "class_num", "consult_date"}
+# 상담기록 행 목록을 저장하는 캐시 항목
+RECORD_LIST_CACHE_KINDS = ("records_page", "record_options", "search", "student_timeline")
+
+# 수정 화면에서 보여줄 항목 이름
+RECORD_FIELD_LABELS = {
+    "student_name": "학생 이름",
+    "grade": "학년",
+    "class_num": "반",
+    "consult_date": "상담 일자",
+    "consult_content": "상담 내용",
+    "counselor": "상담자",
+    "notes": "비고",
+}
+
+def changed_fields(record: dict, data: dict) -> dict:
+    """data 중 record와 값이 다른 항목만 반환 (수정 시 바뀐 컬럼만 전송)"""
+    return {k: v for k, v in data.items() if record.get(k) != v}
+
+def patch_cached_record(record: dict, changed: set):
+    """수정된 기록을 캐시된 조회 결과에 직접 반영 (목록을 다시 불러오지 않음)"""
+    if changed & RECORD_LIST_KEY_FIELDS:
+        invalidate_query_cache()
+        return
+    
+    def update(key, value):
+        kind = key[0]
+        if kind == "record":
+            return dict(record) if key[1] == record["id"] else value
+        if kind == "search" and changed & {"consult_content", "notes"}:
+            return None  # 관련도와 미리보기가 달라지므로 다시 검색
+        if kind == "statistics" and "counselor" in changed:
             return None
-    except Exception as e:
-        # 오류 발생 시 None 반환
+        if kind in RECORD_LIST_CACHE_KINDS:
+            return [
+                {**row, **{k: record[k] for k in row if k in record}} if row.get("id") == record["id"] else row
+                for row in value
+            ]
+        return value
+    
+    get_query_cache().patch(update)
+
+# 조회 목록에 표시할 요약 컬럼 (상담 내용/비고는 기록을 열 때만 불러옴)
+RECORD_SUMMARY_COLUMNS = ["id", "student_name", "grade", "class_num", "consult_date", "counselor", "created_at"]
+PAGE_SIZE_OPTIONS = [10, 20, 50, 100]
+DEFAULT_PAGE_SIZE = 20
+
+# 학년도는 3월 1일에 시작
+SCHOOL_YEAR_START_MONTH = 3
+
+def school_year_of(d: date) -> int:
+    """날짜가 속한 학년도 (1~2월은 전년도 학년도)"""
+    return d.year if d.month >= SCHOOL_YEAR_START_MONTH else d.year - 1
+
+def school_year_start(year: int) -> date:
+    """학년도 시작일 (migrations/006_school_year_partitions.sql의 파티션 경계와 같음)"""
+    return date(year, SCHOOL_YEAR_START_MONTH, 1)
+
+def current_school_year_start() -> str:
+    return school_year_start(school_year_of(date.today())).isoformat()
+
+def build_record_filters(search_name: str, search_grade: str, search_class: str, include_past: bool = False) -> dict:
+    """검색 위젯 값을 조회 필터 dict로 변환 ("전체"는 None)
+
+    include_past가 False이면 올해 학년도 기록만 조회합니다 (date_from = 학년도 시작일).
+    """
+    return {
+        "student_name": search_name.strip() if search_name and search_name.strip() else None,
+        "grade": int(search_grade) if search_grade != "전체" else None,
+        "class_num": int(search_class) if search_class != "전체" else None,
+        "date_from": None if include_past else current_school_year_start(),
+    }
+
+# 저장소 설정
+# STORAGE_BACKEND: supabase (기본, 모든 읽기/쓰기를 Supabase로) | local (SQLite만 사용하는 오프라인 모드)
+#                  | local_first (SQLite에서 바로 읽고, 쓰기는 outbox에 쌓아 백그라운드에서 Supabase로 동기화)
+LOCAL_DB_PATH = os.getenv("LOCAL_DB_PATH", os.path.join(".cache", "counseling.sqlite3"))
+SYNC_PUSH_INTERVAL = 10  # 초
+SYNC_PULL_INTERVAL = 300  # 초
+SYNC_BATCH_SIZE = 100
+SYNC_PAGE_SIZE = 1000
+SYNC_PULL_OVERLAP = 60  # 초 (updated_at은 트랜잭션 시작 시각이라 늦게 커밋된 수정도 받도록 기준점보다 앞에서부터 다시 받음)
+SYNC_WATERMARK_KEY = "pull_watermark"
+
+RECORD_COLUMNS = ["id", "student_name", "grade", "class_num", "consult_date", "consult_content", "counselor", "notes", "created_at"]
+
+def _sqlite_school_year(date_expr: str) -> str:
+    """SQLite용 학년도 식 (migrations/004_students.sql의 school_year 함수와 같은 계산)"""
+    return f"(CAST(substr({date_expr}, 1, 4) AS INTEGER) - (CAST(substr({date_expr}, 6, 2) AS INTEGER) < {SCHOOL_YEAR_START_MONTH}))"
+
+# 기록의 학생을 찾거나 만들어 student_id를 채우는 SQLite 트리거 본문
+# (이름 + 입학 학년도가 같으면 같은 학생, 여러 명이면 같은 반 학생 우선)
+_ENTRY_YEAR_SQL = f"({_sqlite_school_year('NEW.consult_date')} - NEW.grade + 1)"
+_CURRENT_SCHOOL_YEAR_SQL = _sqlite_school_year("date('now', 'localtime')")
+_SQLITE_SET_STUDENT_SQL = f"""
+    INSERT INTO students (name, entry_year, grade, class_num, graduated_year)
+    SELECT NEW.student_name, {_ENTRY_YEAR_SQL},
+           min(max({_CURRENT_SCHOOL_YEAR_SQL} - {_ENTRY_YEAR_SQL} + 1, 1), 6), NEW.class_num,
+           CASE WHEN {_CURRENT_SCHOOL_YEAR_SQL} - {_ENTRY_YEAR_SQL} + 1 > 6 THEN {_ENTRY_YEAR_SQL} + 5 END
+    WHERE NOT EXISTS (SELECT 1 FROM students WHERE name = NEW.student_name AND entry_year = {_ENTRY_YEAR_SQL});
+    UPDATE counseling_records SET student_id = (
+        SELECT id FROM students WHERE name = NEW.student_name AND entry_year = {_ENTRY_YEAR_SQL}
+        ORDER BY class_num = NEW.class_num DESC, id LIMIT 1
+    ) WHERE id = NEW.id;
+"""
+
+STUDENT_COLUMNS = ["id", "name", "entry_year", "grade", "class_num", "graduated_year"]
+
+# 동시 수정 확인용 컬럼 (migrations/005_record_versions.sql) - 로컬 사본 동기화 시 함께 받음
+VERSION_COLUMNS = ["version", "updated_at"]
+
+def shift_timestamp(value: str, seconds: float) -> str:
+    """ISO 8601 시각 문자열을 seconds초만큼 옮김 (소수 초는 버리고 시간대 표기는 그대로 유지)"""
+    moved = datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S") + timedelta(seconds=seconds)
+    return moved.strftime("%Y-%m-%dT%H:%M:%S") + re.sub(r"^\.\d+", "", value[19:])
+
+class SupabaseStore:
+    """Supabase(PostgREST)의 counseling_records 테이블을 사용하는 저장소"""
+    
+    def __init__(self, client, metrics: Optional[PerfMetrics] = None):
+        self.client = client
+        self.metrics = metrics
+    
+    def _table(self):
+        return self.client.table("counseling_records")
+    
+    def _execute(self, query, name: str) -> list:
+        """쿼리 실행 (metrics가 있으면 소요 시간, 행 수, 전송량 기록)"""
+        if self.metrics is None:
+            return query.execute().data or []
+        with self.metrics.span("supabase", name) as span:
+            data = query.execute().data or []
+            span["rows"] = len(data)
+            span["bytes"] = payload_size(data)
+        return data
+    
+    def list_records(self, filters: dict, columns: list, cursor: Optional[tuple] = None, limit: int = DEFAULT_PAGE_SIZE) -> list:
+        """필터에 맞는 기록을 최신순 (consult_date DESC, id DESC)으로 cursor 다음부터 limit개 조회"""
+        query = self._table().select(", ".join(columns))
+        if filters.get("student_name"):
+            query = query.ilike("student_name", f"%{filters['student_name']}%")
+        if filters.get("grade") is not None:
+            query = query.eq("grade", filters["grade"])
+        if filters.get("class_num") is not None:
+            query = query.eq("class_num", filters["class_num"])
+        if filters.get("date_from"):
+            query = query.gte("consult_date", filters["date_from"])
+        if cursor:
+            last_date, last_id = cursor
+            query = query.or_(f"consult_date.lt.{last_date},and(consult_date.eq.{last_date},id.lt.{last_id})")
+        query = query.order("consult_date", desc=True).order("id", desc=True).limit(limit)
+        return self._execute(query, "list_records")
+    
+    def get_record(self, record_id) -> Optional[dict]:
+        rows = self._execute(self._table().select("*").eq("id", record_id).limit(1), "get_record")
+        return rows[0] if rows else None
+    
+    def get_created_at(self, record_ids: list) -> dict:
+        """id별 created_at 조회 (동기화 충돌 확인용)"""
+        rows = self._execute(self._table().select("id, created_at").in_("id", list(record_ids)), "get_created_at")
+        return {r["id"]: r["created_at"] for r in rows}
+    
+    def list_changed_records(self, columns: list, since: Optional[tuple] = None, limit: int = SYNC_PAGE_SIZE) -> list:
+        """since (updated_at, id) 다음에 추가/수정된 기록을 (updated_at, id) 순으로 limit개 조회 (로컬 사본 동기화용)"""
+        query = self._table().select(", ".join(columns))
+        if since:
+            updated_at, last_id = since
+            query = query.or_(f'updated_at.gt."{updated_at}",and(updated_at.eq."{updated_at}",id.gt.{last_id})')
+        query = query.order("updated_at").order("id").limit(limit)
+        return self._execute(query, "list_changed_records")
+    
+    def list_record_ids(self, after_id: int = 0, limit: int = SYNC_PAGE_SIZE) -> list:
+        """after_id보다 큰 기록 id를 오름차순으로 limit개 조회 (삭제 확인용, 다른 컬럼은 받지 않음)"""
+        rows = self._execute(self._table().select("id").gt("id", after_id).order("id").limit(limit), "list_record_ids")
+        return [r["id"] for r in rows]
+    
+    def count_records(self) -> int:
+        """전체 기록 수 (행은 받지 않고 개수만 조회)"""
+        query = self._table().select("id", count="exact", head=True)
+        if self.metrics is None:
+            return query.execute().count or 0
+        with self.metrics.span("supabase", "count_records"):
+            return query.execute().count or 0
+    
+    def search_content(self, search_text: str, filters: dict, limit: int) -> list:
+        """상담 내용/비고 전문 검색 (서버 함수 search_counseling_records, 관련도 순)"""
+        params = {
+            "search_query": search_text,
+            "filter_name": filters.get("student_name"),
+            "filter_grade": filters.get("grade"),
+            "filter_class": filters.get("class_num"),
+            "max_results": limit,
+            "filter_date_from": filters.get("date_from"),
+        }
+        return self._execute(self.client.rpc("search_counseling_records", params), "search_content")
+    
+    def fetch_statistics(self) -> dict:
+        """학년/반별, 상담자별, 월별 상담 건수 (트리거로 갱신되는 요약 테이블의 집계 뷰 세 개를 동시에 조회)"""
+        queries = {
+            "by_class": self.client.table("counseling_stats_by_class").select("*").order("grade").order("class_num"),
+            "by_counselor": self.client.table("counseling_stats_by_counselor").select("*").order("record_count", desc=True),
+            "by_month": self.client.table("counseling_stats_by_month").select("*").order("month"),
+        }
+        results = fetch_concurrently([
+            lambda name=name, query=query: self._execute(query, f"stats_{name}") for name, query in queries.items()
+        ])
+        return dict(zip(queries, results))
+    
+    def find_students(self, name: str, limit: int) -> list:
+        """이름 부분 일치 학생 목록 (재학생 먼저, 최근 입학순)"""
+        query = self.client.table("students").select(", ".join(STUDENT_COLUMNS))
+        if name:
+            query = query.ilike("name", f"%{name}%")
+        query = query.order("graduated_year", nullsfirst=True).order("entry_year", desc=True).order("name").limit(limit)
+        return self._execute(query, "find_students")
+    
+    def list_student_records(self, student_id, columns: list, limit: int) -> list:
+        """한 학생의 기록을 최신순으로 조회 ((student_id, consult_date, id) 인덱스만으로 처리)"""
+        query = (
+            self._table().select(", ".join(columns)).eq("student_id", student_id)
+            .order("consult_date", desc=True).order("id", desc=True).limit(limit)
+        )
+        return self._execute(query, "list_student_records")
+    
+    def rollover_grades(self, target_school_year: int) -> int:
+        """새 학년도 학년 올리기 (서버 함수 rollover_student_grades) - 변경된 학생 수 반환"""
+        query = self.client.rpc("rollover_student_grades", {"target_school_year": target_school_year})
+        if self.metrics is None:
+            return query.execute().data or 0
+        with self.metrics.span("supabase", "rollover_grades"):
+            return query.execute().data or 0
+    
+    def insert_records(self, rows: list) -> list:
+        return self._execute(self._table().insert(rows), "insert_records")
+    
+    def update_record(self, record_id, data: dict, expected_version: Optional[int] = None) -> list:
+        """기록 수정 후 수정된 행 반환 (expected_version이 있으면 그 버전일 때만 수정하고, 아니면 빈 목록)"""
+        query = self._table().update(data).eq("id", record_id)
+        if expected_version is not None:
+            query = query.eq("version", expected_version)
+        return self._execute(query, "update_record")
+    
+    def delete_record(self, record_id) -> list:
+        return self._execute(self._table().delete().eq("id", record_id), "delete_record")
+
+class SQLiteStore:
+    """로컬 SQLite 파일을 사용하는 저장소 (오프라인 모드, 개발/테스트, local_first의 로컬 사본)
+    
+    스키마와 제약조건은 supabase_setup.sql과 같습니다. 동기화되지 않은 쓰기를
+    기록하는 sync_outbox 테이블도 함께 관리합니다.
+    """
+    
+    def __init__(self, path: str = LOCAL_DB_PATH, metrics: Optional[PerfMetrics] = None):
+        self.metrics = metrics
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS counseling_records (
+                    id INTEGER PRIMARY KEY,
+                    student_name TEXT NOT NULL,
+                    grade INTEGER NOT NULL CHECK (grade >= 1 AND grade <= 6),
+                    class_num INTEGER NOT NULL CHECK (class_num >= 1 AND class_num <= 20),
+                    consult_date TEXT NOT NULL,
+                    consult_content TEXT NOT NULL,
+                    counselor TEXT NOT NULL,
+                    notes TEXT,
+                    created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+                    student_id INTEGER REFERENCES students(id),
+                    version INTEGER NOT NULL DEFAULT 1,
+                    updated_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_student_name ON counseling_records(student_name)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_grade_class ON counseling_records(grade, class_num)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_consult_date_id ON counseling_records(consult_date DESC, id DESC)")
+            self._create_students_schema()
+            self._create_version_schema()
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sync_outbox (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    op TEXT NOT NULL,
+                    record_id INTEGER NOT NULL,
+                    payload TEXT,
+                    base_created_at TEXT,
+                    base_version INTEGER,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sync_outbox_status ON sync_outbox(status, seq)")
+            if "base_version" not in {row[1] for row in self._conn.execute("PRAGMA table_info(sync_outbox)")}:
+                self._conn.execute("ALTER TABLE sync_outbox ADD COLUMN base_version INTEGER")
+            # 마지막으로 받은 Supabase 변경 위치 등 동기화 상태
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    
+    def _create_students_schema(self):
+        """학생 테이블과 student_id 자동 연결 트리거 (migrations/004_students.sql과 같은 규칙)"""
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS students (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                entry_year INTEGER NOT NULL,
+                grade INTEGER NOT NULL CHECK (grade >= 1 AND grade <= 6),
+                class_num INTEGER NOT NULL CHECK (class_num >= 1 AND class_num <= 20),
+                graduated_year INTEGER,
+                created_at TEXT DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now'))
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_students_name_entry ON students(name, entry_year)")
+        
+        # 이전 버전에서 만든 로컬 DB에는 student_id 컬럼 추가
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(counseling_records)")}
+        if "student_id" not in columns:
+            self._conn.execute("ALTER TABLE counseling_records ADD COLUMN student_id INTEGER REFERENCES students(id)")
+        
+        # 목록 컬럼까지 포함한 인덱스로 한 학생의 이력을 테이블을 읽지 않고 조회
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_records_student_date ON counseling_records"
+            "(student_id, consult_date DESC, id DESC, student_name, grade, class_num, counselor, created_at)"
+        )
+        self._conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_counseling_records_student_insert
+            AFTER INSERT ON counseling_records WHEN NEW.student_id IS NULL
+            BEGIN {_SQLITE_SET_STUDENT_SQL} END"""
+        )
+        self._conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS trg_counseling_records_student_update
+            AFTER UPDATE OF student_name, grade, class_num, consult_date ON counseling_records
+            BEGIN {_SQLITE_SET_STUDENT_SQL} END"""
+        )
+        # 학생이 연결되지 않은 기존 기록은 수정 트리거를 실행시켜 연결
+        self._conn.execute("UPDATE counseling_records SET grade = grade WHERE student_id IS NULL")
+    
+    def _create_version_schema(self):
+        """수정할 때마다 version을 올리는 트리거 (migrations/005_record_versions.sql과 같은 규칙)"""
+        # 이전 버전에서 만든 로컬 DB에는 컬럼 추가 (ALTER TABLE은 식으로 된 기본값을 쓸 수 없어 created_at으로 채움)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(counseling_records)")}
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE counseling_records ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        if "updated_at" not in columns:
+            self._conn.execute("ALTER TABLE counseling_records ADD COLUMN updated_at TEXT")
+            self._conn.execute("UPDATE counseling_records SET updated_at = created_at")
+        # 동기화로 받은 행처럼 version을 직접 지정한 수정은 그대로 둠
+        self._conn.execute(
+            """CREATE TRIGGER IF NOT EXISTS trg_counseling_records_version
+            AFTER UPDATE OF student_name, grade, class_num, consult_date, consult_content, counselor, notes ON counseling_records
+            WHEN NEW.version = OLD.version
+            BEGIN
+                UPDATE counseling_records
+                SET version = OLD.version + 1, updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+                WHERE id = NEW.id;
+            END"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_updated_at_id ON counseling_records(updated_at, id)")
+    
+    def _query(self, sql: str, params=(), name: str = "query") -> list:
+        if self.metrics is None:
+            with self._lock:
+                return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+        with self.metrics.span("sqlite", name) as span, self._lock:
+            rows = [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+            span["rows"] = len(rows)
+        return rows
+    
+    def list_records(self, filters: dict, columns: list, cursor: Optional[tuple] = None, limit: int = DEFAULT_PAGE_SIZE) -> list:
+        """필터에 맞는 기록을 최신순 (consult_date DESC, id DESC)으로 cursor 다음부터 limit개 조회"""
+        conditions, params = [], []
+        if filters.get("student_name"):
+            conditions.append("student_name LIKE ?")
+            params.append(f"%{filters['student_name']}%")
+        if filters.get("grade") is not None:
+            conditions.append("grade = ?")
+            params.append(filters["grade"])
+        if filters.get("class_num") is not None:
+            conditions.append("class_num = ?")
+            params.append(filters["class_num"])
+        if filters.get("date_from"):
+            conditions.append("consult_date >= ?")
+            params.append(filters["date_from"])
+        if cursor:
+            conditions.append("(consult_date < ? OR (consult_date = ? AND id < ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self._query(
+            f"SELECT {', '.join(columns)} FROM counseling_records {where} ORDER BY consult_date DESC, id DESC LIMIT ?",
+            (*params, limit),
+            "list_records"
+        )
+    
+    def get_record(self, record_id) -> Optional[dict]:
+        rows = self._query("SELECT * FROM counseling_records WHERE id = ?", (record_id,), "get_record")
+        return rows[0] if rows else None
+    
+    def list_changed_records(self, columns: list, since: Optional[tuple] = None, limit: int = SYNC_PAGE_SIZE) -> list:
+        """since (updated_at, id) 다음에 추가/수정된 기록을 (updated_at, id) 순으로 limit개 조회"""
+        condition, params = "", []
+        if since:
+            condition = "WHERE updated_at > ? OR (updated_at = ? AND id > ?)"
+            params = [since[0], since[0], since[1]]
+        return self._query(
+            f"SELECT {', '.join(columns)} FROM counseling_records {condition} ORDER BY updated_at, id LIMIT ?",
+            (*params, limit),
+            "list_changed_records"
+        )
+    
+    def list_record_ids(self, after_id: int = 0, limit: int = SYNC_PAGE_SIZE) -> list:
+        """after_id보다 큰 기록 id를 오름차순으로 limit개 조회"""
+        rows = self._query("SELECT id FROM counseling_records WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit), "list_record_ids")
+        return [r["id"] for r in rows]
+    
+    def count_records(self) -> int:
+        """Supabase에 저장된 기록 수 (local_first에서 아직 보내지 않은 임시 id 기록은 제외)"""
+        return self._query("SELECT COUNT(*) AS count FROM counseling_records WHERE id > 0", name="count_records")[0]["count"]
+    
+    def search_content(self, search_text: str, filters: dict, limit: int) -> list:
+        """상담 내용/비고 검색 (모든 검색어를 포함하는 기록을 등장 횟수 순으로 정렬)
+
+        관련도와 미리보기를 SQL에서 계산하여 search_counseling_records와 같은 컬럼만 limit개 읽습니다.
+        """
+        words = search_text.lower().split()
+        if not words:
+            return []
+        conditions = ["instr(ldoc, ?) > 0" for _ in words]
+        params = list(words)
+        for key, field, op in [("student_name", "student_name", "LIKE"), ("grade", "grade", "="),
+                               ("class_num", "class_num", "="), ("date_from", "consult_date", ">=")]:
+            value = filters.get(key)
+            if value is None:
+                continue
+            conditions.append(f"{field} {op} ?")
+            params.append(f"%{value}%" if op == "LIKE" else value)
+        # 검색어별 등장 횟수 = (원래 길이 - 검색어를 지운 길이) / 검색어 길이
+        rank = " + ".join("(length(ldoc) - length(replace(ldoc, ?, ''))) / length(?)" for _ in words)
+        rank_params = [p for w in words for p in (w, w)]
+        return self._query(
+            f"""SELECT id, student_name, grade, class_num, consult_date, counselor, created_at,
+                   CAST({rank} AS REAL) AS rank,
+                   substr(doc, max(instr(ldoc, ?) - 40, 1), 160) AS snippet
+            FROM (
+                SELECT id, student_name, grade, class_num, consult_date, counselor, created_at,
+                       consult_content || ' ' || coalesce(notes, '') AS doc,
+                       lower(consult_content || ' ' || coalesce(notes, '')) AS ldoc
+                FROM counseling_records
+            )
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rank DESC, consult_date DESC, id DESC
+            LIMIT ?""",
+            (*rank_params, words[0], *params, limit),
+            "search_content"
+        )
+    
+    def fetch_statistics(self) -> dict:
+        """학년/반별, 상담자별, 월별 상담 건수 (로컬 사본은 GROUP BY로 바로 집계)"""
+        return {
+            "by_class": self._query(
+                "SELECT grade, class_num, COUNT(*) AS record_count FROM counseling_records "
+                "GROUP BY grade, class_num ORDER BY grade, class_num",
+                name="stats_by_class"
+            ),
+            "by_counselor": self._query(
+                "SELECT counselor, COUNT(*) AS record_count FROM counseling_records "
+                "GROUP BY counselor ORDER BY record_count DESC",
+                name="stats_by_counselor"
+            ),
+            "by_month": self._query(
+                "SELECT substr(consult_date, 1, 7) || '-01' AS month, COUNT(*) AS record_count FROM counseling_records "
+                "GROUP BY month ORDER BY month",
+                name="stats_by_month"
+            ),
+        }
+    
+    def find_students(self, name: str, limit: int) -> list:
+        """이름 부분 일치 학생 목록 (재학생 먼저, 최근 입학순)"""
+        return self._query(
+            f"SELECT {', '.join(STUDENT_COLUMNS)} FROM students WHERE name LIKE ? "
+            "ORDER BY graduated_year IS NOT NULL, graduated_year, entry_year DESC, name LIMIT ?",
+            (f"%{name}%", limit),
+            "find_students"
+        )
+    
+    def list_student_records(self, student_id, columns: list, limit: int) -> list:
+        """한 학생의 기록을 최신순으로 조회 (idx_records_student_date 인덱스만으로 처리)"""
+        return self._query(
+            f"SELECT {', '.join(columns)} FROM counseling_records WHERE student_id = ? "
+            "ORDER BY consult_date DESC, id DESC LIMIT ?",
+            (student_id, limit),
+            "list_student_records"
+        )
+    
+    def rollover_grades(self, target_school_year: int) -> int:
+        """입학 학년도로 학년을 다시 계산하고 6학년을 마친 학생은 졸업 처리 - 변경된 학생 수 반환"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                """UPDATE students
+                SET grade = min(max(:year - entry_year + 1, 1), 6),
+                    graduated_year = CASE WHEN :year - entry_year + 1 > 6 THEN entry_year + 5 END
+                WHERE graduated_year IS NULL
+                  AND (grade <> min(max(:year - entry_year + 1, 1), 6) OR :year - entry_year + 1 > 6)""",
+                {"year": target_school_year}
+            )
+        return cursor.rowcount
+    
+    def _insert_row(self, row: dict, record_id: Optional[int] = None) -> dict:
+        """기록 한 건 저장 후 저장된 행 반환 (호출하는 쪽에서 잠금과 트랜잭션 관리)"""
+        data = {k: v for k, v in row.items() if k in RECORD_COLUMNS and k != "id"}
+        if record_id is not None:
+            data["id"] = record_id
+        names = ", ".join(data)
+        placeholders = ", ".join("?" for _ in data)
+        cursor = self._conn.execute(f"INSERT INTO counseling_records ({names}) VALUES ({placeholders})", tuple(data.values()))
+        return dict(self._conn.execute("SELECT * FROM counseling_records WHERE id = ?", (cursor.lastrowid,)).fetchone())
+    
+    def insert_records(self, rows: list) -> list:
+        """기록 저장 후 저장된 행 반환"""
+        with self._lock, self._conn:
+            return [self._insert_row(row) for row in rows]
+    
+    def load_rows(self, rows) -> int:
+        """여러 행을 한 트랜잭션으로 저장 (저장된 행을 다시 읽지 않음) - 저장한 행 수 반환"""
+        columns = [c for c in RECORD_COLUMNS if c != "id"]
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                f"INSERT INTO counseling_records ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                (tuple(row.get(c) for c in columns) for row in rows)
+            )
+        return cursor.rowcount
+    
+    def update_record(self, record_id, data: dict, expected_version: Optional[int] = None) -> list:
+        """기록 수정 후 수정된 행 반환 (expected_version이 있으면 그 버전일 때만 수정하고, 아니면 빈 목록)"""
+        data = {k: v for k, v in data.items() if k in RECORD_COLUMNS and k != "id"}
+        assignments = ", ".join(f"{name} = ?" for name in data)
+        condition, params = "id = ?", [record_id]
+        if expected_version is not None:
+            condition += " AND version = ?"
+            params.append(expected_version)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f"UPDATE counseling_records SET {assignments} WHERE {condition}", (*data.values(), *params))
+            if cursor.rowcount == 0:
+                return []
+            return [dict(row) for row in self._conn.execute("SELECT * FROM counseling_records WHERE id = ?", (record_id,))]
+    
+    def delete_record(self, record_id) -> list:
+        with self._lock, self._conn:
+            rows = [dict(row) for row in self._conn.execute("SELECT * FROM counseling_records WHERE id = ?", (record_id,))]
+            self._conn.execute("DELETE FROM counseling_records WHERE id = ?", (record_id,))
+        return rows
+    
+    # --- local_first 동기화용 ---
+    
+    def enqueue(self, op: str, record_id: int, payload: Optional[dict] = None, base_created_at: Optional[str] = None,
+                base_version: Optional[int] = None):
+        """동기화할 쓰기 작업을 outbox에 기록"""
+        with self._lock, self._conn:
+            self._enqueue(op, record_id, payload, base_created_at, base_version)
+    
+    def _enqueue(self, op: str, record_id: int, payload: Optional[dict] = None, base_created_at: Optional[str] = None,
+                 base_version: Optional[int] = None):
+        self._conn.execute(
+            "INSERT INTO sync_outbox (op, record_id, payload, base_created_at, base_version, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (op, record_id, json.dumps(payload, ensure_ascii=False) if payload is not None else None, base_created_at,
+             base_version, time.time())
+        )
+    
+    def pending_ops(self, limit: int) -> list:
+        rows = self._query("SELECT * FROM sync_outbox WHERE status = 'pending' ORDER BY seq LIMIT ?", (limit,))
+        for row in rows:
+            row["payload"] = json.loads(row["payload"]) if row["payload"] else None
+        return rows
+    
+    def finish_op(self, seq: int, status: str = "done", error: Optional[str] = None):
+        """처리한 작업은 삭제하고, 충돌/오류는 상태와 메시지를 남김"""
+        with self._lock, self._conn:
+            if status == "done":
+                self._conn.execute("DELETE FROM sync_outbox WHERE seq = ?", (seq,))
+            else:
+                self._conn.execute("UPDATE sync_outbox SET status = ?, error = ? WHERE seq = ?", (status, error, seq))
+    
+    def outbox_counts(self) -> dict:
+        return {row["status"]: row["count"] for row in self._query("SELECT status, COUNT(*) AS count FROM sync_outbox GROUP BY status")}
+    
+    def insert_local_records(self, rows: list) -> list:
+        """Supabase에 아직 없는 기록으로 저장하고 outbox에 insert 작업을 기록한 뒤 저장된 행 반환
+
+        임시 id(음수) 발급, 저장, outbox 기록을 BEGIN IMMEDIATE로 시작한 한 트랜잭션에서 처리하므로
+        같은 파일을 쓰는 다른 스레드나 프로세스가 같은 임시 id를 받지 않습니다.
+        """
+        inserted = []
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for row in rows:
+                record_id = min(self._conn.execute("SELECT MIN(id) FROM counseling_records").fetchone()[0] or 0, 0) - 1
+                saved = self._insert_row(row, record_id)
+                # student_id는 저장소마다 따로 연결하므로 보내지 않음
+                self._enqueue("insert", record_id, {k: v for k, v in saved.items() if k in RECORD_COLUMNS and k != "id"})
+                inserted.append(saved)
+        return inserted
+    
+    def replace_local_id(self, local_id: int, remote_row: dict):
+        """동기화된 로컬 기록을 Supabase가 발급한 id의 행으로 교체하고 대기 중인 작업의 id도 변경"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM counseling_records WHERE id = ?", (local_id,))
+            self._upsert(remote_row)
+            self._conn.execute(
+                "UPDATE sync_outbox SET record_id = ?, base_created_at = ?, base_version = ? WHERE record_id = ?",
+                (remote_row["id"], remote_row.get("created_at"), remote_row.get("version"), local_id)
+            )
+    
+    def _upsert(self, row: dict) -> int:
+        data = {k: row.get(k) for k in RECORD_COLUMNS}
+        data.update({k: row[k] for k in VERSION_COLUMNS if row.get(k) is not None})
+        names = ", ".join(data)
+        placeholders = ", ".join("?" for _ in data)
+        updates = ", ".join(f"{k} = excluded.{k}" for k in data if k != "id")
+        changed = " OR ".join(f"{k} IS NOT excluded.{k}" for k in data if k != "id")
+        cursor = self._conn.execute(
+            f"INSERT INTO counseling_records ({names}) VALUES ({placeholders}) "
+            f"ON CONFLICT(id) DO UPDATE SET {updates} WHERE {changed}",
+            tuple(data.values())
+        )
+        if cursor.rowcount and "version" in data:
+            # 받은 version이 로컬 사본과 같으면 트리거가 하나 더 올리므로 받은 값으로 되돌림
+            self._conn.execute(
+                "UPDATE counseling_records SET version = ?, updated_at = COALESCE(?, updated_at) WHERE id = ?",
+                (data["version"], data.get("updated_at"), data["id"])
+            )
+        return cursor.rowcount
+    
+    def apply_remote_rows(self, rows: list) -> tuple:
+        """Supabase에서 받은 행 반영 (동기화 대기 중인 기록은 로컬 변경을 유지)
+        - (변경된 행 수, 대기 중이라 건너뛴 id 집합) 반환"""
+        changed = 0
+        with self._lock, self._conn:
+            pending = {r[0] for r in self._conn.execute("SELECT record_id FROM sync_outbox WHERE status = 'pending'")}
+            for row in rows:
+                if row["id"] not in pending:
+                    changed += self._upsert(row)
+        return changed, pending & {row["id"] for row in rows}
+    
+    def get_sync_state(self, name: str) -> Optional[str]:
+        rows = self._query("SELECT value FROM sync_state WHERE name = ?", (name,), "get_sync_state")
+        return rows[0]["value"] if rows else None
+    
+    def set_sync_state(self, name: str, value: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)", (name, value))
+    
+    def remove_missing(self, remote_ids: set) -> int:
+        """Supabase에서 삭제된 기록을 로컬에서도 삭제 (동기화 대기 중인 기록과 로컬 전용 기록 제외)"""
+        with self._lock, self._conn:
+            pending = {r[0] for r in self._conn.execute("SELECT record_id FROM sync_outbox WHERE status = 'pending'")}
+            local_ids = {r[0] for r in self._conn.execute("SELECT id FROM counseling_records WHERE id > 0")}
+            missing = [(record_id,) for record_id in local_ids - remote_ids - pending]
+            self._conn.executemany("DELETE FROM counseling_records WHERE id = ?", missing)
+        return len(missing)
+
+class LocalFirstStore:
+    """로컬 SQLite에서 바로 읽고, 쓰기는 outbox를 거쳐 백그라운드에서 Supabase에 일괄 반영하는 저장소
+    
+    - 로컬에서 새로 만든 기록은 음수 임시 id를 받고, 동기화 후 Supabase id로 바뀝니다.
+    - 수정/삭제는 기록 당시의 created_at과 Supabase의 created_at을 비교하여, 다른 곳에서
+      삭제되었거나 다른 기록으로 바뀐 경우 충돌(conflict)로 남기고 반영하지 않습니다.
+    - 주기적으로 Supabase에서 지난 동기화 이후 추가/수정된 기록만 받아 로컬 사본을 갱신합니다.
+    """
+    
+    def __init__(self, local: SQLiteStore, remote: SupabaseStore, on_remote_change: Optional[Callable] = None):
+        self.local = local
+        self.remote = remote
+        self.on_remote_change = on_remote_change
+        self.last_sync = None
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._sync_lock = threading.Lock()
+        self._thread = None
+    
+    # 읽기는 모두 로컬 사본에서 처리
+    def list_records(self, filters: dict, columns: list, cursor: Optional[tuple] = None, limit: int = DEFAULT_PAGE_SIZE) -> list:
+        return self.local.list_records(filters, columns, cursor, limit)
+    
+    def get_record(self, record_id) -> Optional[dict]:
+        return self.local.get_record(record_id)
+    
+    def search_content(self, search_text: str, filters: dict, limit: int) -> list:
+        return self.local.search_content(search_text, filters, limit)
+    
+    def fetch_statistics(self) -> dict:
+        return self.local.fetch_statistics()
+    
+    def find_students(self, name: str, limit: int) -> list:
+        return self.local.find_students(name, limit)
+    
+    def list_student_records(self, student_id, columns: list, limit: int) -> list:
+        return self.local.list_student_records(student_id, columns, limit)
+    
+    # 쓰기는 로컬에 반영 후 outbox에 기록
+    def insert_records(self, rows: list) -> list:
+        inserted = self.local.insert_local_records(rows)
+        self._wakeup.set()
+        return inserted
+    
+    def update_record(self, record_id, data: dict, expected_version: Optional[int] = None) -> list:
+        current = self.local.get_record(record_id)
+        if current is None:
+            return []
+        updated = self.local.update_record(record_id, data, expected_version)
+        if not updated:
+            return []
+        self.local.enqueue("update", record_id, data, current.get("created_at"), current.get("version"))
+        self._wakeup.set()
+        return updated
+    
+    def delete_record(self, record_id) -> list:
+        current = self.local.get_record(record_id)
+        if current is None:
+            return []
+        deleted = self.local.delete_record(record_id)
+        self.local.enqueue("delete", record_id, None, current.get("created_at"))
+        self._wakeup.set()
+        return deleted
+    
+    def rollover_grades(self, target_school_year: int) -> int:
+        """학생 테이블은 저장소마다 따로 관리하므로 Supabase와 로컬 사본에 각각 적용"""
+        changed = self.remote.rollover_grades(target_school_year)
+        self.local.rollover_grades(target_school_year)
+        return changed
+    
+    # --- 동기화 ---
+    
+    def sync_status(self) -> dict:
+        counts = self.local.outbox_counts()
+        return {
+            "pending": counts.get("pending", 0),
+            "conflicts": counts.get("conflict", 0),
+            "last_sync": self.last_sync,
+            "last_error": self.last_error,
+        }
+    
+    def push(self) -> int:
+        """outbox의 쓰기를 순서대로 Supabase에 반영 (같은 종류의 연속된 작업은 한 번에 처리)"""
+        pushed = 0
+        while True:
+            ops = self.local.pending_ops(SYNC_BATCH_SIZE)
+            if not ops:
+                return pushed
+            run = []
+            for op in ops:
+                if op["op"] != ops[0]["op"]:
+                    break
+                run.append(op)
+            if ops[0]["op"] == "insert":
+                self._push_inserts(run)
+            else:
+                self._push_changes(run)
+            pushed += len(run)
+    
+    def _push_inserts(self, ops: list):
+        remote_rows = self.remote.insert_records([op["payload"] for op in ops])
+        for op, remote_row in zip(ops, remote_rows):
+            self.local.replace_local_id(op["record_id"], remote_row)
+            self.local.finish_op(op["seq"])
+    
+    def _push_changes(self, ops: list):
+        remote_created_at = self.remote.get_created_at({op["record_id"] for op in ops})
+        for op in ops:
+            record_id = op["record_id"]
+            if record_id not in remote_created_at:
+                if op["op"] == "delete":
+                    self.local.finish_op(op["seq"])  # 이미 삭제됨
+                else:
+                    self.local.finish_op(op["seq"], "conflict", "다른 곳에서 삭제된 기록입니다.")
+                continue
+            if remote_created_at[record_id] != op["base_created_at"]:
+                self.local.finish_op(op["seq"], "conflict", "Supabase의 기록이 로컬 사본과 다릅니다.")
+                continue
+            if op["op"] == "update":
+                if not self.remote.update_record(record_id, op["payload"], op["base_version"]):
+                    self.local.finish_op(op["seq"], "conflict", "다른 곳에서 먼저 수정된 기록입니다.")
+                    continue
+            else:
+                self.remote.delete_record(record_id)
+            self.local.finish_op(op["seq"])
+    
+    def pull(self) -> int:
+        """Supabase에서 지난 pull 이후 추가/수정된 기록만 받아 로컬 사본 갱신 - 변경된 행 수 반환
+
+        마지막으로 반영한 (updated_at, id)를 기준점으로 저장해 두고 그 다음 행만 페이지 단위로 받습니다
+        (처음에는 전체). 삭제된 기록은 받은 행으로 알 수 없으므로, 양쪽의 기록 수가 다를 때만
+        Supabase의 id 목록을 받아 비교합니다.
+        """
+        changed = 0
+        watermark = self.local.get_sync_state(SYNC_WATERMARK_KEY)
+        since = None
+        if watermark:
+            since = (shift_timestamp(json.loads(watermark)[0], -SYNC_PULL_OVERLAP), 0)
+        held = False
+        while True:
+            rows = self.remote.list_changed_records(RECORD_COLUMNS + VERSION_COLUMNS, since, SYNC_PAGE_SIZE)
+            if not rows:
+                break
+            applied, skipped = self.local.apply_remote_rows(rows)
+            changed += applied
+            for row in rows:
+                # 동기화 대기 중이라 건너뛴 행부터는 다음 pull에서 다시 받도록 기준점을 옮기지 않음
+                held = held or row["id"] in skipped
+                if not held:
+                    watermark = json.dumps([row["updated_at"], row["id"]])
+            if len(rows) < SYNC_PAGE_SIZE:
+                break
+            since = (rows[-1]["updated_at"], rows[-1]["id"])
+        if watermark:
+            self.local.set_sync_state(SYNC_WATERMARK_KEY, watermark)
+        if self.remote.count_records() != self.local.count_records():
+            changed += self.local.remove_missing(self._remote_ids())
+        return changed
+    
+    def _remote_ids(self) -> set:
+        """Supabase의 모든 기록 id (id만 페이지 단위로 받음)"""
+        ids = set()
+        after_id = 0
+        while True:
+            page = self.remote.list_record_ids(after_id, SYNC_PAGE_SIZE)
+            ids.update(page)
+            if len(page) < SYNC_PAGE_SIZE:
+                return ids
+            after_id = page[-1]
+    
+    def sync_once(self, pull: bool = True):
+        """한 번 동기화 (push 후 pull) - 네트워크 오류는 기록만 하고 다음 주기에 다시 시도"""
+        with self._sync_lock:
+            try:
+                pushed = self.push()
+                changed = self.pull() if pull else 0
+                self.last_sync = datetime.now()
+                self.last_error = None
+                if (pushed or changed) and self.on_remote_change:
+                    self.on_remote_change()
+            except Exception as e:
+                self.last_error = str(e)
+    
+    def start_sync(self):
+        """백그라운드 동기화 스레드 시작"""
+        if self._thread is not None:
+            return
+        
+        def loop():
+            last_pull = 0.0
+            while True:
+                due_pull = time.monotonic() - last_pull >= SYNC_PULL_INTERVAL
+                self.sync_once(pull=due_pull)
+                if due_pull and self.last_error is None:
+                    last_pull = time.monotonic()
+                self._wakeup.wait(SYNC_PUSH_INTERVAL)
+                self._wakeup.clear()
+        
+        self._thread = threading.Thread(target=loop, name="supabase-sync", daemon=True)
+        self._thread.start()
+
+def init_store():
+    """STORAGE_BACKEND 설정에 따른 저장소 (Supabase 설정이 바뀌면 저장소는 그대로 두고 클라이언트만 교체)"""
+    store = _create_store(get_setting("STORAGE_BACKEND").strip().lower())
+    remote = store.remote if isinstance(store, LocalFirstStore) else store
+    if isinstance(remote, SupabaseStore):
+        remote.client = init_supabase()
+    return store
+
+@st.cache_resource
+def _create_store(backend: str):
+    """저장소 초기화 (저장 방식별로 한 번만 만들고, 로컬 우선 모드는 동기화 스레드 시작)"""
+    metrics = get_perf_metrics()
+    if backend == "local":
+        return SQLiteStore(LOCAL_DB_PATH, metrics=metrics)
+    
+    remote = SupabaseStore(init_supabase(), metrics=metrics)
+    if backend == "local_first":
+        query_cache, similarity_index = get_query_cache(), get_similarity_index()
+        
+        def on_remote_change():
+            query_cache.invalidate()
+            if similarity_index is not None:
+                similarity_index.last_refresh = 0.0  # 다음 검색 때 바뀐 기록 반영
+        
+        store = LocalFirstStore(SQLiteStore(LOCAL_DB_PATH, metrics=metrics), remote, on_remote_change=on_remote_change)
+        store.start_sync()
+        return store
+    return remote
+
+def fetch_records_page(store, filters: dict, page_size: int = DEFAULT_PAGE_SIZE, cursor: Optional[tuple] = None):
+    """상담기록 목록 한 페이지 조회 (consult_date, id 키셋 커서)
+
+    cursor는 이전 페이지 마지막 행의 (consult_date, id)이며, 다음 페이지가 없으면
+    반환되는 next_cursor는 None입니다.
+    """
+    # 다음 페이지 존재 여부를 알기 위해 한 행을 더 요청
+    key = ("records_page", tuple(sorted(filters.items())), page_size, cursor)
+    rows = get_query_cache().get_or_fetch(
+        key, lambda: store.list_records(filters, RECORD_SUMMARY_COLUMNS, cursor, page_size + 1)
+    )
+    
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = (rows[-1]["consult_date"], rows[-1]["id"])
+    return rows, next_cursor
+
+def fetch_record(store, record_id) -> Optional[dict]:
+    """id로 상담기록 한 건의 전체 내용 조회"""
+    return get_query_cache().get_or_fetch(("record", record_id), lambda: store.get_record(record_id))
+
+def prefetch_records(store, record_ids) -> dict:
+    """여러 상담기록의 전체 내용을 동시에 조회하여 캐시에 채움 - id -> 기록 (없는 기록은 None)"""
+    record_ids = list(dict.fromkeys(record_ids))
+    cache = get_query_cache()  # 조회 스레드에서는 Streamlit 캐시 함수를 부르지 않도록 미리 가져옴
+    records = fetch_concurrently([
+        lambda record_id=record_id: cache.get_or_fetch(("record", record_id), lambda: store.get_record(record_id))
+        for record_id in record_ids
+    ])
+    return dict(zip(record_ids, records))
+
+# 지난 학년도 기록 포함 체크박스 (기본은 올해 학년도 기록만 조회)
+PAST_YEARS_LABEL = "📚 지난 학년도 포함"
+PAST_YEARS_HELP = "기본으로는 올해 학년도(3월 1일부터) 기록만 조회합니다. 지난 학년도 기록도 보려면 선택하세요."
+
+# 수정/삭제 선택 목록에 표시할 컬럼과 최대 개수
+RECORD_PICKER_COLUMNS = ["id", "student_name", "grade", "class_num", "consult_date"]
+RECORD_PICKER_LIMIT = 20
+
+def search_record_options(store, search_text: str, include_past: bool = False, limit: int = RECORD_PICKER_LIMIT) -> list:
+    """선택 목록용 상담기록 검색 (학생 이름 부분 일치, 최신순 상위 limit개, 기본은 올해 학년도만)"""
+    filters = {"student_name": search_text or None, "date_from": None if include_past else current_school_year_start()}
+    return get_query_cache().get_or_fetch(
+        ("record_options", search_text, filters["date_from"], limit),
+        lambda: store.list_records(filters, RECORD_PICKER_COLUMNS, None, limit)
+    )
+
+def format_record_label(record: dict) -> str:
+    """선택 목록 라벨 (같은 학생·같은 날짜의 기록도 구분되도록 id 포함)"""
+    return f"{record.get('student_name', 'N/A')} - {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반 ({record.get('consult_date', 'N/A')}) #{record.get('id')}"
+
+def record_picker(store, label: str, key: str) -> Optional[dict]:
+    """검색어로 상담기록 후보를 조회해 선택하고, 선택한 기록의 전체 내용을 반환"""
+    col_search, col_past = st.columns([3, 1])
+    with col_search:
+        search_text = st.text_input(
+            "학생 이름으로 검색",
+            placeholder="이름을 입력하면 일치하는 기록만 불러옵니다",
+            key=f"{key}_search"
+        ).strip()
+    with col_past:
+        include_past = st.checkbox(PAST_YEARS_LABEL, key=f"{key}_past", help=PAST_YEARS_HELP)
+    
+    options = search_record_options(store, search_text, include_past)
+    if not options:
         return None
+    
+    labels = {r["id"]: format_record_label(r) for r in options}
+    selected_id = st.selectbox(label, list(labels.keys()), format_func=labels.get, key=f"{key}_select")
+    if len(options) >= RECORD_PICKER_LIMIT:
+        st.caption(f"💡 최근 {RECORD_PICKER_LIMIT}개만 표시됩니다. 찾는 기록이 없으면 이름으로 검색하세요.")
+    
+    return fetch_record(store, selected_id)
+
+# 내용 검색 결과 최대 개수
+SEARCH_RESULT_LIMIT = 50
+
+def search_records(store, search_text: str, filters: dict, limit: int = SEARCH_RESULT_LIMIT) -> list:
+    """상담 내용/비고 전문 검색 (관련도 순, 검색어 주변 미리보기 포함)"""
+    key = ("search", search_text, tuple(sorted(filters.items())), limit)
+    return get_query_cache().get_or_fetch(key, lambda: store.search_content(search_text, filters, limit))
+
+def highlight_snippet(snippet: str, search_text: str) -> str:
+    """미리보기에서 검색어를 굵게 표시 (마크다운)"""
+    if not snippet:
+        return ""
+    words = [re.escape(w) for w in search_text.split() if w]
+    if not words:
+        return snippet
+    # 줄바꿈은 공백으로 합치고, 마크다운 강조 기호와 겹치지 않도록 원문의 *는 이스케이프
+    snippet = " ".join(snippet.split()).replace("*", "\\*")
+    return re.sub(f"((?:{'|'.join(words)})+)", r"**\1**", snippet, flags=re.IGNORECASE)
+
+# 학생별 상담 이력 화면
+STUDENT_SEARCH_LIMIT = 20
+STUDENT_TIMELINE_LIMIT = 200
+STUDENT_SUMMARY_MAX_RECORDS = 200
+STUDENT_SUMMARY_COLUMNS = ["id", "consult_date", "grade", "class_num", "counselor", "consult_content", "notes"]
+
+def search_students(store, name: str, limit: int = STUDENT_SEARCH_LIMIT) -> list:
+    """이름으로 학생 검색 (재학생 먼저, 최근 입학순 상위 limit명)"""
+    return get_query_cache().get_or_fetch(("students", name, limit), lambda: store.find_students(name, limit))
+
+def fetch_student_timeline(store, student_id, limit: int = STUDENT_TIMELINE_LIMIT) -> list:
+    """한 학생의 상담기록 목록 (최신순, 상담 내용 제외)"""
+    return get_query_cache().get_or_fetch(
+        ("student_timeline", student_id, limit),
+        lambda: store.list_student_records(student_id, RECORD_SUMMARY_COLUMNS, limit)
+    )
+
+def format_student_label(student: dict) -> str:
+    """학생 선택 목록 라벨 (동명이인 구분을 위해 입학 학년도 포함)"""
+    if student.get('graduated_year'):
+        status = f"{student['graduated_year']}학년도 졸업"
+    else:
+        status = f"{student.get('grade', 'N/A')}학년 {student.get('class_num', 'N/A')}반"
+    return f"{student.get('name', 'N/A')} - {status} ({student.get('entry_year', 'N/A')}학년도 입학) #{student.get('id')}"
+
+def fetch_statistics(store) -> dict:
+    """통계 화면용 집계 결과 조회 (by_class, by_counselor, by_month)"""
+    return get_query_cache().get_or_fetch(("statistics",), store.fetch_statistics)
+
+def render_record_expander(store, record: dict, snippet: Optional[str] = None):
+    """조회 목록의 상담기록 한 건 표시 (상담 내용은 기록을 열었을 때만 불러옴)"""
+    record_id = record.get('id')
+    is_opened = record_id in st.session_state.opened_records
+    with st.expander(
+        f"📌 {record.get('student_name', 'N/A')} - {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반 ({record.get('consult_date', 'N/A')})",
+        expanded=is_opened
+    ):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.write(f"**학생 이름:** {record.get('student_name', 'N/A')}")
+            st.write(f"**학년/반:** {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반")
+            st.write(f"**상담 일자:** {record.get('consult_date', 'N/A')}")
+        with col2:
+            st.write(f"**상담자:** {record.get('counselor', 'N/A')}")
+            st.write(f"**작성일시:** {record.get('created_at', 'N/A')[:19] if record.get('created_at') else 'N/A'}")
+        
+        if snippet:
+            st.markdown(f"> …{snippet}…")
+        
+        st.markdown("---")
+        
+        if not is_opened:
+            if st.button("📄 상담 내용 보기", key=f"open_record_{record_id}"):
+                st.session_state.opened_records.add(record_id)
+                rerun_panel()
+        else:
+            full_record = fetch_record(store, record_id)
+            if full_record:
+                st.write(f"**상담 내용:**")
+                st.write(full_record.get('consult_content', 'N/A'))
+                
+                if full_record.get('notes'):
+                    st.write(f"**비고:**")
+                    st.write(full_record.get('notes'))
+            else:
+                st.warning("⚠️ 상담기록을 찾을 수 없습니다.")
+
+# 비슷한 상담기록 색인 설정
+SIMILAR_INDEX_PATH = os.getenv("SIMILAR_INDEX_PATH", os.path.join(".cache", "similar_index"))
+SIMILAR_NGRAM_SIZES = (2, 3)  # 글자 n-gram 길이
+SIMILAR_HASH_BITS = 18  # n-gram을 2^18개 열로 해시
+SIMILAR_TOP_K = 5
+SIMILAR_MIN_SCORE = 0.15  # 코사인 유사도가 이보다 낮으면 표시하지 않음
+SIMILAR_REFRESH_INTERVAL = 600  # 초 (다른 곳에서 바뀐 기록을 확인하는 주기)
+SIMILAR_REFETCH_LIMIT = 200  # 바뀐 기록이 이보다 많으면 한 건씩 불러오지 않고 전체를 다시 읽음
+SIMILAR_COMPACT_RATIO = 0.25  # 삭제된 행 비율이 이보다 크면 새 세대로 압축
+SIMILAR_DELTA_MAX_ROWS = 1000  # 델타 세그먼트에 쌓인 행이 이보다 많으면 압축
+SIMILAR_DELTA_BASE_RATIO = 0.1  # 델타 행이 기본 세대 행의 이 비율보다 많으면 압축 (IDF 다시 계산)
+SIMILAR_INDEX_DTYPE = np.int32  # indices/indptr 저장 형식 (둘이 같아야 불러올 때 memory-map이 복사되지 않음)
+SIMILAR_INDEX_COLUMNS = ["id", "consult_date", "version"]
+
+def similarity_features(text: str) -> dict:
+    """글자 n-gram 해시 -> 가중치 (1 + log tf)
+
+    열 번호는 CRC32 해시로 정하므로 단어 사전 없이 새 기록을 바로 추가할 수 있고,
+    프로세스가 바뀌어도 같은 열이 나옵니다.
+    """
+    text = " ".join(unicodedata.normalize("NFC", text).lower().split())
+    mask = (1 << SIMILAR_HASH_BITS) - 1
+    counts = {}
+    for n in SIMILAR_NGRAM_SIZES:
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.isspace():
+                continue
+            column = zlib.crc32(gram.encode("utf-8")) & mask
+            counts[column] = counts.get(column, 0) + 1
+    return {column: 1.0 + np.log(count) for column, count in counts.items()}
+
+def similarity_text(record: dict) -> str:
+    return f"{record.get('consult_content') or ''} {record.get('notes') or ''}"
+
+class SimilarityIndex:
+    """상담 내용/비고의 글자 n-gram TF-IDF 색인 (로컬 파일, 네트워크 사용 안 함)
+
+    기록마다 n-gram 빈도(1 + log tf)를 CSR 희소 행렬의 한 행으로 저장합니다.
+    - 기본 세대(gen-N): 압축할 때 한 번 쓰는 행렬과 그 시점의 IDF, 행 노름. 다시 시작할 때
+      memory-map으로 열어 전체를 읽지 않습니다.
+    - 델타 세그먼트(delta-*.npz): 추가/수정/삭제할 때마다 새 행과 삭제된 id만 새 파일로 덧붙이고,
+      열 때 기본 세대 뒤에 차례로 다시 적용합니다. 수정/삭제된 행은 삭제 표시만 합니다.
+    델타가 쌓이거나 삭제된 행이 많아지면 백그라운드 스레드에서 새 세대로 합치며(IDF도 다시 계산),
+    그동안 검색은 기존 세대와 델타로 계속됩니다. meta.json이 현재 세대와 이어 붙일 델타 번호를 가리킵니다.
+    """
+    
+    FILES = ("data", "indices", "indptr", "ids", "versions", "idf", "norms")
+    
+    def __init__(self, path: str = SIMILAR_INDEX_PATH):
+        self.path = path
+        self.last_refresh = 0.0
+        self.last_error = None  # 마지막 백그라운드 갱신 오류
+        self._lock = threading.Lock()
+        self._refreshing = None  # 백그라운드 갱신 스레드
+        self._compacting = None  # 백그라운드 압축 스레드
+        os.makedirs(path, exist_ok=True)
+        self._load()
+    
+    @property
+    def building(self) -> bool:
+        """백그라운드에서 저장소와 비교하는 중인지"""
+        return self._refreshing is not None and self._refreshing.is_alive()
+    
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "meta.json")
+    
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.path, f"delta-{seq:010d}.npz")
+    
+    def _segments(self) -> list:
+        """저장된 델타 세그먼트의 (번호, 경로) 목록 (번호 순)"""
+        segments = []
+        for name in os.listdir(self.path):
+            if name.startswith("delta-") and name.endswith(".npz"):
+                segments.append((int(name[len("delta-"):-len(".npz")]), os.path.join(self.path, name)))
+        return sorted(segments)
+    
+    def _write_meta(self, generation: Optional[int], delta_from: int):
+        meta = {"generation": generation, "delta_from": delta_from,
+                "hash_bits": SIMILAR_HASH_BITS, "ngram_sizes": list(SIMILAR_NGRAM_SIZES)}
+        tmp_path = self._meta_path() + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path())
+    
+    def _set_base(self, generation: Optional[int], delta_from: int, arrays: Optional[dict] = None):
+        """기본 세대를 바꾸고 델타를 비움 (호출하는 쪽에서 잠금)"""
+        width = 1 << SIMILAR_HASH_BITS
+        self._generation = generation
+        self._seq = delta_from - 1
+        if arrays is None:
+            self._base = sp.csr_matrix((0, width), dtype=np.float32)
+            self._base_ids = np.zeros(0, dtype=np.int64)
+            self._base_versions = np.zeros(0, dtype=np.int64)
+            self._base_norms = np.zeros(0, dtype=np.float32)
+            self._idf = np.ones(width, dtype=np.float32)
+        else:
+            self._base = sp.csr_matrix(
+                (arrays["data"], arrays["indices"], arrays["indptr"]), shape=(len(arrays["ids"]), width), copy=False
+            )
+            for name in ("data", "indices", "indptr"):
+                # indices/indptr 형식이 같으면 scipy가 복사하지 않고 같은 메모리를 ndarray로 감쌈 -> memory-map 객체로 되돌림
+                # (형식이 달라 복사되었다면 전체를 메모리에 올린 것이므로 손상된 색인으로 보고 다시 만듦)
+                if not np.shares_memory(getattr(self._base, name), arrays[name]):
+                    raise ValueError(f"색인 {name} 배열이 복사되었습니다")
+                setattr(self._base, name, arrays[name])
+            self._base_ids = arrays["ids"]
+            self._base_versions = arrays["versions"]
+            self._base_norms = arrays["norms"]
+            self._idf = arrays["idf"]
+        self._delta = sp.csr_matrix((0, width), dtype=np.float32)
+        self._delta_ids = np.zeros(0, dtype=np.int64)
+        self._delta_versions = np.zeros(0, dtype=np.int64)
+        self._delta_norms = np.zeros(0, dtype=np.float32)
+        self._alive = np.ones(len(self._base_ids), dtype=bool)
+        self._rows = dict(zip(self._base_ids.tolist(), range(len(self._base_ids))))
+        self._log = []  # 기본 세대 이후 적용한 델타 (압축하는 동안 들어온 변경을 새 세대에 다시 적용)
+    
+    def _load(self):
+        """기본 세대를 memory-map으로 열고 델타 세그먼트를 차례로 적용
+        (설정이 바뀌었거나 파일이 손상되었으면 지우고 빈 색인에서 다시 만듦)"""
+        try:
+            with open(self._meta_path(), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["hash_bits"] != SIMILAR_HASH_BITS or meta["ngram_sizes"] != list(SIMILAR_NGRAM_SIZES):
+                raise ValueError("색인 설정이 바뀌었습니다")
+            arrays = None
+            if meta["generation"] is not None:
+                directory = os.path.join(self.path, f"gen-{meta['generation']}")
+                arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in self.FILES}
+            self._set_base(meta["generation"], meta["delta_from"], arrays)
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path, exist_ok=True)
+            self._set_base(None, 1)
+            self._write_meta(None, 1)
+            return
+        for seq, path in self._segments():
+            if seq <= self._seq:
+                continue
+            try:
+                with np.load(path) as segment:
+                    added = sp.csr_matrix((segment["data"], segment["indices"], segment["indptr"]),
+                                          shape=(len(segment["ids"]), 1 << SIMILAR_HASH_BITS))
+                    self._apply_change(seq, added, segment["ids"], segment["versions"], segment["removed"])
+            except (OSError, ValueError, KeyError):
+                break  # 쓰다 만 세그먼트부터는 다음 갱신 때 저장소와 비교하여 다시 맞춤
+    
+    def _row_norms(self, matrix) -> np.ndarray:
+        return np.sqrt(matrix.power(2) @ np.square(self._idf)).astype(np.float32)
+    
+    def _apply_change(self, seq: int, added, ids: np.ndarray, versions: np.ndarray, removed: np.ndarray):
+        """델타 하나를 메모리의 색인에 적용 (호출하는 쪽에서 잠금)"""
+        for record_id in set(ids.tolist()) | set(removed.tolist()):
+            row = self._rows.pop(record_id, None)
+            if row is not None:
+                self._alive[row] = False
+        if len(ids):
+            first_row = len(self._alive)
+            self._delta = sp.vstack([self._delta, added], format="csr", dtype=np.float32)
+            self._delta_ids = np.concatenate([self._delta_ids, ids])
+            self._delta_versions = np.concatenate([self._delta_versions, versions])
+            self._delta_norms = np.concatenate([self._delta_norms, self._row_norms(added)])
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._rows.update(zip(ids.tolist(), range(first_row, first_row + len(ids))))
+        self._log.append((seq, added, ids, versions, removed))
+        self._seq = seq
+    
+    def _needs_compaction(self) -> bool:
+        delta_rows = self._delta.shape[0]
+        dead_ratio = 1 - len(self._rows) / len(self._alive) if len(self._alive) else 0.0
+        return (delta_rows > min(SIMILAR_DELTA_MAX_ROWS, self._base.shape[0] * SIMILAR_DELTA_BASE_RATIO)
+                or dead_ratio > SIMILAR_COMPACT_RATIO)
+    
+    def _start_compaction(self):
+        with self._lock:
+            if self._compacting is not None and self._compacting.is_alive():
+                return
+            self._compacting = threading.Thread(target=self._compact, name="similar-index-compact", daemon=True)
+            self._compacting.start()
+    
+    def _compact(self):
+        """백그라운드 압축 스레드 (압축하는 동안 들어온 변경이 다시 기준을 넘으면 이어서 압축)"""
+        while self._compact_once():
+            pass
+    
+    def _compact_once(self) -> bool:
+        """기본 세대와 델타를 합쳐 새 세대로 저장하고, 다시 압축해야 하는지 반환 (무거운 작업은 잠금 밖에서)"""
+        with self._lock:
+            seq = self._seq
+            generation = (self._generation or 0) + 1
+            matrix = sp.vstack([self._base, self._delta], format="csr", dtype=np.float32)
+            keep = np.flatnonzero(self._alive)
+            ids = np.concatenate([self._base_ids, self._delta_ids])[keep]
+            versions = np.concatenate([self._base_versions, self._delta_versions])[keep]
+        matrix = matrix[keep]
+        arrays = None
+        if matrix.nnz:
+            df = np.bincount(matrix.indices, minlength=1 << SIMILAR_HASH_BITS)
+            idf = (np.log((1 + len(keep)) / (1 + df)) + 1).astype(np.float32)
+            norms = np.sqrt(matrix.power(2) @ np.square(idf)).astype(np.float32)
+            directory = os.path.join(self.path, f"gen-{generation}")
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+            columns = {
+                "data": matrix.data.astype(np.float32), "indices": matrix.indices.astype(SIMILAR_INDEX_DTYPE),
+                "indptr": matrix.indptr.astype(SIMILAR_INDEX_DTYPE), "ids": ids, "versions": versions,
+                "idf": idf, "norms": norms,
+            }
+            arrays = {}
+            for name, array in columns.items():
+                path = os.path.join(directory, f"{name}.npy")
+                np.save(path, array)
+                # 방금 쓴 파일이라 형식을 알고 있으므로 머리글을 다시 읽지 않고 바로 memory-map으로 엶
+                # (np.load는 머리글을 ast로 읽는데, 스크립트를 컴파일하는 스레드와 겹치면 Python 3.11에서 충돌함)
+                arrays[name] = np.memmap(path, dtype=array.dtype, mode="r", shape=array.shape,
+                                         offset=os.path.getsize(path) - array.nbytes)
+        else:
+            generation = None
+        self._write_meta(generation, seq + 1)
+        with self._lock:
+            pending = [change for change in self._log if change[0] > seq]
+            self._set_base(generation, seq + 1, arrays)
+            for change in pending:
+                self._apply_change(*change)
+            again = bool(pending) and self._needs_compaction()
+        # 합쳐진 델타와 이전 세대 삭제 (Windows에서 아직 memory-map으로 열려 있으면 다음 압축 때 다시 시도)
+        for name in os.listdir(self.path):
+            if name.startswith("gen-") and name != f"gen-{generation}":
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+        for old_seq, path in self._segments():
+            if old_seq <= seq:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return again
+    
+    def apply(self, upserts: list = (), removed_ids: list = ()):
+        """기록 추가/수정(upserts)과 삭제(removed_ids)를 델타 세그먼트로 덧붙임 (바뀐 행만 씀)"""
+        if not upserts and not removed_ids:
+            return
+        indptr, indices, data = [0], [], []
+        for record in upserts:
+            features = similarity_features(similarity_text(record))
+            columns = sorted(features)
+            indices.extend(columns)
+            data.extend(features[c] for c in columns)
+            indptr.append(len(indices))
+        added = sp.csr_matrix(
+            (np.array(data, dtype=np.float32), np.array(indices, dtype=SIMILAR_INDEX_DTYPE),
+             np.array(indptr, dtype=SIMILAR_INDEX_DTYPE)),
+            shape=(len(upserts), 1 << SIMILAR_HASH_BITS)
+        )
+        ids = np.array([r["id"] for r in upserts], dtype=np.int64)
+        versions = np.array([r.get("version") or 0 for r in upserts], dtype=np.int64)
+        removed = np.array(list(removed_ids), dtype=np.int64)
+        with self._lock:
+            seq = self._seq + 1
+            tmp_path = self._segment_path(seq) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, data=added.data, indices=added.indices, indptr=added.indptr,
+                         ids=ids, versions=versions, removed=removed)
+            os.replace(tmp_path, self._segment_path(seq))
+            self._apply_change(seq, added, ids, versions, removed)
+            compact = self._needs_compaction()
+        if compact:
+            self._start_compaction()
+    
+    def refresh(self, store):
+        """저장소의 id/버전 목록과 비교하여 다른 곳에서 추가/수정/삭제된 기록만 반영"""
+        versions = {}
+        for rows in iter_record_batches(store, {}, columns=SIMILAR_INDEX_COLUMNS):
+            versions.update((r["id"], r.get("version") or 0) for r in rows)
+        with self._lock:
+            base_rows = len(self._base_ids)
+            indexed = {
+                record_id: int(self._base_versions[row] if row < base_rows else self._delta_versions[row - base_rows])
+                for record_id, row in self._rows.items()
+            }
+        changed = [record_id for record_id, version in versions.items() if indexed.get(record_id) != version]
+        removed = [record_id for record_id in indexed if record_id not in versions]
+        if len(changed) > SIMILAR_REFETCH_LIMIT:
+            changed_set = set(changed)
+            upserts = [r for rows in iter_record_batches(store, {}, columns=RECORD_COLUMNS + ["version"])
+                       for r in rows if r["id"] in changed_set]
+        else:
+            upserts = [record for record in (store.get_record(record_id) for record_id in changed) if record]
+        self.apply(upserts, removed)
+        self.last_refresh = time.monotonic()
+    
+    def _refresh_in_background(self, store):
+        try:
+            self.refresh(store)
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+    
+    def ensure_fresh(self, store):
+        """갱신 주기가 지났으면 백그라운드 스레드에서 저장소와 비교 (검색은 기다리지 않고 현재 색인으로 진행)"""
+        if time.monotonic() - self.last_refresh < SIMILAR_REFRESH_INTERVAL:
+            return
+        with self._lock:
+            if self.building:
+                return
+            self._refreshing = threading.Thread(
+                target=self._refresh_in_background, args=(store,), name="similar-index-refresh", daemon=True
+            )
+            self._refreshing.start()
+    
+    def search(self, text: str, k: int = SIMILAR_TOP_K, min_score: float = SIMILAR_MIN_SCORE) -> list:
+        """text와 비슷한 기록의 (id, 유사도) 목록 (유사도 높은 순)"""
+        features = similarity_features(text)
+        if not features:
+            return []
+        with self._lock:
+            if not self._rows:
+                return []
+            columns = np.fromiter(features.keys(), dtype=np.int64)
+            weights = np.fromiter(features.values(), dtype=np.float32) * self._idf[columns]
+            query = np.zeros(self._base.shape[1], dtype=np.float32)
+            query[columns] = weights * self._idf[columns]
+            norms = np.concatenate([self._base_norms, self._delta_norms])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                scores = np.concatenate([self._base @ query, self._delta @ query]) / (norms * np.linalg.norm(weights))
+            scores = np.where(self._alive & (norms > 0), scores, 0.0)
+            top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+            top = top[np.argsort(-scores[top])]
+            base_rows = len(self._base_ids)
+            return [
+                (int(self._base_ids[row] if row < base_rows else self._delta_ids[row - base_rows]), float(scores[row]))
+                for row in top if scores[row] >= min_score
+            ]
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._rows), "rows": len(self._alive), "delta_rows": self._delta.shape[0],
+                    "generation": self._generation}
+
+@st.cache_resource
+def get_similarity_index() -> Optional[SimilarityIndex]:
+    """프로세스 전체에서 공유되는 비슷한 상담기록 색인 (scipy가 없으면 None)"""
+    return SimilarityIndex() if SCIPY_AVAILABLE else None
+
+def update_similarity_index(upserts: list = (), removed_ids: list = ()):
+    """저장/수정/삭제한 기록을 색인에 바로 반영 (색인 오류는 저장 결과에 영향을 주지 않음)"""
+    index = get_similarity_index()
+    if index is None:
+        return
+    try:
+        index.apply(list(upserts), list(removed_ids))
+    except Exception:
+        index.last_refresh = 0.0  # 다음 검색 때 저장소와 비교하여 다시 맞춤
+
+# 일괄 가져오기 설정
+IMPORT_BATCH_SIZE = 200
+# 파일 머리글 → 컬럼 (양식의 한글 머리글과 DB 컬럼 이름 모두 허용)
+IMPORT_HEADER_ALIASES = {
+    "student_name": ["student_name", "학생 이름", "학생이름", "이름"],
+    "grade": ["grade", "학년"],
+    "class_num": ["class_num", "반"],
+    "consult_date": ["consult_date", "상담 일자", "상담일자", "일자", "날짜"],
+    "consult_content": ["consult_content", "상담 내용", "상담내용", "내용"],
+    "counselor": ["counselor", "상담자", "상담자 (교사 이름)", "교사"],
+    "notes": ["notes", "비고", "메모"],
+}
+IMPORT_TEMPLATE_HEADERS = ["학생 이름", "학년", "반", "상담 일자", "상담 내용", "상담자", "비고"]
+IMPORT_DATE_FORMATS = ("%Y-%m-%d", "%Y.%m.%d", "%Y/%m/%d", "%Y%m%d", "%Y. %m. %d")
+
+def _detect_csv_encoding(raw_file) -> str:
+    """CSV 인코딩 판별 (UTF-8이 아니면 Excel 기본 저장 형식인 CP949로 간주)"""
+    head = raw_file.read(64 * 1024)
+    raw_file.seek(0)
+    try:
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # 읽은 범위 끝에서 글자가 잘린 경우는 UTF-8로 인정
+        if e.start < len(head) - 3:
+            return "cp949"
+    return "utf-8-sig"
+
+def iter_import_rows(uploaded_file):
+    """업로드 파일(CSV/XLSX)을 한 행씩 읽어 (행 번호, 머리글→값 dict)로 반환"""
+    name = uploaded_file.name.lower()
+    if name.endswith(".xlsx"):
+        if not OPENPYXL_AVAILABLE:
+            raise RuntimeError("Excel 파일을 읽으려면 openpyxl 패키지를 설치해주세요.")
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = [str(h).strip() if h is not None else "" for h in next(rows, [])]
+            for row_num, values in enumerate(rows, start=2):
+                if values is None or all(v is None or str(v).strip() == "" for v in values):
+                    continue
+                yield row_num, dict(zip(headers, values))
+        finally:
+            workbook.close()
+    else:
+        text = io.TextIOWrapper(uploaded_file, encoding=_detect_csv_encoding(uploaded_file), newline="")
+        try:
+            reader = csv.DictReader(text)
+            reader.fieldnames = [h.strip() for h in (reader.fieldnames or [])]
+            for row_num, row in enumerate(reader, start=2):
+                if not any((v or "").strip() for v in row.values() if isinstance(v, str)):
+                    continue
+                yield row_num, row
+        finally:
+            text.detach()
+
+def _parse_import_date(value) -> Optional[date]:
+    """가져오기 파일의 날짜 값 변환 (Excel 날짜 셀 및 여러 문자열 형식 지원)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    for fmt in IMPORT_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def validate_import_row(raw: dict) -> tuple:
+    """가져오기 행 검증 (supabase_setup.sql의 제약조건과 동일) - (저장할 데이터, 오류 목록) 반환"""
+    values = {}
+    for field, aliases in IMPORT_HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in raw and raw[alias] is not None and str(raw[alias]).strip() != "":
+                values[field] = raw[alias]
+                break
+    
+    errors = []
+    for field, label in [("student_name", "학생 이름"), ("counselor", "상담자"), ("consult_content", "상담 내용")]:
+        if not str(values.get(field, "")).strip():
+            errors.append(f"{label} 누락")
+    
+    number_fields = [("grade", "학년", 1, 6), ("class_num", "반", 1, 20)]
+    numbers = {}
+    for field, label, low, high in number_fields:
+        value = values.get(field)
+        try:
+            number = int(float(str(value).strip()))
+        except (TypeError, ValueError):
+            errors.append(f"{label} 누락 또는 숫자가 아님")
+            continue
+        if not low <= number <= high:
+            errors.append(f"{label}은(는) {low}~{high} 사이여야 함 (입력값: {number})")
+        numbers[field] = number
+    
+    consult_date = _parse_import_date(values["consult_date"]) if "consult_date" in values else None
+    if consult_date is None:
+        errors.append("상담 일자 누락 또는 형식 오류 (예: 2024-03-15)")
+    
+    if errors:
+        return None, errors
+    
+    notes = str(values.get("notes", "")).strip()
+    return {
+        "student_name": str(values["student_name"]).strip(),
+        "grade": numbers["grade"],
+        "class_num": numbers["class_num"],
+        "consult_date": consult_date.isoformat(),
+        "consult_content": str(values["consult_content"]).strip(),
+        "counselor": str(values["counselor"]).strip(),
+        "notes": notes if notes else None,
+        "created_at": datetime.now().isoformat()
+    }, []
 
-# AI 텍스트 개선 함수
-def improve_text_with_ai(client, text: str) -> Optional[str]:
-    """ChatGPT API를 사용하여 텍스트를 더 정교하게 개선"""
-    if not client or not text.strip():
-        return None
+def import_records(store, rows, batch_size: int = IMPORT_BATCH_SIZE, on_progress: Optional[Callable] = None) -> dict:
+    """검증한 행을 batch_size 단위로 저장하고 결과 요약 반환
+
+    배치 저장이 실패하면 해당 배치만 한 행씩 다시 저장하여 오류 행을 찾으며,
+    나머지 행은 계속 저장합니다.
+    """
+    started = time.perf_counter()
+    summary = {"total": 0, "inserted": 0, "errors": [], "elapsed": 0.0}
+    batch = []
+    
+    def flush():
+        try:
+            inserted = store.insert_records([data for _, data in batch])
+            summary["inserted"] += len(batch)
+            update_similarity_index(inserted)
+        except Exception:
+            for row_num, data in batch:
+                try:
+                    update_similarity_index(store.insert_records([data]))
+                    summary["inserted"] += 1
+                except Exception as e:
+                    summary["errors"].append((row_num, f"저장 실패: {e}"))
+        batch.clear()
+        if on_progress:
+            on_progress(summary)
     
     try:
-        prompt = f"""초등학교 상담 기록의 상담 내용을 더 정교하고 상세하게 작성해주세요.
-다음은 간단히 작성된 상담 내용입니다:
-"{text}"
+        for row_num, raw in rows:
+            summary["total"] += 1
+            data, errors = validate_import_row(raw)
+            if errors:
+                summary["errors"].append((row_num, ", ".join(errors)))
+                continue
+            batch.append((row_num, data))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if summary["inserted"]:
+            invalidate_query_cache()
+        summary["elapsed"] = time.perf_counter() - started
+    return summary
 
-요구사항:
-- 상담 내용을 더 구체적이고 상세하게 작성
-- 전문적이면서도 이해하기 쉬운 문장으로 표현
-- 초등학교 상담 기록에 적합한 톤으로 작성
-- 원본 내용의 핵심은 유지하면서 더 풍부하게 설명
-- 2-3문단 정도의 적절한 분량으로 작성
+def import_template_csv() -> bytes:
+    """일괄 가져오기 양식 (Excel에서 바로 열리도록 BOM 포함 UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(IMPORT_TEMPLATE_HEADERS)
+    writer.writerow(["홍길동", 3, 2, "2024-03-15", "학생이 수업 중 집중력이 부족함", "김선생", ""])
+    return buffer.getvalue().encode("utf-8-sig")
 
-개선된 상담 내용:"""
+# 내보내기 설정
+EXPORT_PAGE_SIZE = 1000
+EXPORT_COLUMNS = RECORD_COLUMNS
+EXPORT_FORMATS = {"CSV": "csv", "Parquet": "parquet"}
 
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # 또는 "gpt-3.5-turbo" 사용 가능
-            messages=[
-                {"role": "system", "content": "당신은 초등학교 상담 기록을 전문적으로 작성하는 교육 전문가입니다."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        
-        improved_text = response.choices[0].message.content.strip()
-        return improved_text
-    except Exception as e:
-        st.error(f"AI 개선 중 오류 발생: {str(e)}")
-        return None
+def iter_record_batches(store, filters: dict, page_size: int = EXPORT_PAGE_SIZE, columns: list = EXPORT_COLUMNS):
+    """필터에 맞는 상담기록 전체를 키셋 페이지 단위로 반환 (한 번에 page_size행만 메모리에 유지)"""
+    cursor = None
+    while True:
+        rows = store.list_records(filters, columns, cursor, page_size)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["consult_date"], rows[-1]["id"])
 
-# Supabase 클라이언트 초기화
-@st.cache_resource
-def init_supabase():
-    """Supabase 클라이언트 초기화"""
-    # 환경 변수를 우선적으로 확인 (서버 환경에 적합)
-    url = os.getenv("SUPABASE_URL", "")
-    key = os.getenv("SUPABASE_KEY", "")
+def _parquet_schema():
+    return pa.schema([
+        ("id", pa.int64()),
+        ("student_name", pa.string()),
+        ("grade", pa.int32()),
+        ("class_num", pa.int32()),
+        ("consult_date", pa.date32()),
+        ("consult_content", pa.string()),
+        ("counselor", pa.string()),
+        ("notes", pa.string()),
+        ("created_at", pa.string()),
+    ])
+
+def export_records(store, filters: dict, fmt: str, out_file, page_size: int = EXPORT_PAGE_SIZE,
+                   on_progress: Optional[Callable] = None) -> dict:
+    """상담기록을 CSV 또는 Parquet로 out_file(바이너리 파일)에 페이지 단위로 기록하고 요약 반환"""
+    started = time.perf_counter()
+    summary = {"rows": 0, "pages": 0, "elapsed": 0.0}
+    batches = iter_record_batches(store, filters, page_size)
     
-    # 환경 변수가 없으면 Streamlit secrets에서 확인
-    if not url or not key:
+    if fmt == "parquet":
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("Parquet로 내보내려면 pyarrow 패키지를 설치해주세요.")
+        schema = _parquet_schema()
+        writer = pq.ParquetWriter(out_file, schema)
         try:
-            if "SUPABASE_URL" in st.secrets:
-                url = st.secrets["SUPABASE_URL"] if not url else url
-            if "SUPABASE_KEY" in st.secrets:
-                key = st.secrets["SUPABASE_KEY"] if not key else key
-        except (KeyError, AttributeError, FileNotFoundError):
-            pass
-    
-    if not url or not key:
-        st.error("⚠️ Supabase 설정이 필요합니다. 환경 변수 또는 Streamlit secrets에 SUPABASE_URL과 SUPABASE_KEY를 설정해주세요.")
-        st.stop()
+            for rows in batches:
+                for row in rows:
+                    row["consult_date"] = date.fromisoformat(row["consult_date"])
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                summary["rows"] += len(rows)
+                summary["pages"] += 1
+                if on_progress:
+                    on_progress(summary)
+        finally:
+            writer.close()
+    else:
+        # Excel에서 한글이 깨지지 않도록 BOM 포함 UTF-8
+        text = io.TextIOWrapper(out_file, encoding="utf-8-sig", newline="")
+        try:
+            writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            for rows in batches:
+                writer.writerows(rows)
+                summary["rows"] += len(rows)
+                summary["pages"] += 1
+                if on_progress:
+                    on_progress(summary)
+            text.flush()
+        finally:
+            text.detach()
     
-    return create_client(url, key)
+    summary["elapsed"] = time.perf_counter() - started
+    summary["bytes"] = out_file.tell()
+    return summary
 
 # 비밀번호 확인
 def check_password():
@@ -138,29 +2651,8 @@ def check_password():
             st.markdown("### 비밀번호를 입력하세요")
             password = st.text_input("비밀번호", type="password", key="password_input")
             
-            # 기본 비밀번호 읽기 (서버 환경 고려)
-            # 우선순위: 환경 변수 > Streamlit secrets > 기본값
-            default_password = "1234"  # 기본값
-            
-            try:
-                # 1. 환경 변수에서 먼저 확인 (서버 환경에서 주로 사용)
-                env_password = os.getenv("ADMIN_PASSWORD")
-                if env_password:
-                    default_password = env_password
-                else:
-                    # 2. Streamlit secrets에서 확인 (로컬 개발 환경)
-                    try:
-                        # Streamlit Cloud나 로컬 secrets에서 읽기
-                        if "ADMIN_PASSWORD" in st.secrets:
-                            default_password = st.secrets["ADMIN_PASSWORD"]
-                        elif hasattr(st.secrets, "ADMIN_PASSWORD"):
-                            default_password = st.secrets.ADMIN_PASSWORD
-                    except (KeyError, AttributeError, FileNotFoundError):
-                        # secrets 파일이 없어도 계속 진행
-                        pass
-            except Exception as e:
-                # 모든 방법 실패 시 기본값 사용
-                pass
+            # 비밀번호 (환경 변수 > Streamlit secrets > 기본값 "1234")
+            default_password = get_setting("ADMIN_PASSWORD")
             
             if st.button("로그인", type="primary", use_container_width=True):
                 # 입력한 비밀번호와 저장된 비밀번호 비교 (문자열 비교)
@@ -174,27 +2666,707 @@ def check_password():
     
     return True
 
+# 성능 정보 패널
+PERF_KIND_LABELS = {"rerun": "전체 실행", "supabase": "Supabase", "sqlite": "로컬 DB", "openai": "OpenAI", "similar": "유사 기록 색인"}
+
+def render_perf_panel():
+    """직전 스크립트 실행의 측정 결과와 누적 통계 표시 (사이드바)"""
+    events = st.session_state.get('perf_last_rerun') or []
+    rerun = next((e for e in events if e['kind'] == "rerun"), None)
+    if rerun:
+        st.metric("직전 실행 시간", f"{rerun['ms']:.0f}ms")
+        if rerun['name'] != "script":
+            st.caption(f"🧩 {rerun['name']}만 다시 실행")
+        by_kind = {}
+        for e in events:
+            if e['kind'] != "rerun":
+                by_kind[e['kind']] = by_kind.get(e['kind'], 0.0) + e['ms']
+        for kind, ms in by_kind.items():
+            st.caption(f"{PERF_KIND_LABELS.get(kind, kind)}: {ms:.0f}ms")
+        st.caption(f"화면 그리기 등 기타: {max(rerun['ms'] - sum(by_kind.values()), 0):.0f}ms")
+        st.dataframe(
+            [
+                {
+                    "종류": PERF_KIND_LABELS.get(e['kind'], e['kind']),
+                    "이름": e['name'],
+                    "ms": e['ms'],
+                    "행": e['rows'],
+                    "KB": round(e['bytes'] / 1024, 1) if e['bytes'] else None,
+                    "오류": e['error'],
+                }
+                for e in events if e['kind'] != "rerun"
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+    else:
+        st.caption("측정된 실행이 없습니다.")
+    
+    with st.expander("누적 통계", expanded=False):
+        totals = get_perf_metrics().totals()
+        st.dataframe(
+            [
+                {
+                    "종류": PERF_KIND_LABELS.get(kind, kind),
+                    "이름": name,
+                    "횟수": t['count'],
+                    "평균 ms": round(t['seconds'] * 1000 / t['count'], 1),
+                    "오류": t['errors'],
+                }
+                for (kind, name), t in sorted(totals.items())
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
+# 내용 검색은 2글자(bigram)부터 색인되므로 그보다 짧은 검색어는 조회하지 않음
+CONTENT_SEARCH_MIN_CHARS = 2
+
+def rerun_panel():
+    """현재 패널(fragment)만 다시 실행 - 패널이 전체 실행의 일부로 실행 중이면 전체를 다시 실행"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def committed_search_input(label: str, key: str, min_chars: int = 1, **kwargs) -> str:
+    """검색어 입력 - 입력이 확정(Enter 또는 포커스 이동)된 값만 반영하고, min_chars보다 짧으면 빈 검색어로 처리
+
+    시간 기준의 디바운스는 하지 않습니다. 글자를 입력하는 동안에는 Streamlit이 값을 보내지 않으므로
+    확정될 때마다 한 번만 조회합니다.
+    """
+    text = st.text_input(label, key=key, **kwargs).strip()
+    if 0 < len(text) < min_chars:
+        st.caption(f"💡 {min_chars}글자 이상 입력하면 검색합니다.")
+        return ""
+    return text
+
+def measure_rerun(panel):
+    """fragment 패널이 따로 다시 실행될 때도 스크립트 실행처럼 측정 (성능 정보 패널에 표시)
+
+    전체 스크립트 실행의 일부로 실행될 때는 이미 수집 중이므로 따로 측정하지 않습니다.
+    """
+    @functools.wraps(panel)
+    def run(*args, **kwargs):
+        perf = get_perf_metrics()
+        if perf.current_events() is not None:
+            return panel(*args, **kwargs)
+        perf.start_rerun()
+        try:
+            with perf.span("rerun", panel.__name__):
+                return panel(*args, **kwargs)
+        finally:
+            st.session_state.perf_last_rerun = perf.finish_rerun()
+            perf.write_prometheus()
+    return run
+
+# 화면별 패널 - 각 패널은 fragment로 실행되어 패널 안의 입력은 해당 패널만 다시 실행
+@measure_rerun
+def ai_improve_panel():
+    """작성 화면의 AI 개선 결과와 진행 상태 표시 (작업이 진행 중이면 이 패널만 주기적으로 다시 실행)"""
+    # AI 개선된 내용 표시 (form 위에)
+    if 'show_improved' in st.session_state and st.session_state.show_improved and 'improved_consult_content' in st.session_state:
+        st.markdown("---")
+        st.success("✅ AI가 상담 내용을 개선했습니다!")
+        ai_stats = st.session_state.get('ai_improve_stats', {})
+        if 'total' in ai_stats:
+            source = " (캐시)" if ai_stats.get('cached') else ""
+            st.caption(f"⏱️ 첫 응답 {ai_stats.get('ttft', ai_stats['total']):.2f}초 · 전체 {ai_stats['total']:.2f}초{source}")
+        st.markdown("**✨ AI 개선된 상담 내용:**")
+        st.text_area(
+            "개선된 내용",
+            value=st.session_state.improved_consult_content,
+            height=150,
+            key="improved_content_display",
+            disabled=True
+        )
+        col_use, col_ignore = st.columns(2)
+        with col_use:
+            if st.button("✅ 이 내용 사용하기", use_container_width=True, key="use_improved"):
+                st.session_state.consult_content_to_use = st.session_state.improved_consult_content
+                st.session_state.show_improved = False
+                del st.session_state.improved_consult_content
+                st.rerun()
+        with col_ignore:
+            if st.button("❌ 무시하기", use_container_width=True, key="ignore_improved"):
+                st.session_state.show_improved = False
+                if 'improved_consult_content' in st.session_state:
+                    del st.session_state.improved_consult_content
+                st.rerun()
+        st.markdown("---")
+    
+    # 상담 내용 AI 개선 작업 상태 (작업은 백그라운드 큐에서 실행되며 이 패널만 주기적으로 다시 실행해 상태 조회)
+    # 작업이 끝나면 전체 화면을 한 번 다시 실행하여 결과를 입력 폼에 반영하고 주기 실행을 멈춤
+    if 'ai_job_error' in st.session_state:
+        st.error(st.session_state.pop('ai_job_error'))
+    
+    ai_job_id = st.session_state.get('ai_job_id')
+    if ai_job_id:
+        job = get_ai_job_queue().get(ai_job_id)
+        if job is None or job['status'] == 'cancelled':
+            del st.session_state.ai_job_id
+            st.rerun()
+        elif job['status'] == 'done':
+            del st.session_state.ai_job_id
+            if job['result_text']:
+                st.session_state.improved_consult_content = job['result_text']
+                st.session_state.show_improved = True
+                st.session_state.consult_content_to_use = job['result_text']
+                st.session_state.ai_improve_stats = {
+                    'ttft': job['ttft'], 'total': job['total'], 'cached': bool(job['cached'])
+                }
+            else:
+                st.session_state.ai_job_error = "❌ AI 개선 중 오류가 발생했습니다."
+            st.rerun()
+        elif job['status'] == 'failed':
+            del st.session_state.ai_job_id
+            st.session_state.ai_job_error = f"❌ AI 개선 중 오류가 발생했습니다: {job['error']}"
+            st.rerun()
+        else:
+            if job['status'] == 'queued' and job['error']:
+                st.warning(f"⏳ {job['error']}")
+            elif job['status'] == 'queued':
+                st.info("⏳ AI 개선 요청이 대기 중입니다...")
+            else:
+                st.info("🤖 AI가 상담 내용을 개선하고 있습니다... 다른 항목은 계속 입력할 수 있습니다.")
+            if job['partial_text']:
+                st.markdown(job['partial_text'] + "▌")
+            if st.button("⏹️ 생성 중지", key="cancel_ai_improve"):
+                get_ai_job_queue().cancel(ai_job_id)
+                del st.session_state.ai_job_id
+                st.rerun()
+
+@st.fragment
+@measure_rerun
+def write_form_panel(store, openai_client):
+    """작성 화면의 입력 폼 (저장해도 이 부분만 다시 실행)"""
+    with st.form("상담기록 작성 폼", clear_on_submit=True):
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            student_name = st.text_input("학생 이름 *", placeholder="홍길동")
+            grade = st.number_input("학년 *", min_value=1, max_value=6, value=1)
+            class_num = st.number_input("반 *", min_value=1, max_value=20, value=1)
+            counselor = st.text_input("상담자 (교사 이름) *", placeholder="김선생")
+        
+        with col2:
+            consult_date = st.date_input("상담 일자 *", value=datetime.now().date())
+            
+            # 상담 내용 입력 (AI 개선된 내용이 있으면 사용)
+            initial_content = st.session_state.get('consult_content_to_use', '')
+            if 'consult_content_to_use' in st.session_state:
+                del st.session_state.consult_content_to_use
+            
+            consult_content = st.text_area(
+                "상담 내용 *", 
+                height=120, 
+                value=initial_content,
+                placeholder="상담 내용을 간단히 입력하세요.\n예: 학생이 수업 중 집중력이 부족함",
+                key="consult_content_input"
+            )
+            
+            # AI 개선 버튼 (항상 표시, API 키 없으면 비활성화)
+            st.markdown("")  # 간격
+            ai_improve_clicked = st.form_submit_button(
+                "✨ AI로 개선하기" if openai_client else "✨ AI로 개선하기 (API 키 필요)",
+                use_container_width=False,
+                key="ai_improve_btn",
+                disabled=not openai_client
+            )
+            if ai_improve_clicked and openai_client:
+                if consult_content and consult_content.strip():
+                    # 진행 중인 이전 요청이 있으면 취소하고 새로 등록
+                    if st.session_state.get('ai_job_id'):
+                        get_ai_job_queue().cancel(st.session_state.ai_job_id)
+                    st.session_state.ai_job_id = get_ai_job_queue().submit(openai_client, consult_content)
+                    # 진행 상태 패널의 주기 실행을 시작하도록 전체 화면을 다시 실행
+                    st.rerun()
+                else:
+                    st.warning("⚠️ 상담 내용을 먼저 입력해주세요.")
+            elif ai_improve_clicked and not openai_client:
+                st.warning("⚠️ AI 기능을 사용하려면 OPENAI_API_KEY를 설정해주세요.")
+            
+            # 비슷한 지난 상담기록 찾기 (로컬 색인, scipy 필요)
+            similar_clicked = st.form_submit_button(
+                "🔎 비슷한 기록 찾기" if SCIPY_AVAILABLE else "🔎 비슷한 기록 찾기 (scipy 필요)",
+                key="similar_cases_btn",
+                disabled=not SCIPY_AVAILABLE
+            )
+            if similar_clicked:
+                if consult_content and consult_content.strip():
+                    st.session_state.similar_query = consult_content
+                    # 폼이 비워지므로 입력한 상담 내용은 다시 채움
+                    st.session_state.consult_content_to_use = consult_content
+                    rerun_panel()
+                else:
+                    st.warning("⚠️ 상담 내용을 먼저 입력해주세요.")
+            
+            notes = st.text_area("비고", height=100, placeholder="추가 메모사항이 있으면 입력하세요...")
+        
+        submitted = st.form_submit_button("💾 저장하기", type="primary", use_container_width=True)
+        
+        if submitted:
+            if not all([student_name, counselor, consult_content]):
+                st.error("❌ 필수 항목(*)을 모두 입력해주세요.")
+            else:
+                try:
+                    data = {
+                        "student_name": student_name,
+                        "grade": grade,
+                        "class_num": class_num,
+                        "consult_date": consult_date.isoformat(),
+                        "consult_content": consult_content,
+                        "counselor": counselor,
+                        "notes": notes if notes else None,
+                        "created_at": datetime.now().isoformat()
+                    }
+                    
+                    inserted = store.insert_records([data])
+                    invalidate_query_cache()
+                    update_similarity_index(inserted)
+                    
+                    if inserted:
+                        st.success(f"✅ 상담기록이 성공적으로 저장되었습니다!")
+                        st.balloons()
+                    else:
+                        st.error("❌ 저장 중 오류가 발생했습니다.")
+                except Exception as e:
+                    st.error(f"❌ 오류 발생: {str(e)}")
+    
+    similar_cases_panel(store)
+
+def similar_cases_panel(store):
+    """작성 중인 상담 내용과 비슷한 지난 상담기록 (로컬 n-gram 색인에서 검색)"""
+    query = st.session_state.get('similar_query')
+    index = get_similarity_index()
+    if not query or index is None:
+        return
+    
+    st.markdown("---")
+    st.subheader("🔎 비슷한 지난 상담기록")
+    try:
+        index.ensure_fresh(store)
+        started = time.perf_counter()
+        with get_perf_metrics().span("similar", "search") as span:
+            matches = index.search(query)
+            span["rows"] = len(matches)
+        elapsed = time.perf_counter() - started
+        records = prefetch_records(store, [record_id for record_id, _ in matches])
+    except Exception as e:
+        st.error(f"❌ 비슷한 기록 검색 중 오류 발생: {str(e)}")
+        return
+    
+    documents = index.stats()['documents']
+    st.caption(f"색인된 기록 {documents}건 중 {len(matches)}건 · {elapsed * 1000:.1f}ms")
+    if index.building and documents:
+        st.caption("⏳ 상담기록 색인을 갱신하는 중입니다. 지금은 갱신 전 색인으로 찾은 결과입니다.")
+    elif index.last_error:
+        st.warning(f"⚠️ 상담기록 색인을 갱신하지 못했습니다: {index.last_error}")
+    if not matches:
+        if index.building and not documents:
+            st.info("⏳ 상담기록 색인을 만드는 중입니다. 잠시 후 다시 찾아 주세요.")
+        else:
+            st.info("📭 비슷한 상담기록이 없습니다.")
+    for record_id, score in matches:
+        record = records.get(record_id)
+        if record is None:
+            continue
+        with st.expander(
+            f"📌 {record.get('student_name', 'N/A')} - {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반 "
+            f"({record.get('consult_date', 'N/A')}) · 유사도 {score:.2f}"
+        ):
+            st.write(f"**상담자:** {record.get('counselor', 'N/A')}")
+            st.write(record.get('consult_content', 'N/A'))
+            if record.get('notes'):
+                st.write(f"**비고:** {record.get('notes')}")
+    
+    if st.button("✖️ 닫기", key="close_similar_cases"):
+        del st.session_state.similar_query
+        rerun_panel()
+
+@st.fragment
+@measure_rerun
+def records_panel(store):
+    """조회 화면의 검색 필터, 내보내기, 목록 (필터를 바꾸거나 페이지를 넘겨도 이 부분만 다시 실행)"""
+    # 검색 필터
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        search_name = committed_search_input("학생 이름으로 검색", key="records_name_search", placeholder="이름 입력")
+    with col2:
+        search_grade = st.selectbox("학년으로 필터", ["전체"] + [str(i) for i in range(1, 7)])
+    with col3:
+        search_class = st.selectbox("반으로 필터", ["전체"] + [str(i) for i in range(1, 21)])
+    with col4:
+        page_size = st.selectbox(
+            "페이지당 개수",
+            PAGE_SIZE_OPTIONS,
+            index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE)
+        )
+    col_text, col_past = st.columns([3, 1])
+    with col_text:
+        search_text = committed_search_input(
+            "상담 내용/비고 검색",
+            key="content_search",
+            min_chars=CONTENT_SEARCH_MIN_CHARS,
+            placeholder="예: 교우관계, 집중력 (입력하면 관련도 순으로 표시됩니다)"
+        )
+    with col_past:
+        include_past = st.checkbox(PAST_YEARS_LABEL, key="records_past", help=PAST_YEARS_HELP)
+    
+    filters = build_record_filters(search_name, search_grade, search_class, include_past)
+    
+    # 필터나 페이지 크기가 바뀌면 첫 페이지로 이동
+    list_key = (tuple(filters.items()), page_size, search_text)
+    if st.session_state.get('list_key') != list_key:
+        st.session_state.list_key = list_key
+        st.session_state.list_cursors = [None]
+        st.session_state.opened_records = set()
+    cursors = st.session_state.list_cursors
+    
+    # 내보내기 (현재 이름/학년/반 필터 기준)
+    with st.expander("📤 조회 결과 내보내기", expanded=False):
+        st.caption("현재 이름·학년·반·학년도 필터에 맞는 모든 상담기록을 파일로 내보냅니다. (상담 내용 검색어는 적용되지 않습니다)")
+        col_fmt, col_btn = st.columns([1, 1])
+        with col_fmt:
+            export_format = st.radio("파일 형식", list(EXPORT_FORMATS.keys()), horizontal=True)
+        with col_btn:
+            export_clicked = st.button("📦 내보내기 파일 만들기", use_container_width=True)
+        
+        if export_clicked:
+            fmt = EXPORT_FORMATS[export_format]
+            status = st.empty()
+            
+            def show_export_progress(summary):
+                status.info(f"⏳ {summary['rows']}행 기록 중... ({summary['pages']}페이지)")
+            
+            # 학생 정보가 담긴 파일이 디스크에 남지 않도록 메모리에서 만듦
+            st.session_state.export_data = None
+            try:
+                buffer = io.BytesIO()
+                summary = export_records(store, filters, fmt, buffer, on_progress=show_export_progress)
+                status.empty()
+                st.session_state.export_data = buffer.getvalue()
+                st.session_state.export_file_name = f"상담기록_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+                st.session_state.export_summary = summary
+            except Exception as e:
+                status.empty()
+                st.error(f"❌ 내보내기 중 오류 발생: {str(e)}")
+        
+        if st.session_state.get('export_data') is not None:
+            summary = st.session_state.export_summary
+            elapsed = summary['elapsed']
+            st.success(
+                f"✅ {summary['rows']}행 · {summary['bytes'] / 1024:.1f}KB · {elapsed:.2f}초"
+                + (f" ({summary['rows'] / elapsed:.0f}행/초)" if elapsed > 0 else "")
+            )
+            st.download_button(
+                "⬇️ 내려받기",
+                data=st.session_state.export_data,
+                file_name=st.session_state.export_file_name,
+                use_container_width=True
+            )
+    
+    try:
+        # 내용 검색: 관련도 순 결과와 검색어 주변 미리보기
+        if search_text:
+            results = search_records(store, search_text, filters)
+            
+            if results:
+                st.info(f"🔎 '{search_text}' 검색 결과 {len(results)}개 (관련도 순)")
+                # 열어 둔 기록의 상담 내용은 한 번에 동시 조회
+                prefetch_records(store, [r['id'] for r in results if r['id'] in st.session_state.opened_records])
+                for record in results:
+                    render_record_expander(store, record, snippet=highlight_snippet(record.get('snippet', ''), search_text))
+            else:
+                st.info("📭 검색 결과가 없습니다.")
+        
+        # 목록: 키셋 페이지네이션
+        else:
+            records, next_cursor = fetch_records_page(store, filters, page_size, cursors[-1])
+            
+            if records:
+                st.info(f"📊 {len(cursors)}페이지 - {len(records)}개의 상담기록을 표시합니다.")
+                prefetch_records(store, [r['id'] for r in records if r['id'] in st.session_state.opened_records])
+                for record in records:
+                    render_record_expander(store, record)
+            else:
+                st.info("📭 검색 결과가 없습니다.")
+            
+            # 페이지 이동
+            col_prev, col_page, col_next = st.columns([1, 2, 1])
+            with col_prev:
+                if st.button("◀ 이전", use_container_width=True, disabled=len(cursors) <= 1):
+                    cursors.pop()
+                    st.session_state.opened_records = set()
+                    rerun_panel()
+            with col_page:
+                st.markdown(f"<div style='text-align: center'>{len(cursors)} 페이지</div>", unsafe_allow_html=True)
+            with col_next:
+                if st.button("다음 ▶", use_container_width=True, disabled=next_cursor is None):
+                    cursors.append(next_cursor)
+                    st.session_state.opened_records = set()
+                    rerun_panel()
+            
+    except Exception as e:
+        st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+        st.info("💡 데이터베이스 테이블이 생성되지 않았을 수 있습니다. Supabase에서 'counseling_records' 테이블을 생성해주세요.")
+
+@st.fragment
+@measure_rerun
+def record_edit_panel(store):
+    """수정 화면의 기록 선택과 수정 폼 (검색하거나 저장해도 이 부분만 다시 실행)"""
+    if 'edit_message' in st.session_state:
+        st.success(st.session_state.pop('edit_message'))
+    
+    try:
+        # 수정할 기록 검색 및 선택 (검색 결과 일부만 서버에서 조회)
+        selected_record = record_picker(store, "수정할 상담기록을 선택하세요", key="edit_picker")
+        
+        if not selected_record:
+            st.info("📭 수정할 상담기록이 없습니다.")
+        else:
+            
+            st.markdown("---")
+            
+            with st.form("상담기록 수정 폼"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    student_name = st.text_input("학생 이름 *", value=selected_record.get('student_name', ''))
+                    grade = st.number_input("학년 *", min_value=1, max_value=6, value=selected_record.get('grade', 1))
+                    class_num = st.number_input("반 *", min_value=1, max_value=20, value=selected_record.get('class_num', 1))
+                    counselor = st.text_input("상담자 (교사 이름) *", value=selected_record.get('counselor', ''))
+                
+                with col2:
+                    consult_date = st.date_input(
+                        "상담 일자 *",
+                        value=datetime.fromisoformat(selected_record.get('consult_date', datetime.now().isoformat())).date()
+                    )
+                    consult_content = st.text_area(
+                        "상담 내용 *",
+                        value=selected_record.get('consult_content', ''),
+                        height=150
+                    )
+                    notes = st.text_area(
+                        "비고",
+                        value=selected_record.get('notes', '') or '',
+                        height=100
+                    )
+                
+                submitted = st.form_submit_button("수정하기", type="primary", use_container_width=True)
+                
+                if submitted:
+                    if not all([student_name, counselor, consult_content]):
+                        st.error("❌ 필수 항목(*)을 모두 입력해주세요.")
+                    else:
+                        try:
+                            update_data = {
+                                "student_name": student_name,
+                                "grade": grade,
+                                "class_num": class_num,
+                                "consult_date": consult_date.isoformat(),
+                                "consult_content": consult_content,
+                                "counselor": counselor,
+                                "notes": notes if notes else None
+                            }
+                            
+                            # 바뀐 항목만 보내고, 불러온 뒤 다른 곳에서 수정되었으면 저장하지 않음
+                            changes = changed_fields(selected_record, update_data)
+                            if not changes:
+                                st.info("💡 변경된 내용이 없습니다.")
+                            else:
+                                updated = store.update_record(selected_record.get('id'), changes, selected_record.get('version'))
+                                
+                                if updated:
+                                    patch_cached_record(updated[0], set(changes))
+                                    update_similarity_index(updated)
+                                    st.session_state.edit_message = "✅ 상담기록이 성공적으로 수정되었습니다!"
+                                    rerun_panel()
+                                else:
+                                    # 저장하지 못함: 입력한 내용은 폼에 그대로 두고, 다음 실행에서 최신 기록을 불러오도록 캐시 무효화
+                                    invalidate_query_cache()
+                                    current = store.get_record(selected_record.get('id'))
+                                    if current is None:
+                                        st.error("❌ 다른 곳에서 삭제된 상담기록입니다.")
+                                    else:
+                                        updated_at = str(current.get('updated_at') or '')[:19].replace('T', ' ')
+                                        st.error(
+                                            f"⚠️ 다른 곳에서 먼저 수정된 상담기록입니다{f' (마지막 수정 {updated_at})' if updated_at else ''}. "
+                                            "아래 최신 내용을 확인한 뒤 다시 수정해주세요."
+                                        )
+                                        for field in changes:
+                                            st.write(f"**{RECORD_FIELD_LABELS[field]}:** {current.get(field) or ''}")
+                        except Exception as e:
+                            st.error(f"❌ 오류 발생: {str(e)}")
+                            
+    except Exception as e:
+        st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+
+@st.fragment
+@measure_rerun
+def record_delete_panel(store):
+    """삭제 화면의 기록 선택과 삭제 버튼 (검색하거나 삭제해도 이 부분만 다시 실행)"""
+    try:
+        # 삭제할 기록 검색 및 선택 (검색 결과 일부만 서버에서 조회)
+        selected_record = record_picker(store, "삭제할 상담기록을 선택하세요", key="delete_picker")
+        
+        if not selected_record:
+            st.info("📭 삭제할 상담기록이 없습니다.")
+        else:
+            
+            st.markdown("---")
+            st.write("**선택한 상담기록:**")
+            st.json(selected_record)
+            
+            if st.button("🗑️ 삭제하기", type="primary", use_container_width=True):
+                try:
+                    deleted = store.delete_record(selected_record.get('id'))
+                    invalidate_query_cache()
+                    update_similarity_index(removed_ids=[selected_record.get('id')])
+                    
+                    if deleted:
+                        st.success("✅ 상담기록이 성공적으로 삭제되었습니다!")
+                        rerun_panel()
+                    else:
+                        st.error("❌ 삭제 중 오류가 발생했습니다.")
+                except Exception as e:
+                    st.error(f"❌ 오류 발생: {str(e)}")
+                    
+    except Exception as e:
+        st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+
+
+@measure_rerun
+def student_summary_panel():
+    """학생 상담 이력 AI 요약 결과와 진행 상태 (작업이 진행 중이면 이 패널만 주기적으로 다시 실행)"""
+    if 'summary_job_error' in st.session_state:
+        st.error(st.session_state.pop('summary_job_error'))
+    
+    job_id = st.session_state.get('summary_job_id')
+    if job_id:
+        job = get_ai_job_queue().get(job_id)
+        if job is None or job['status'] == 'cancelled':
+            del st.session_state.summary_job_id
+            st.rerun()
+        elif job['status'] == 'done':
+            del st.session_state.summary_job_id
+            st.session_state.student_summary = {
+                'student': job['input_text'],
+                'text': job['result_text'],
+                'caption': f"{job['partial_text']} · {job['total']:.1f}초",
+            }
+            st.rerun()
+        elif job['status'] == 'failed':
+            del st.session_state.summary_job_id
+            st.session_state.summary_job_error = f"❌ 상담 이력 요약 중 오류가 발생했습니다: {job['error']}"
+            st.rerun()
+        else:
+            st.info(f"🤖 {job['input_text']} 학생의 상담 이력을 요약하고 있습니다... {job['partial_text']}")
+            if st.button("⏹️ 요약 중지", key="cancel_student_summary"):
+                get_ai_job_queue().cancel(job_id)
+                del st.session_state.summary_job_id
+                st.rerun()
+        return
+    
+    summary = st.session_state.get('student_summary')
+    if summary:
+        with st.expander(f"🧾 {summary['student']} 학생 상담 이력 요약", expanded=True):
+            st.markdown(summary['text'])
+            st.caption(f"⏱️ {summary['caption']}")
+            st.download_button(
+                "⬇️ 요약 내려받기",
+                data=summary['text'].encode("utf-8"),
+                file_name=f"상담이력요약_{summary['student']}.txt",
+                mime="text/plain"
+            )
+
+@st.fragment
+@measure_rerun
+def student_timeline_panel(store, openai_client):
+    """학생별 상담 이력 화면의 학생 검색과 이력 목록 (검색하거나 학생을 바꿔도 이 부분만 다시 실행)"""
+    search_name = committed_search_input("학생 이름으로 검색", key="timeline_search", placeholder="이름 입력")
+    
+    try:
+        students = search_students(store, search_name)
+        if not students:
+            st.info("📭 일치하는 학생이 없습니다.")
+            return
+        
+        labels = {s["id"]: format_student_label(s) for s in students}
+        student_id = st.selectbox("학생을 선택하세요", list(labels.keys()), format_func=labels.get, key="timeline_student")
+        if st.session_state.get('timeline_student_id') != student_id:
+            st.session_state.timeline_student_id = student_id
+            st.session_state.opened_records = set()
+        
+        # 학부모 상담·인수인계용 AI 요약 (기록별 요약은 캐시되어 새 기록만 다시 요약)
+        if st.button(
+            "🧾 AI로 상담 이력 요약하기" if openai_client else "🧾 AI로 상담 이력 요약하기 (API 키 필요)",
+            disabled=not openai_client or bool(st.session_state.get('summary_job_id')),
+            key="summarize_student"
+        ):
+            summary_records = store.list_student_records(student_id, STUDENT_SUMMARY_COLUMNS, STUDENT_SUMMARY_MAX_RECORDS)
+            if summary_records:
+                student = next(s for s in students if s["id"] == student_id)
+                st.session_state.summary_job_id = get_ai_job_queue().submit_summary(
+                    openai_client, student["name"], list(reversed(summary_records))
+                )
+                st.session_state.pop('student_summary', None)
+                # 진행 상태 패널의 주기 실행을 시작하도록 전체 화면을 다시 실행
+                st.rerun()
+        
+        records = fetch_student_timeline(store, student_id)
+        if not records:
+            st.info("📭 상담기록이 없습니다.")
+            return
+        
+        st.info(f"📊 {len(records)}개의 상담기록 (최신순)")
+        if len(records) >= STUDENT_TIMELINE_LIMIT:
+            st.caption(f"💡 최근 {STUDENT_TIMELINE_LIMIT}개만 표시됩니다.")
+        prefetch_records(store, [r['id'] for r in records if r['id'] in st.session_state.opened_records])
+        for record in records:
+            render_record_expander(store, record)
+    except Exception as e:
+        st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+        st.info("💡 Supabase를 사용하는 경우 migrations/004_students.sql이 적용되었는지 확인하세요.")
+
 # 메인 애플리케이션
 def main():
     """메인 애플리케이션"""
     st.title("📚 초등학교 상담기록부")
     st.markdown("---")
     
-    supabase = init_supabase()
+    store = init_store()
     
     # 사이드바 - 메뉴
     with st.sidebar:
         st.header("메뉴")
         menu = st.radio(
             "선택하세요",
-            ["📝 상담기록 작성", "📋 상담기록 조회", "✏️ 상담기록 수정", "🗑️ 상담기록 삭제"],
+            ["📝 상담기록 작성", "📋 상담기록 조회", "🧑‍🎓 학생별 상담 이력", "✏️ 상담기록 수정", "🗑️ 상담기록 삭제", "📥 상담기록 일괄 가져오기", "📊 상담 통계"],
             label_visibility="collapsed"
         )
         
+        # 로컬 우선 모드: 동기화 상태 표시
+        if isinstance(store, LocalFirstStore):
+            st.markdown("---")
+            sync = store.sync_status()
+            if sync['last_error']:
+                st.warning(f"📴 Supabase에 연결할 수 없어 로컬에 저장 중입니다.\n\n{sync['last_error']}")
+            st.caption(
+                f"🔄 동기화 대기 {sync['pending']}건"
+                + (f" · 마지막 동기화 {sync['last_sync'].strftime('%H:%M:%S')}" if sync['last_sync'] else "")
+            )
+            if sync['conflicts']:
+                st.error(f"⚠️ 다른 곳에서 변경되어 반영하지 못한 기록이 {sync['conflicts']}건 있습니다.")
+        
         st.markdown("---")
         if st.button("🚪 로그아웃", use_container_width=True):
             st.session_state.authenticated = False
             st.rerun()
+        
+        # 관리자용 성능 정보
+        if st.checkbox("⏱️ 성능 정보 보기", key="show_perf_panel"):
+            render_perf_panel()
     
     # 상담기록 작성
     if menu == "📝 상담기록 작성":
@@ -208,330 +3380,168 @@ def main():
             st.write(f"OpenAI 라이브러리 설치: {'✅' if OPENAI_AVAILABLE else '❌'}")
             st.write(f"OpenAI 클라이언트 초기화: {'✅' if openai_client else '❌'}")
             
-            # API 키 존재 여부 확인 (키 값은 보이지 않도록)
+            # API 키를 읽은 곳 (키 값은 앞부분만 표시)
+            config = get_app_config()
+            key_source = config.source("OPENAI_API_KEY")
+            st.write(f"환경 변수 OPENAI_API_KEY: {'✅' if key_source == 'env' else '❌'}")
+            st.write(f"Secrets OPENAI_API_KEY: {'✅' if key_source == 'secrets' else '❌'}")
+            if key_source:
+                st.write(f"API 키 시작 부분: `{config.get('OPENAI_API_KEY')[:7]}...`")
+            
             try:
-                env_key = os.getenv("OPENAI_API_KEY", "")
-                secrets_key = ""
-                try:
-                    if hasattr(st, 'secrets'):
-                        if isinstance(st.secrets, dict):
-                            secrets_key = st.secrets.get("OPENAI_API_KEY", "")
-                        else:
-                            secrets_key = getattr(st.secrets, "OPENAI_API_KEY", "")
-                except:
-                    pass
-                
-                has_env_key = bool(env_key and env_key.strip())
-                has_secrets_key = bool(secrets_key and secrets_key.strip())
-                
-                st.write(f"환경 변수 OPENAI_API_KEY: {'✅' if has_env_key else '❌'}")
-                st.write(f"Secrets OPENAI_API_KEY: {'✅' if has_secrets_key else '❌'}")
-                
-                if has_env_key:
-                    st.write(f"API 키 시작 부분: `{env_key[:7]}...`")
-                elif has_secrets_key:
-                    st.write(f"API 키 시작 부분: `{secrets_key[:7]}...`")
-                    
+                cache_stats = get_ai_cache().stats()
+                st.write(f"AI 결과 캐시: 적중 {cache_stats['hits']}회 · 미적중 {cache_stats['misses']}회 · 저장 {cache_stats['entries']}개")
             except Exception as e:
-                st.write(f"오류: {str(e)}")
+                st.write(f"AI 결과 캐시 오류: {str(e)}")
         
         if openai_client:
             st.success("✨ AI 개선 기능이 활성화되었습니다!")
         else:
             st.warning("⚠️ AI 기능을 사용하려면 OPENAI_API_KEY를 설정해주세요. (secrets 또는 환경 변수)\n위의 'AI 설정 상태'를 펼쳐서 확인해보세요.")
         
-        # AI 개선된 내용 표시 (form 위에)
-        if 'show_improved' in st.session_state and st.session_state.show_improved and 'improved_consult_content' in st.session_state:
-            st.markdown("---")
-            st.success("✅ AI가 상담 내용을 개선했습니다!")
-            st.markdown("**✨ AI 개선된 상담 내용:**")
-            st.text_area(
-                "개선된 내용",
-                value=st.session_state.improved_consult_content,
-                height=150,
-                key="improved_content_display",
-                disabled=True
-            )
-            col_use, col_ignore = st.columns(2)
-            with col_use:
-                if st.button("✅ 이 내용 사용하기", use_container_width=True, key="use_improved"):
-                    st.session_state.consult_content_to_use = st.session_state.improved_consult_content
-                    st.session_state.show_improved = False
-                    del st.session_state.improved_consult_content
-                    st.rerun()
-            with col_ignore:
-                if st.button("❌ 무시하기", use_container_width=True, key="ignore_improved"):
-                    st.session_state.show_improved = False
-                    if 'improved_consult_content' in st.session_state:
-                        del st.session_state.improved_consult_content
-                    st.rerun()
-            st.markdown("---")
-        
-        # 상담 내용 AI 개선 (form 밖에서 처리)
-        if 'ai_improve_request' in st.session_state and st.session_state.ai_improve_request:
-            content_to_improve = st.session_state.get('content_for_ai', '')
-            if content_to_improve.strip() and openai_client:
-                with st.spinner("🤖 AI가 상담 내용을 개선하고 있습니다... 잠시만 기다려주세요."):
-                    improved_text = improve_text_with_ai(openai_client, content_to_improve)
-                    if improved_text:
-                        st.session_state.improved_consult_content = improved_text
-                        st.session_state.show_improved = True
-                        st.session_state.consult_content_to_use = improved_text
-                        st.success("✅ AI 개선이 완료되었습니다!")
-                    else:
-                        st.error("❌ AI 개선 중 오류가 발생했습니다.")
-            else:
-                st.warning("⚠️ 상담 내용을 먼저 입력해주세요.")
-            st.session_state.ai_improve_request = False
+        # AI 작업이 진행 중일 때만 진행 상태 패널을 주기적으로 다시 실행
+        polling = bool(st.session_state.get('ai_job_id'))
+        st.fragment(ai_improve_panel, run_every=AI_JOB_POLL_INTERVAL if polling else None)()
         
-        with st.form("상담기록 작성 폼", clear_on_submit=True):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                student_name = st.text_input("학생 이름 *", placeholder="홍길동")
-                grade = st.number_input("학년 *", min_value=1, max_value=6, value=1)
-                class_num = st.number_input("반 *", min_value=1, max_value=20, value=1)
-                counselor = st.text_input("상담자 (교사 이름) *", placeholder="김선생")
-            
-            with col2:
-                consult_date = st.date_input("상담 일자 *", value=datetime.now().date())
-                
-                # 상담 내용 입력 (AI 개선된 내용이 있으면 사용)
-                initial_content = st.session_state.get('consult_content_to_use', '')
-                if 'consult_content_to_use' in st.session_state:
-                    del st.session_state.consult_content_to_use
-                
-                consult_content = st.text_area(
-                    "상담 내용 *", 
-                    height=120, 
-                    value=initial_content,
-                    placeholder="상담 내용을 간단히 입력하세요.\n예: 학생이 수업 중 집중력이 부족함",
-                    key="consult_content_input"
-                )
-                
-                # AI 개선 버튼 (항상 표시, API 키 없으면 비활성화)
-                st.markdown("")  # 간격
-                ai_improve_clicked = st.form_submit_button(
-                    "✨ AI로 개선하기" if openai_client else "✨ AI로 개선하기 (API 키 필요)",
-                    use_container_width=False,
-                    key="ai_improve_btn",
-                    disabled=not openai_client
-                )
-                if ai_improve_clicked and openai_client:
-                    if consult_content and consult_content.strip():
-                        st.session_state.content_for_ai = consult_content
-                        st.session_state.ai_improve_request = True
-                        st.rerun()
-                    else:
-                        st.warning("⚠️ 상담 내용을 먼저 입력해주세요.")
-                elif ai_improve_clicked and not openai_client:
-                    st.warning("⚠️ AI 기능을 사용하려면 OPENAI_API_KEY를 설정해주세요.")
-                
-                notes = st.text_area("비고", height=100, placeholder="추가 메모사항이 있으면 입력하세요...")
-            
-            submitted = st.form_submit_button("💾 저장하기", type="primary", use_container_width=True)
-            
-            if submitted:
-                if not all([student_name, counselor, consult_content]):
-                    st.error("❌ 필수 항목(*)을 모두 입력해주세요.")
-                else:
-                    try:
-                        data = {
-                            "student_name": student_name,
-                            "grade": grade,
-                            "class_num": class_num,
-                            "consult_date": consult_date.isoformat(),
-                            "consult_content": consult_content,
-                            "counselor": counselor,
-                            "notes": notes if notes else None,
-                            "created_at": datetime.now().isoformat()
-                        }
-                        
-                        result = supabase.table("counseling_records").insert(data).execute()
-                        
-                        if result.data:
-                            st.success(f"✅ 상담기록이 성공적으로 저장되었습니다!")
-                            st.balloons()
-                        else:
-                            st.error("❌ 저장 중 오류가 발생했습니다.")
-                    except Exception as e:
-                        st.error(f"❌ 오류 발생: {str(e)}")
+        write_form_panel(store, openai_client)
     
     # 상담기록 조회
     elif menu == "📋 상담기록 조회":
         st.header("📋 상담기록 조회")
         
-        # 검색 필터
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            search_name = st.text_input("학생 이름으로 검색", placeholder="이름 입력")
-        with col2:
-            search_grade = st.selectbox("학년으로 필터", ["전체"] + [str(i) for i in range(1, 7)])
-        with col3:
-            search_class = st.selectbox("반으로 필터", ["전체"] + [str(i) for i in range(1, 21)])
+        records_panel(store)
+    
+    # 학생별 상담 이력
+    elif menu == "🧑‍🎓 학생별 상담 이력":
+        st.header("🧑‍🎓 학생별 상담 이력")
         
-        try:
-            query = supabase.table("counseling_records").select("*")
-            
-            # 필터 적용
-            if search_name:
-                query = query.ilike("student_name", f"%{search_name}%")
-            if search_grade != "전체":
-                query = query.eq("grade", int(search_grade))
-            if search_class != "전체":
-                query = query.eq("class_num", int(search_class))
-            
-            # 최신순 정렬
-            query = query.order("consult_date", desc=True)
-            
-            result = query.execute()
-            
-            if result.data:
-                st.info(f"📊 총 {len(result.data)}개의 상담기록이 있습니다.")
-                
-                for idx, record in enumerate(result.data, 1):
-                    with st.expander(f"📌 {record.get('student_name', 'N/A')} - {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반 ({record.get('consult_date', 'N/A')})"):
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.write(f"**학생 이름:** {record.get('student_name', 'N/A')}")
-                            st.write(f"**학년/반:** {record.get('grade', 'N/A')}학년 {record.get('class_num', 'N/A')}반")
-                            st.write(f"**상담 일자:** {record.get('consult_date', 'N/A')}")
-                        with col2:
-                            st.write(f"**상담자:** {record.get('counselor', 'N/A')}")
-                            st.write(f"**작성일시:** {record.get('created_at', 'N/A')[:19] if record.get('created_at') else 'N/A'}")
-                        
-                        st.markdown("---")
-                        st.write(f"**상담 내용:**")
-                        st.write(record.get('consult_content', 'N/A'))
-                        
-                        if record.get('notes'):
-                            st.write(f"**비고:**")
-                            st.write(record.get('notes'))
-            else:
-                st.info("📭 검색 결과가 없습니다.")
-                
-        except Exception as e:
-            st.error(f"❌ 조회 중 오류 발생: {str(e)}")
-            st.info("💡 데이터베이스 테이블이 생성되지 않았을 수 있습니다. Supabase에서 'counseling_records' 테이블을 생성해주세요.")
+        # AI 요약 작업이 진행 중일 때만 요약 패널을 주기적으로 다시 실행
+        polling = bool(st.session_state.get('summary_job_id'))
+        st.fragment(student_summary_panel, run_every=AI_JOB_POLL_INTERVAL if polling else None)()
+        
+        student_timeline_panel(store, init_openai())
+        
+        # 새 학년도 학년 올리기 (학년도가 바뀐 뒤 한 번 실행)
+        with st.expander("🎓 새 학년도 학년 올리기", expanded=False):
+            st.caption("입학 학년도를 기준으로 모든 학생의 학년을 다시 계산하고, 6학년을 마친 학생은 졸업 처리합니다. 반은 바뀌지 않으며, 여러 번 실행해도 결과는 같습니다. 올해와 내년 학년도 파티션도 함께 만듭니다.")
+            target_year = st.number_input(
+                "학년도", min_value=2000, max_value=2100, value=school_year_of(date.today()), step=1
+            )
+            if st.button("🎓 학년 올리기", use_container_width=True):
+                try:
+                    changed = store.rollover_grades(int(target_year))
+                    invalidate_query_cache()
+                    st.success(f"✅ {changed}명의 학년을 변경했습니다.")
+                except Exception as e:
+                    st.error(f"❌ 학년 올리기 중 오류 발생: {str(e)}")
     
     # 상담기록 수정
     elif menu == "✏️ 상담기록 수정":
         st.header("✏️ 상담기록 수정")
         
-        try:
-            # 모든 기록 가져오기
-            result = supabase.table("counseling_records").select("*").order("consult_date", desc=True).execute()
-            
-            if not result.data:
-                st.info("📭 수정할 상담기록이 없습니다.")
-            else:
-                # 수정할 기록 선택
-                record_options = {
-                    f"{r.get('student_name', 'N/A')} - {r.get('grade', 'N/A')}학년 {r.get('class_num', 'N/A')}반 ({r.get('consult_date', 'N/A')})": r
-                    for r in result.data
-                }
-                
-                selected_key = st.selectbox("수정할 상담기록을 선택하세요", list(record_options.keys()))
-                selected_record = record_options[selected_key]
-                
-                st.markdown("---")
-                
-                with st.form("상담기록 수정 폼"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        student_name = st.text_input("학생 이름 *", value=selected_record.get('student_name', ''))
-                        grade = st.number_input("학년 *", min_value=1, max_value=6, value=selected_record.get('grade', 1))
-                        class_num = st.number_input("반 *", min_value=1, max_value=20, value=selected_record.get('class_num', 1))
-                        counselor = st.text_input("상담자 (교사 이름) *", value=selected_record.get('counselor', ''))
-                    
-                    with col2:
-                        consult_date = st.date_input(
-                            "상담 일자 *",
-                            value=datetime.fromisoformat(selected_record.get('consult_date', datetime.now().isoformat())).date()
-                        )
-                        consult_content = st.text_area(
-                            "상담 내용 *",
-                            value=selected_record.get('consult_content', ''),
-                            height=150
-                        )
-                        notes = st.text_area(
-                            "비고",
-                            value=selected_record.get('notes', '') or '',
-                            height=100
-                        )
-                    
-                    submitted = st.form_submit_button("수정하기", type="primary", use_container_width=True)
-                    
-                    if submitted:
-                        if not all([student_name, counselor, consult_content]):
-                            st.error("❌ 필수 항목(*)을 모두 입력해주세요.")
-                        else:
-                            try:
-                                update_data = {
-                                    "student_name": student_name,
-                                    "grade": grade,
-                                    "class_num": class_num,
-                                    "consult_date": consult_date.isoformat(),
-                                    "consult_content": consult_content,
-                                    "counselor": counselor,
-                                    "notes": notes if notes else None
-                                }
-                                
-                                result = supabase.table("counseling_records").update(update_data).eq("id", selected_record.get('id')).execute()
-                                
-                                if result.data:
-                                    st.success("✅ 상담기록이 성공적으로 수정되었습니다!")
-                                    st.rerun()
-                                else:
-                                    st.error("❌ 수정 중 오류가 발생했습니다.")
-                            except Exception as e:
-                                st.error(f"❌ 오류 발생: {str(e)}")
-                                
-        except Exception as e:
-            st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+        record_edit_panel(store)
     
     # 상담기록 삭제
     elif menu == "🗑️ 상담기록 삭제":
         st.header("🗑️ 상담기록 삭제")
         st.warning("⚠️ 삭제된 상담기록은 복구할 수 없습니다.")
         
-        try:
-            # 모든 기록 가져오기
-            result = supabase.table("counseling_records").select("*").order("consult_date", desc=True).execute()
+        record_delete_panel(store)
+    
+    # 상담기록 일괄 가져오기
+    elif menu == "📥 상담기록 일괄 가져오기":
+        st.header("📥 상담기록 일괄 가져오기")
+        st.info("💡 CSV 또는 Excel(xlsx) 파일의 상담기록을 한 번에 저장합니다. 첫 행은 머리글이어야 하며, 양식을 내려받아 사용할 수 있습니다.")
+        
+        st.download_button(
+            "📄 가져오기 양식 내려받기 (CSV)",
+            data=import_template_csv(),
+            file_name="상담기록_가져오기_양식.csv",
+            mime="text/csv"
+        )
+        
+        uploaded_file = st.file_uploader("가져올 파일", type=["csv", "xlsx"])
+        batch_size = st.number_input("한 번에 저장할 행 수", min_value=10, max_value=1000, value=IMPORT_BATCH_SIZE, step=10)
+        
+        if uploaded_file and st.button("📥 가져오기", type="primary", use_container_width=True):
+            status = st.empty()
+            
+            def show_progress(summary):
+                status.info(f"⏳ {summary['total']}행 확인 · {summary['inserted']}행 저장 · 오류 {len(summary['errors'])}행")
             
-            if not result.data:
-                st.info("📭 삭제할 상담기록이 없습니다.")
+            try:
+                summary = import_records(store, iter_import_rows(uploaded_file), int(batch_size), on_progress=show_progress)
+            except Exception as e:
+                status.empty()
+                st.error(f"❌ 파일을 읽는 중 오류 발생: {str(e)}")
             else:
-                # 삭제할 기록 선택
-                record_options = {
-                    f"{r.get('student_name', 'N/A')} - {r.get('grade', 'N/A')}학년 {r.get('class_num', 'N/A')}반 ({r.get('consult_date', 'N/A')})": r
-                    for r in result.data
-                }
-                
-                selected_key = st.selectbox("삭제할 상담기록을 선택하세요", list(record_options.keys()))
-                selected_record = record_options[selected_key]
+                status.empty()
+                elapsed = summary['elapsed']
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("전체 행", summary['total'])
+                col2.metric("저장", summary['inserted'])
+                col3.metric("오류", len(summary['errors']))
+                col4.metric("처리 속도", f"{summary['total'] / elapsed:.0f}행/초" if elapsed > 0 else "-")
+                st.caption(f"⏱️ 소요 시간 {elapsed:.2f}초 (배치 크기 {int(batch_size)}행)")
                 
-                st.markdown("---")
-                st.write("**선택한 상담기록:**")
-                st.json(selected_record)
-                
-                if st.button("🗑️ 삭제하기", type="primary", use_container_width=True):
-                    try:
-                        result = supabase.table("counseling_records").delete().eq("id", selected_record.get('id')).execute()
-                        
-                        if result.data:
-                            st.success("✅ 상담기록이 성공적으로 삭제되었습니다!")
-                            st.rerun()
-                        else:
-                            st.error("❌ 삭제 중 오류가 발생했습니다.")
-                    except Exception as e:
-                        st.error(f"❌ 오류 발생: {str(e)}")
-                        
+                if summary['inserted']:
+                    st.success(f"✅ {summary['inserted']}개의 상담기록을 저장했습니다.")
+                if summary['errors']:
+                    st.warning("⚠️ 아래 행은 저장하지 못했습니다. 파일을 수정한 뒤 해당 행만 다시 가져오세요.")
+                    st.dataframe(
+                        [{"행 번호": row_num, "오류": message} for row_num, message in summary['errors']],
+                        use_container_width=True,
+                        hide_index=True
+                    )
+
+    elif menu == "📊 상담 통계":
+        st.header("📊 상담 통계")
+        
+        try:
+            stats = fetch_statistics(store)
         except Exception as e:
-            st.error(f"❌ 조회 중 오류 발생: {str(e)}")
+            st.error(f"❌ 통계를 불러오는 중 오류 발생: {str(e)}")
+            st.info("💡 Supabase를 사용하는 경우 migrations/003_statistics_summary.sql이 적용되었는지 확인하세요.")
+            return
+        
+        by_class, by_counselor, by_month = stats['by_class'], stats['by_counselor'], stats['by_month']
+        if not by_class:
+            st.info("📭 아직 저장된 상담기록이 없습니다.")
+            return
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric("전체 상담 건수", f"{sum(r['record_count'] for r in by_class):,}")
+        col2.metric("상담자 수", len(by_counselor))
+        col3.metric("상담한 학급 수", len(by_class))
+        
+        st.subheader("학년/반별 상담 건수")
+        class_counts = pd.DataFrame(by_class).pivot_table(
+            index="grade", columns="class_num", values="record_count", aggfunc="sum", fill_value=0
+        )
+        class_counts.index = [f"{g}학년" for g in class_counts.index]
+        class_counts.columns = [f"{c}반" for c in class_counts.columns]
+        st.bar_chart(class_counts)
+        with st.expander("표로 보기"):
+            st.dataframe(class_counts, use_container_width=True)
+        
+        st.subheader("상담자별 상담 건수")
+        counselor_counts = pd.DataFrame(by_counselor).rename(columns={"counselor": "상담자", "record_count": "상담 건수"})
+        st.bar_chart(counselor_counts, x="상담자", y="상담 건수")
+        
+        st.subheader("월별 상담 건수")
+        month_counts = pd.DataFrame(by_month)
+        month_counts["월"] = month_counts["month"].astype(str).str[:7]
+        st.bar_chart(month_counts.rename(columns={"record_count": "상담 건수"}), x="월", y="상담 건수")
 
 # 앱 실행
 if __name__ == "__main__":
-    if check_password():
-        main()
+    perf = get_perf_metrics()
+    perf.start_rerun()
+    try:
+        with perf.span("rerun", "script"):
+            if check_password():
+                main()
+    finally:
+        # 관리자 패널은 다음 실행에서 직전 실행의 측정 결과를 표시
+        st.session_state.perf_last_rerun = perf.finish_rerun()
+        perf.write_prometheus()
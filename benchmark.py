@@ -0,0 +1,333 @@
+"""초등학교 상담기록부 성능 측정 스크립트
+
+가상의 상담기록을 만들어 저장소에 채운 뒤, 조회/수정/삭제 화면이 사용하는 조회 경로를
+app.py의 데이터 함수로 직접 실행하여 지연 시간(p50/p95), 전송량, 최대 메모리를 측정합니다.
+
+사용 예:
+    python benchmark.py --records 10000
+    python benchmark.py --records 100000 --output .cache/benchmarks/v2.json --compare .cache/benchmarks/v1.json
+    STORAGE_BACKEND=supabase python benchmark.py --no-seed   # 이미 데이터가 있는 Supabase(또는 로컬 PostgREST)에 대해 측정
+    python benchmark.py --stub-latency 50   # 응답마다 50ms 지연되는 로컬 스텁 서버로 순차/동시 조회 비교
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import streamlit
+
+# Streamlit 실행 환경 밖에서 app.py의 함수를 호출할 때 나오는 경고는 표시하지 않음
+for logger_name in list(logging.root.manager.loggerDict):
+    if logger_name.startswith("streamlit"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+import app
+
+# 가상 데이터 재료
+SURNAMES = "김이박최정강조윤장임한오서신권황안송류전홍고문양손배백허유남심노하곽성차주우구민진나지엄채원천방공현함변염여추도소석선설마길연위표명기반왕금옥육인맹제모탁국어은편용예경봉사부가복태목형피두감호제"
+GIVEN_SYLLABLES = "민서지하도윤준우현수예은채연주원시아유진성호재경태혜인승희동영소나리가온빈"
+COUNSELORS = ["김선생", "이선생", "박선생", "최선생", "정선생", "강선생", "조선생", "윤선생", "장선생", "임선생"]
+TOPICS = [
+    "교우관계", "학습 태도", "수업 집중력", "가정 환경", "진로 고민", "정서 상태", "생활 습관",
+    "학교 폭력 예방", "학부모 상담", "건강 문제", "방과후 활동", "독서 습관", "스마트폰 사용",
+]
+OBSERVATIONS = [
+    "학생이 {topic} 문제로 어려움을 호소함.",
+    "{topic}와 관련하여 최근 변화가 관찰됨.",
+    "담임 교사가 {topic}에 대해 면담을 진행함.",
+    "학생 스스로 {topic}에 대한 고민을 이야기함.",
+    "보호자와 {topic} 관련 내용을 공유함.",
+]
+FOLLOW_UPS = [
+    "다음 주에 다시 면담하기로 함.",
+    "학부모와 전화 상담 예정.",
+    "수업 시간에 지속적으로 관찰하기로 함.",
+    "전문상담교사에게 연계함.",
+    "칭찬과 격려를 통해 자신감을 높이도록 지도함.",
+    "또래 도우미를 연결해 주기로 함.",
+]
+
+def generate_records(count: int, seed: int = 42, years: int = 5):
+    """counseling_records 스키마에 맞는 가상 상담기록 생성 (결과는 seed로 재현 가능)"""
+    rng = random.Random(seed)
+    students = [
+        (rng.choice(SURNAMES) + rng.choice(GIVEN_SYLLABLES) + rng.choice(GIVEN_SYLLABLES), rng.randint(1, 6), rng.randint(1, 12))
+        for _ in range(max(count // 8, 1))
+    ]
+    start = date.today() - timedelta(days=365 * years)
+    span = (date.today() - start).days
+    for _ in range(count):
+        name, grade, class_num = rng.choice(students)
+        consult_date = start + timedelta(days=rng.randint(0, span))
+        topic = rng.choice(TOPICS)
+        sentences = [rng.choice(OBSERVATIONS).format(topic=topic) for _ in range(rng.randint(2, 6))]
+        sentences.append(rng.choice(FOLLOW_UPS))
+        yield {
+            "student_name": name,
+            "grade": grade,
+            "class_num": class_num,
+            "consult_date": consult_date.isoformat(),
+            "consult_content": " ".join(sentences),
+            "counselor": rng.choice(COUNSELORS),
+            "notes": rng.choice(FOLLOW_UPS) if rng.random() < 0.4 else None,
+            "created_at": datetime.combine(consult_date, datetime.min.time()).isoformat(),
+        }
+
+def seed_store(store, count: int, seed: int, batch_size: int = 5000) -> float:
+    """저장소에 가상 기록을 채우고 소요 시간(초) 반환"""
+    started = time.perf_counter()
+    batch = []
+    for row in generate_records(count, seed):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            _insert_batch(store, batch)
+            batch = []
+    if batch:
+        _insert_batch(store, batch)
+    return time.perf_counter() - started
+
+def _insert_batch(store, batch):
+    if hasattr(store, "load_rows"):
+        store.load_rows(batch)
+    else:
+        store.insert_records(batch)
+
+def build_paths(store, rng: random.Random):
+    """화면별 조회 경로 - (이름, 실행 함수) 목록"""
+    first_page, next_cursor = app.fetch_records_page(store, app.build_record_filters("", "전체", "전체"))
+    sample = first_page[0] if first_page else {}
+    name = sample.get("student_name", "")
+    record_id = sample.get("id")
+    topic = rng.choice(TOPICS)
+    students = app.search_students(store, name) if name else []
+    student_id = students[0]["id"] if students else None
+    
+    def export_walk(fmt: str):
+        # 화면과 같이 메모리에 만들고, 내려받을 파일 내용을 반환 (크기 = 실제 파일 크기)
+        buffer = io.BytesIO()
+        app.export_records(store, app.build_record_filters("", str(sample.get("grade", 1)), "전체"), fmt, buffer)
+        return buffer.getvalue()
+    
+    paths = [
+        ("조회: 첫 페이지", lambda: app.fetch_records_page(store, app.build_record_filters("", "전체", "전체"))),
+        ("조회: 지난 학년도 포함", lambda: app.fetch_records_page(store, app.build_record_filters("", "전체", "전체", include_past=True))),
+        ("조회: 다음 페이지", lambda: app.fetch_records_page(store, app.build_record_filters("", "전체", "전체"), cursor=next_cursor)),
+        ("조회: 이름 검색", lambda: app.fetch_records_page(store, app.build_record_filters(name[1:], "전체", "전체"))),
+        ("조회: 학년/반 필터", lambda: app.fetch_records_page(store, app.build_record_filters("", "3", "2"))),
+        ("조회: 상담 내용 열기", lambda: app.fetch_record(store, record_id)),
+        ("조회: 내용 검색", lambda: app.search_records(store, topic, app.build_record_filters("", "전체", "전체"))),
+        ("학생 이력: 학생 검색", lambda: app.search_students(store, name)),
+        ("학생 이력: 기록 목록", lambda: app.fetch_student_timeline(store, student_id)),
+        ("수정/삭제: 선택 목록", lambda: app.search_record_options(store, "")),
+        ("수정/삭제: 이름 검색", lambda: app.search_record_options(store, name)),
+        ("수정/삭제: 기록 불러오기", lambda: app.fetch_record(store, record_id)),
+        ("내보내기: 한 학년 CSV", lambda: export_walk("csv")),
+    ]
+    if app.PYARROW_AVAILABLE:
+        paths.append(("내보내기: 한 학년 Parquet", lambda: export_walk("parquet")))
+    return paths
+
+# 스텁 서버 설정
+STUB_OPEN_RECORDS = 5  # 조회 화면에서 한 번에 열어 둔 기록 수
+
+class StubPostgRESTHandler(BaseHTTPRequestHandler):
+    """Supabase REST(PostgREST) 흉내 - 모든 GET 요청에 latency만큼 기다린 뒤 가상 행을 반환
+
+    연결 재사용(keep-alive)을 위해 HTTP/1.1로 응답하며, 서버는 요청마다 스레드를 만들어
+    동시에 들어온 요청을 함께 처리합니다.
+    """
+    protocol_version = "HTTP/1.1"
+    latency = 0.05
+    rows = []
+    
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        rows = self.rows
+        record_id = parse_qs(url.query).get("id", [""])[0]
+        if record_id.startswith("eq."):
+            rows = [{**rows[0], "id": int(record_id[3:])}]
+        body = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(latency_ms: float, seed: int) -> ThreadingHTTPServer:
+    """로컬 스텁 서버를 빈 포트에서 시작 (백그라운드 스레드)"""
+    handler = type("Handler", (StubPostgRESTHandler,), {
+        "latency": latency_ms / 1000,
+        "rows": [dict(row, id=i + 1) for i, row in enumerate(generate_records(20, seed))],
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-postgrest", daemon=True).start()
+    return server
+
+def build_stub_paths(store):
+    """여러 조회를 함께 하는 화면 경로 - 순차 실행과 동시 실행을 각각 측정"""
+    record_ids = list(range(1, STUB_OPEN_RECORDS + 1))
+    paths = [
+        ("통계: 집계 3개", lambda: app.fetch_statistics(store)),
+        (f"조회: 열린 기록 {STUB_OPEN_RECORDS}건", lambda: app.prefetch_records(store, record_ids)),
+    ]
+    
+    def with_concurrency(fn, concurrency):
+        def run():
+            previous, app.QUERY_CONCURRENCY = app.QUERY_CONCURRENCY, concurrency
+            try:
+                return fn()
+            finally:
+                app.QUERY_CONCURRENCY = previous
+        return run
+    
+    return [
+        (f"{name} ({label})", with_concurrency(fn, concurrency))
+        for name, fn in paths
+        for label, concurrency in [("순차", 1), ("동시", app.QUERY_CONCURRENCY)]
+    ]
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+def measure(fn, repeat: int) -> dict:
+    """캐시를 비운 상태로 repeat번 실행하여 지연 시간, 결과 크기, 최대 메모리 측정
+
+    결과 크기는 조회 결과를 JSON으로 직렬화한 크기이며, 내보내기처럼 파일 내용(bytes)을
+    반환하는 경로는 그 파일의 실제 크기입니다.
+    """
+    latencies = []
+    for _ in range(repeat):
+        app.invalidate_query_cache()
+        started = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    
+    app.invalidate_query_cache()
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "max_ms": round(max(latencies), 3),
+        "bytes": len(result) if isinstance(result, bytes) else app.payload_size(result),
+        "peak_memory_bytes": peak,
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+def compare(current: dict, baseline: dict, threshold: float):
+    """이전 결과와 p95 비교 - threshold 배 이상 느려진 경로 목록 반환"""
+    regressions = []
+    print(f"\n이전 결과와 비교 ({baseline.get('revision', '?')} → {current.get('revision', '?')})")
+    for path, metrics in current["paths"].items():
+        before = baseline.get("paths", {}).get(path)
+        if not before:
+            continue
+        ratio = metrics["p95_ms"] / before["p95_ms"] if before["p95_ms"] else 1.0
+        mark = "⚠️" if ratio >= threshold else "  "
+        print(f"{mark} {path:<20} p95 {before['p95_ms']:>9.2f}ms → {metrics['p95_ms']:>9.2f}ms (x{ratio:.2f})")
+        if ratio >= threshold:
+            regressions.append(path)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="상담기록부 조회 경로 성능 측정")
+    parser.add_argument("--records", type=int, default=10000, help="생성할 가상 기록 수 (기본 10000)")
+    parser.add_argument("--repeat", type=int, default=30, help="경로별 반복 횟수 (기본 30)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", default=None, help="SQLite 파일 경로 (기본: 임시 파일)")
+    parser.add_argument("--no-seed", action="store_true", help="데이터를 생성하지 않고 기존 저장소에 대해 측정")
+    parser.add_argument("--output", default=None, help="결과 JSON 경로 (기본: .cache/benchmarks/bench-<기록 수>-<시각>.json)")
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 JSON")
+    parser.add_argument("--threshold", type=float, default=1.5, help="회귀로 판단할 p95 배율 (기본 1.5)")
+    parser.add_argument("--stub-latency", type=float, default=None, metavar="MS",
+                        help="응답마다 MS만큼 지연되는 로컬 스텁 서버에 대해 여러 조회를 순차/동시로 실행하여 비교")
+    args = parser.parse_args()
+    
+    backend = os.getenv("STORAGE_BACKEND", "local").strip().lower()
+    if args.stub_latency is not None:
+        backend = "stub"
+        args.no_seed = True
+        server = start_stub_server(args.stub_latency, args.seed)
+        store = app.SupabaseStore(app.create_client(f"http://127.0.0.1:{server.server_port}", "stub.stub.stub"))
+    elif backend == "local":
+        db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="counseling_bench_"), "bench.sqlite3")
+        store = app.SQLiteStore(db_path)
+    else:
+        store = app.SupabaseStore(app.init_supabase())
+    
+    seed_seconds = None
+    if not args.no_seed:
+        print(f"가상 기록 {args.records:,}개 생성 중...")
+        seed_seconds = seed_store(store, args.records, args.seed)
+        print(f"  완료 ({seed_seconds:.1f}초)")
+    
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "backend": backend,
+        "records": args.records,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "seed_seconds": seed_seconds,
+        "stub_latency_ms": args.stub_latency,
+        "paths": {},
+    }
+    
+    rng = random.Random(args.seed)
+    print(f"\n{'경로':<20} {'p50(ms)':>9} {'p95(ms)':>9} {'전송량(KB)':>10} {'최대 메모리(KB)':>14}")
+    paths = build_stub_paths(store) if backend == "stub" else build_paths(store, rng)
+    for name, fn in paths:
+        metrics = measure(fn, args.repeat)
+        results["paths"][name] = metrics
+        print(f"{name:<20} {metrics['p50_ms']:>9.2f} {metrics['p95_ms']:>9.2f} "
+              f"{metrics['bytes'] / 1024:>10.1f} {metrics['peak_memory_bytes'] / 1024:>14.1f}")
+    
+    output = args.output or os.path.join(
+        ".cache", "benchmarks", f"bench-{args.records}-{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    )
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n결과 저장: {output}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n⚠️ p95가 {args.threshold}배 이상 느려진 경로: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+-- 상담기록 조회 목록의 키셋 페이지네이션용 인덱스
+-- (consult_date DESC, id DESC) 정렬 순서와 커서 조건을 인덱스만으로 처리합니다.
+-- Supabase SQL Editor에서 supabase_setup.sql 실행 후 적용하세요
+
+CREATE INDEX IF NOT EXISTS idx_consult_date_id
+    ON counseling_records (consult_date DESC, id DESC);
+
+SELECT 'Migration 001 applied!' AS status;
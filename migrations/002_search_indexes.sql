@@ -0,0 +1,75 @@
+-- 학생 이름 부분 검색 및 상담 내용 전문 검색
+-- Supabase SQL Editor에서 001 마이그레이션 이후 적용하세요
+
+-- 1. 학생 이름 부분 일치 검색 (ILIKE '%이름%')
+-- B-tree 인덱스(idx_student_name)는 앞부분이 고정되지 않은 패턴에 사용할 수 없으므로
+-- pg_trgm GIN 인덱스를 추가합니다.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_student_name_trgm
+    ON counseling_records USING gin (student_name gin_trgm_ops);
+
+-- 2. 상담 내용 + 비고 전문 검색
+-- 한국어는 조사가 단어에 붙어 있어 공백 단위 토큰('simple' 설정)으로는 검색이 잘 되지 않으므로
+-- 2글자 단위(bigram)로 나눈 tsvector를 색인합니다. 예: '집중력이' -> '집중', '중력', '력이'
+CREATE OR REPLACE FUNCTION korean_bigram_tsvector(doc TEXT)
+RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT coalesce(array_to_tsvector(array_agg(DISTINCT substr(w, i, 2))), ''::tsvector)
+    FROM regexp_split_to_table(lower(coalesce(doc, '')), '[^[:alnum:]]+') AS w,
+         generate_series(1, greatest(char_length(w) - 1, 1)) AS i
+    WHERE w <> ''
+$$;
+
+-- 검색어의 모든 bigram을 AND로 묶은 tsquery
+CREATE OR REPLACE FUNCTION korean_bigram_tsquery(search_query TEXT)
+RETURNS tsquery
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT coalesce(string_agg(DISTINCT quote_literal(substr(w, i, 2)), ' & ')::tsquery, ''::tsquery)
+    FROM regexp_split_to_table(lower(coalesce(search_query, '')), '[^[:alnum:]]+') AS w,
+         generate_series(1, greatest(char_length(w) - 1, 1)) AS i
+    WHERE w <> ''
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_content_bigram
+    ON counseling_records USING gin (korean_bigram_tsvector(consult_content || ' ' || coalesce(notes, '')));
+
+-- 3. 검색 함수 (앱에서 supabase.rpc("search_counseling_records", ...)로 호출)
+-- 관련도 순으로 정렬하고, 전체 내용 대신 검색어 주변 미리보기(snippet)만 반환합니다.
+CREATE OR REPLACE FUNCTION search_counseling_records(
+    search_query TEXT,
+    filter_name TEXT DEFAULT NULL,
+    filter_grade INTEGER DEFAULT NULL,
+    filter_class INTEGER DEFAULT NULL,
+    max_results INTEGER DEFAULT 50
+)
+RETURNS TABLE (
+    id BIGINT,
+    student_name TEXT,
+    grade INTEGER,
+    class_num INTEGER,
+    consult_date DATE,
+    counselor TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    snippet TEXT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT r.id, r.student_name, r.grade, r.class_num, r.consult_date, r.counselor, r.created_at,
+           ts_rank(korean_bigram_tsvector(r.consult_content || ' ' || coalesce(r.notes, '')), q.query) AS rank,
+           substring(d.doc FROM greatest(strpos(lower(d.doc), q.first_word) - 40, 1) FOR 160) AS snippet
+    FROM counseling_records r
+    CROSS JOIN (
+        SELECT korean_bigram_tsquery(search_query) AS query,
+               lower(split_part(trim(search_query), ' ', 1)) AS first_word
+    ) q
+    CROSS JOIN LATERAL (SELECT r.consult_content || ' ' || coalesce(r.notes, '') AS doc) d
+    WHERE korean_bigram_tsvector(r.consult_content || ' ' || coalesce(r.notes, '')) @@ q.query
+      AND (filter_name IS NULL OR r.student_name ILIKE '%' || filter_name || '%')
+      AND (filter_grade IS NULL OR r.grade = filter_grade)
+      AND (filter_class IS NULL OR r.class_num = filter_class)
+    ORDER BY rank DESC, r.consult_date DESC, r.id DESC
+    LIMIT max_results
+$$;
+
+SELECT 'Migration 002 applied!' AS status;
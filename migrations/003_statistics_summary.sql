@@ -0,0 +1,126 @@
+-- 상담 통계용 요약 테이블
+-- 월 × 학년 × 반 × 상담자별 상담기록 수를 트리거로 바로 반영하므로,
+-- 통계 화면은 전체 기록 대신 작은 요약 결과만 읽습니다.
+-- Supabase SQL Editor에서 002 마이그레이션 이후 적용하세요
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS counseling_stats (
+    month DATE NOT NULL,
+    grade INTEGER NOT NULL,
+    class_num INTEGER NOT NULL,
+    counselor TEXT NOT NULL,
+    record_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, grade, class_num, counselor)
+);
+
+-- 트리거 함수 (문장 단위: 일괄 가져오기처럼 여러 행을 한 번에 저장해도 요약 테이블은 한 번만 갱신)
+CREATE OR REPLACE FUNCTION counseling_stats_on_insert()
+RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+    INSERT INTO counseling_stats AS s (month, grade, class_num, counselor, record_count)
+    SELECT date_trunc('month', consult_date)::date, grade, class_num, counselor, COUNT(*)
+    FROM new_rows
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (month, grade, class_num, counselor)
+    DO UPDATE SET record_count = s.record_count + EXCLUDED.record_count;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION counseling_stats_on_delete()
+RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+    UPDATE counseling_stats AS s
+    SET record_count = s.record_count - d.record_count
+    FROM (
+        SELECT date_trunc('month', consult_date)::date AS month, grade, class_num, counselor, COUNT(*) AS record_count
+        FROM old_rows
+        GROUP BY 1, 2, 3, 4
+    ) d
+    WHERE s.month = d.month AND s.grade = d.grade AND s.class_num = d.class_num AND s.counselor = d.counselor;
+
+    DELETE FROM counseling_stats WHERE record_count <= 0;
+    RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION counseling_stats_on_update()
+RETURNS trigger
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+BEGIN
+    UPDATE counseling_stats AS s
+    SET record_count = s.record_count - d.record_count
+    FROM (
+        SELECT date_trunc('month', consult_date)::date AS month, grade, class_num, counselor, COUNT(*) AS record_count
+        FROM old_rows
+        GROUP BY 1, 2, 3, 4
+    ) d
+    WHERE s.month = d.month AND s.grade = d.grade AND s.class_num = d.class_num AND s.counselor = d.counselor;
+
+    INSERT INTO counseling_stats AS s (month, grade, class_num, counselor, record_count)
+    SELECT date_trunc('month', consult_date)::date, grade, class_num, counselor, COUNT(*)
+    FROM new_rows
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (month, grade, class_num, counselor)
+    DO UPDATE SET record_count = s.record_count + EXCLUDED.record_count;
+
+    DELETE FROM counseling_stats WHERE record_count <= 0;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_counseling_stats_insert ON counseling_records;
+CREATE TRIGGER trg_counseling_stats_insert
+    AFTER INSERT ON counseling_records
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_insert();
+
+DROP TRIGGER IF EXISTS trg_counseling_stats_update ON counseling_records;
+CREATE TRIGGER trg_counseling_stats_update
+    AFTER UPDATE ON counseling_records
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_update();
+
+DROP TRIGGER IF EXISTS trg_counseling_stats_delete ON counseling_records;
+CREATE TRIGGER trg_counseling_stats_delete
+    AFTER DELETE ON counseling_records
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_delete();
+
+-- 기존 기록으로 요약 테이블 채우기 (적용 중 다른 쓰기가 끼어들지 않도록 잠금)
+LOCK TABLE counseling_records IN SHARE ROW EXCLUSIVE MODE;
+TRUNCATE counseling_stats;
+INSERT INTO counseling_stats (month, grade, class_num, counselor, record_count)
+SELECT date_trunc('month', consult_date)::date, grade, class_num, counselor, COUNT(*)
+FROM counseling_records
+GROUP BY 1, 2, 3, 4;
+
+-- 화면에서 읽는 집계 뷰 (요약 테이블만 읽음)
+CREATE OR REPLACE VIEW counseling_stats_by_class AS
+    SELECT grade, class_num, SUM(record_count)::INTEGER AS record_count
+    FROM counseling_stats
+    GROUP BY grade, class_num;
+
+CREATE OR REPLACE VIEW counseling_stats_by_counselor AS
+    SELECT counselor, SUM(record_count)::INTEGER AS record_count
+    FROM counseling_stats
+    GROUP BY counselor;
+
+CREATE OR REPLACE VIEW counseling_stats_by_month AS
+    SELECT month, SUM(record_count)::INTEGER AS record_count
+    FROM counseling_stats
+    GROUP BY month;
+
+-- RLS: 요약 테이블은 읽기만 허용 (쓰기는 트리거 함수가 담당)
+ALTER TABLE counseling_stats ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow read" ON counseling_stats;
+CREATE POLICY "Allow read" ON counseling_stats
+    FOR SELECT
+    USING (true);
+
+COMMIT;
+
+SELECT 'Migration 003 applied!' AS status;
@@ -0,0 +1,165 @@
+-- 학생 테이블과 학생별 상담 이력
+-- 상담기록마다 이름/학년/반을 따로 저장하던 것을 students 테이블로 묶어,
+-- 동명이인을 구분하고 한 학생의 이력을 인덱스만으로 조회할 수 있게 합니다.
+-- Supabase SQL Editor에서 003 마이그레이션 이후 적용하세요
+
+BEGIN;
+
+-- 1. 학년도 (3월 1일 시작)
+CREATE OR REPLACE FUNCTION school_year(d DATE)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT (extract(year FROM d) - CASE WHEN extract(month FROM d) < 3 THEN 1 ELSE 0 END)::INTEGER
+$$;
+
+-- 2. 학생 테이블
+-- 학생은 이름과 입학 학년도(1학년이 된 학년도)로 구분하며, grade/class_num은 현재 학년/반입니다.
+CREATE TABLE IF NOT EXISTS students (
+    id BIGSERIAL PRIMARY KEY,
+    name TEXT NOT NULL,
+    entry_year INTEGER NOT NULL,
+    grade INTEGER NOT NULL CHECK (grade >= 1 AND grade <= 6),
+    class_num INTEGER NOT NULL CHECK (class_num >= 1 AND class_num <= 20),
+    graduated_year INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_students_name_entry ON students(name, entry_year);
+CREATE INDEX IF NOT EXISTS idx_students_name_trgm ON students USING gin (name gin_trgm_ops);
+
+-- 입학 학년도 기준 현재 학년 (졸업생은 6)
+CREATE OR REPLACE FUNCTION student_current_grade(entry_year INTEGER, target_school_year INTEGER)
+RETURNS INTEGER
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT least(greatest(target_school_year - entry_year + 1, 1), 6)
+$$;
+
+-- 3. 기존 기록에서 학생 만들기 (이름 + 입학 학년도가 같으면 같은 학생, 반은 가장 최근 기록 기준)
+LOCK TABLE counseling_records IN SHARE ROW EXCLUSIVE MODE;
+
+ALTER TABLE counseling_records ADD COLUMN IF NOT EXISTS student_id BIGINT REFERENCES students(id);
+
+INSERT INTO students (name, entry_year, grade, class_num, graduated_year)
+SELECT DISTINCT ON (r.student_name, r.entry_year)
+       r.student_name,
+       r.entry_year,
+       student_current_grade(r.entry_year, school_year(current_date)),
+       r.class_num,
+       CASE WHEN school_year(current_date) - r.entry_year + 1 > 6 THEN r.entry_year + 5 END
+FROM (
+    SELECT student_name, school_year(consult_date) - grade + 1 AS entry_year, class_num, consult_date, id
+    FROM counseling_records
+    WHERE student_id IS NULL
+) r
+WHERE NOT EXISTS (SELECT 1 FROM students s WHERE s.name = r.student_name AND s.entry_year = r.entry_year)
+ORDER BY r.student_name, r.entry_year, r.consult_date DESC, r.id DESC;
+
+UPDATE counseling_records r
+SET student_id = s.id
+FROM students s
+WHERE r.student_id IS NULL
+  AND s.name = r.student_name
+  AND s.entry_year = school_year(r.consult_date) - r.grade + 1;
+
+ALTER TABLE counseling_records ALTER COLUMN student_id SET NOT NULL;
+
+-- 같은 학년도에 서로 다른 반 기록이 있는 학생 (동명이인이 하나로 합쳐졌을 수 있으므로 확인 필요)
+CREATE OR REPLACE VIEW student_merge_review AS
+    SELECT s.id AS student_id, s.name, s.entry_year, school_year(r.consult_date) AS school_year,
+           array_agg(DISTINCT r.class_num ORDER BY r.class_num) AS class_nums, COUNT(*) AS record_count
+    FROM students s
+    JOIN counseling_records r ON r.student_id = s.id
+    GROUP BY s.id, s.name, s.entry_year, school_year(r.consult_date)
+    HAVING COUNT(DISTINCT r.class_num) > 1;
+
+-- 4. 새 기록의 학생 연결 (앱, 일괄 가져오기, 동기화 등 모든 경로에서 student_id를 자동으로 채움)
+CREATE OR REPLACE FUNCTION resolve_student_id(p_name TEXT, p_grade INTEGER, p_class INTEGER, p_date DATE)
+RETURNS BIGINT
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_entry_year INTEGER := school_year(p_date) - p_grade + 1;
+    v_id BIGINT;
+BEGIN
+    -- 같은 학생이 동시에 두 번 만들어지지 않도록 이름 단위로 잠금
+    PERFORM pg_advisory_xact_lock(hashtext(p_name));
+    SELECT id INTO v_id
+    FROM students
+    WHERE name = p_name AND entry_year = v_entry_year
+    ORDER BY (class_num = p_class) DESC, id
+    LIMIT 1;
+    IF v_id IS NULL THEN
+        INSERT INTO students (name, entry_year, grade, class_num, graduated_year)
+        VALUES (
+            p_name,
+            v_entry_year,
+            student_current_grade(v_entry_year, school_year(current_date)),
+            p_class,
+            CASE WHEN school_year(current_date) - v_entry_year + 1 > 6 THEN v_entry_year + 5 END
+        )
+        RETURNING id INTO v_id;
+    END IF;
+    RETURN v_id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION counseling_records_set_student()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' AND NEW.student_id IS NOT NULL THEN
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'UPDATE' AND (
+        NEW.student_id IS DISTINCT FROM OLD.student_id
+        OR (NEW.student_name, NEW.grade, NEW.class_num, NEW.consult_date)
+           IS NOT DISTINCT FROM (OLD.student_name, OLD.grade, OLD.class_num, OLD.consult_date)
+    ) THEN
+        RETURN NEW;
+    END IF;
+    NEW.student_id := resolve_student_id(NEW.student_name, NEW.grade, NEW.class_num, NEW.consult_date);
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_counseling_records_student ON counseling_records;
+CREATE TRIGGER trg_counseling_records_student
+    BEFORE INSERT OR UPDATE ON counseling_records
+    FOR EACH ROW EXECUTE FUNCTION counseling_records_set_student();
+
+-- 5. 학생별 이력 조회 인덱스
+-- 목록에 표시하는 컬럼을 INCLUDE하여 한 학생의 이력을 테이블을 읽지 않고(index-only scan) 조회
+CREATE INDEX IF NOT EXISTS idx_records_student_date
+    ON counseling_records (student_id, consult_date DESC, id DESC)
+    INCLUDE (student_name, grade, class_num, counselor, created_at);
+
+-- 6. 새 학년도 학년 올리기 (앱에서 supabase.rpc("rollover_student_grades", ...)로 호출)
+-- 입학 학년도로 학년을 다시 계산하므로 여러 번 실행해도 결과가 같습니다. 반은 그대로 두며,
+-- 6학년을 마친 학생은 졸업 처리합니다. 변경된 학생 수를 반환합니다.
+CREATE OR REPLACE FUNCTION rollover_student_grades(target_school_year INTEGER DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_year INTEGER := coalesce(target_school_year, school_year(current_date));
+    v_count INTEGER;
+BEGIN
+    UPDATE students
+    SET grade = student_current_grade(entry_year, v_year),
+        graduated_year = CASE WHEN v_year - entry_year + 1 > 6 THEN entry_year + 5 END
+    WHERE graduated_year IS NULL
+      AND (grade <> student_current_grade(entry_year, v_year) OR v_year - entry_year + 1 > 6);
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+-- RLS 정책 (counseling_records와 같음)
+ALTER TABLE students ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations" ON students;
+CREATE POLICY "Allow all operations" ON students
+    FOR ALL
+    USING (true)
+    WITH CHECK (true);
+
+COMMIT;
+
+SELECT 'Migration 004 applied!' AS status;
@@ -0,0 +1,30 @@
+-- 상담기록 버전 관리 (동시 수정 충돌 확인)
+-- 수정할 때마다 version이 1씩 늘어나므로, 앱은 불러온 시점의 version과 같을 때만 수정하여
+-- 다른 사람이 먼저 저장한 내용을 덮어쓰지 않습니다.
+-- Supabase SQL Editor에서 004 마이그레이션 이후 적용하세요
+
+BEGIN;
+
+ALTER TABLE counseling_records ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE counseling_records ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION counseling_records_bump_version()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_counseling_records_version ON counseling_records;
+CREATE TRIGGER trg_counseling_records_version
+    BEFORE UPDATE ON counseling_records
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION counseling_records_bump_version();
+
+COMMIT;
+
+SELECT 'Migration 005 applied!' AS status;
@@ -0,0 +1,210 @@
+-- 학년도별 파티션
+-- counseling_records를 학년도(3월 1일 ~ 다음 해 2월 말일) 단위 파티션으로 나눕니다.
+-- 앱은 기본적으로 올해 학년도 기록만 조회하므로(consult_date >= 학년도 시작일) 올해 파티션만 읽고,
+-- "지난 학년도 기록 포함"을 선택했을 때만 지난 학년도 파티션을 함께 읽습니다.
+-- PostgreSQL 13 이상이 필요합니다. Supabase SQL Editor에서 005 마이그레이션 이후 적용하세요
+
+BEGIN;
+
+-- 1. 기존 테이블을 옮겨 두고 같은 컬럼의 파티션 테이블 만들기
+-- (파티션 테이블의 기본 키에는 파티션 키가 포함되어야 하므로 (id, consult_date))
+LOCK TABLE counseling_records IN ACCESS EXCLUSIVE MODE;
+ALTER TABLE counseling_records RENAME TO counseling_records_unpartitioned;
+
+CREATE TABLE counseling_records (
+    id BIGINT NOT NULL DEFAULT nextval('counseling_records_id_seq'),
+    student_name TEXT NOT NULL,
+    grade INTEGER NOT NULL CHECK (grade >= 1 AND grade <= 6),
+    class_num INTEGER NOT NULL CHECK (class_num >= 1 AND class_num <= 20),
+    consult_date DATE NOT NULL,
+    consult_content TEXT NOT NULL,
+    counselor TEXT NOT NULL,
+    notes TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    student_id BIGINT NOT NULL REFERENCES students(id),
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, consult_date)
+) PARTITION BY RANGE (consult_date);
+
+-- 아직 파티션이 없는 학년도의 기록을 받는 기본 파티션
+CREATE TABLE counseling_records_default PARTITION OF counseling_records DEFAULT;
+ALTER TABLE counseling_records_default ENABLE ROW LEVEL SECURITY;
+
+-- 2. 학년도 파티션 만들기 (이미 있으면 그대로 두고, 기본 파티션에 들어간 해당 학년도 기록은 새 파티션으로 옮김)
+-- 파티션을 만들고 붙이려면 테이블 소유자 권한이 필요하므로 SECURITY DEFINER로 실행하고,
+-- 앱(anon)이 RPC로 직접 호출하지는 못하게 실행 권한을 막음 (rollover_student_grades를 통해서만 호출)
+CREATE OR REPLACE FUNCTION ensure_school_year_partition(target_school_year INTEGER)
+RETURNS TEXT
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+DECLARE
+    v_name TEXT := format('counseling_records_%s', target_school_year);
+    v_from DATE := make_date(target_school_year, 3, 1);
+    v_to DATE := make_date(target_school_year + 1, 3, 1);
+BEGIN
+    -- 같은 파티션이 동시에 두 번 만들어지지 않도록 잠금
+    PERFORM pg_advisory_xact_lock(hashtext('counseling_records_partitions'));
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN v_name;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE counseling_records INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM counseling_records_default WHERE consult_date >= %L AND consult_date < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        v_from, v_to, v_name
+    );
+    EXECUTE format('ALTER TABLE counseling_records ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', v_name, v_from, v_to);
+    -- 파티션은 counseling_records를 통해서만 읽도록 직접 접근은 막음 (정책 없는 RLS)
+    EXECUTE format('ALTER TABLE %I ENABLE ROW LEVEL SECURITY', v_name);
+    RETURN v_name;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION ensure_school_year_partition(INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- 기존 기록이 있는 학년도와 올해, 내년 학년도 파티션
+SELECT ensure_school_year_partition(y)
+FROM (
+    SELECT DISTINCT school_year(consult_date) AS y FROM counseling_records_unpartitioned
+    UNION
+    SELECT school_year(current_date)
+    UNION
+    SELECT school_year(current_date) + 1
+) years
+ORDER BY y;
+
+-- 3. 기록 옮기기 (트리거를 만들기 전이므로 통계 요약과 버전은 그대로 유지됨)
+INSERT INTO counseling_records (
+    id, student_name, grade, class_num, consult_date, consult_content, counselor, notes, created_at,
+    student_id, version, updated_at
+)
+SELECT id, student_name, grade, class_num, consult_date, consult_content, counselor, notes, created_at,
+       student_id, version, updated_at
+FROM counseling_records_unpartitioned;
+
+-- 기존 테이블을 지워도 id 시퀀스는 남도록 새 테이블로 소유권 이전
+ALTER SEQUENCE counseling_records_id_seq OWNED BY counseling_records.id;
+
+-- 기존 테이블을 참조하던 뷰를 새 테이블로 다시 만든 뒤 기존 테이블 삭제
+CREATE OR REPLACE VIEW student_merge_review AS
+    SELECT s.id AS student_id, s.name, s.entry_year, school_year(r.consult_date) AS school_year,
+           array_agg(DISTINCT r.class_num ORDER BY r.class_num) AS class_nums, COUNT(*) AS record_count
+    FROM students s
+    JOIN counseling_records r ON r.student_id = s.id
+    GROUP BY s.id, s.name, s.entry_year, school_year(r.consult_date)
+    HAVING COUNT(DISTINCT r.class_num) > 1;
+
+DROP TABLE counseling_records_unpartitioned;
+
+-- 4. 인덱스 (파티션마다 같은 인덱스가 자동으로 만들어짐)
+CREATE INDEX idx_student_name ON counseling_records(student_name);
+CREATE INDEX idx_grade_class ON counseling_records(grade, class_num);
+CREATE INDEX idx_consult_date_id ON counseling_records (consult_date DESC, id DESC);
+CREATE INDEX idx_student_name_trgm ON counseling_records USING gin (student_name gin_trgm_ops);
+CREATE INDEX idx_content_bigram
+    ON counseling_records USING gin (korean_bigram_tsvector(consult_content || ' ' || coalesce(notes, '')));
+CREATE INDEX idx_records_student_date
+    ON counseling_records (student_id, consult_date DESC, id DESC)
+    INCLUDE (student_name, grade, class_num, counselor, created_at);
+
+-- 5. 트리거 (003 통계 요약, 004 학생 연결, 005 버전)
+CREATE TRIGGER trg_counseling_stats_insert
+    AFTER INSERT ON counseling_records
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_insert();
+
+CREATE TRIGGER trg_counseling_stats_update
+    AFTER UPDATE ON counseling_records
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_update();
+
+CREATE TRIGGER trg_counseling_stats_delete
+    AFTER DELETE ON counseling_records
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION counseling_stats_on_delete();
+
+CREATE TRIGGER trg_counseling_records_student
+    BEFORE INSERT OR UPDATE ON counseling_records
+    FOR EACH ROW EXECUTE FUNCTION counseling_records_set_student();
+
+CREATE TRIGGER trg_counseling_records_version
+    BEFORE UPDATE ON counseling_records
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION counseling_records_bump_version();
+
+-- 6. 검색 함수에 학년도 조건 추가 (filter_date_from 이후 기록만 검색하여 지난 파티션은 읽지 않음)
+DROP FUNCTION IF EXISTS search_counseling_records(TEXT, TEXT, INTEGER, INTEGER, INTEGER);
+CREATE OR REPLACE FUNCTION search_counseling_records(
+    search_query TEXT,
+    filter_name TEXT DEFAULT NULL,
+    filter_grade INTEGER DEFAULT NULL,
+    filter_class INTEGER DEFAULT NULL,
+    max_results INTEGER DEFAULT 50,
+    filter_date_from DATE DEFAULT NULL
+)
+RETURNS TABLE (
+    id BIGINT,
+    student_name TEXT,
+    grade INTEGER,
+    class_num INTEGER,
+    consult_date DATE,
+    counselor TEXT,
+    created_at TIMESTAMP WITH TIME ZONE,
+    rank REAL,
+    snippet TEXT
+)
+LANGUAGE sql STABLE AS $$
+    SELECT r.id, r.student_name, r.grade, r.class_num, r.consult_date, r.counselor, r.created_at,
+           ts_rank(korean_bigram_tsvector(r.consult_content || ' ' || coalesce(r.notes, '')), q.query) AS rank,
+           substring(d.doc FROM greatest(strpos(lower(d.doc), q.first_word) - 40, 1) FOR 160) AS snippet
+    FROM counseling_records r
+    CROSS JOIN (
+        SELECT korean_bigram_tsquery(search_query) AS query,
+               lower(split_part(trim(search_query), ' ', 1)) AS first_word
+    ) q
+    CROSS JOIN LATERAL (SELECT r.consult_content || ' ' || coalesce(r.notes, '') AS doc) d
+    WHERE korean_bigram_tsvector(r.consult_content || ' ' || coalesce(r.notes, '')) @@ q.query
+      AND r.consult_date >= coalesce(filter_date_from, '-infinity'::date)
+      AND (filter_name IS NULL OR r.student_name ILIKE '%' || filter_name || '%')
+      AND (filter_grade IS NULL OR r.grade = filter_grade)
+      AND (filter_class IS NULL OR r.class_num = filter_class)
+    ORDER BY rank DESC, r.consult_date DESC, r.id DESC
+    LIMIT max_results
+$$;
+
+-- 7. 새 학년도 학년 올리기에서 올해와 내년 학년도 파티션도 미리 만들기
+-- (앱의 "🎓 새 학년도 학년 올리기" 또는 pg_cron으로 매년 3월 1일에 실행:
+--  SELECT cron.schedule('school-year-rollover', '0 0 1 3 *', 'SELECT rollover_student_grades()');)
+-- 앱은 anon 키로 호출하므로 파티션 생성을 위해 SECURITY DEFINER(소유자 권한)로 실행
+CREATE OR REPLACE FUNCTION rollover_student_grades(target_school_year INTEGER DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql SECURITY DEFINER SET search_path = public AS $$
+DECLARE
+    v_year INTEGER := coalesce(target_school_year, school_year(current_date));
+    v_count INTEGER;
+BEGIN
+    PERFORM ensure_school_year_partition(v_year);
+    PERFORM ensure_school_year_partition(v_year + 1);
+
+    UPDATE students
+    SET grade = student_current_grade(entry_year, v_year),
+        graduated_year = CASE WHEN v_year - entry_year + 1 > 6 THEN entry_year + 5 END
+    WHERE graduated_year IS NULL
+      AND (grade <> student_current_grade(entry_year, v_year) OR v_year - entry_year + 1 > 6);
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    RETURN v_count;
+END;
+$$;
+
+-- RLS 정책 (기존 테이블과 같음)
+ALTER TABLE counseling_records ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Allow all operations" ON counseling_records;
+CREATE POLICY "Allow all operations" ON counseling_records
+    FOR ALL
+    USING (true)
+    WITH CHECK (true);
+
+COMMIT;
+
+SELECT 'Migration 006 applied!' AS status;
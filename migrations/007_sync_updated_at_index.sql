@@ -0,0 +1,9 @@
+-- 로컬 사본(local_first) 증분 동기화용 인덱스
+-- 앱은 마지막으로 받은 (updated_at, id) 다음에 추가/수정된 기록만 (updated_at, id) 순으로 받아 오므로
+-- 전체 기록을 읽지 않고 인덱스 범위만 읽습니다. (파티션마다 같은 인덱스가 자동으로 만들어짐)
+-- Supabase SQL Editor에서 006 마이그레이션 이후 적용하세요
+
+CREATE INDEX IF NOT EXISTS idx_records_updated_at_id
+    ON counseling_records (updated_at, id);
+
+SELECT 'Migration 007 applied!' AS status;
@@ -0,0 +1,47 @@
+import logging
+import os
+import sys
+
+import pytest
+
+# 측정 로그는 남기지 않고, app.py는 저장소 최상위에서 불러옴
+os.environ["PERF_LOG_PATH"] = ""
+os.environ["PERF_PROM_PATH"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import streamlit
+
+# Streamlit 실행 환경 밖에서 app.py의 함수를 호출할 때 나오는 경고는 표시하지 않음
+for logger_name in list(logging.root.manager.loggerDict):
+    if logger_name.startswith("streamlit"):
+        logging.getLogger(logger_name).setLevel(logging.ERROR)
+
+import app
+
+
+@pytest.fixture
+def make_record():
+    """저장할 상담기록 한 건을 만드는 함수 (필수 항목은 기본값으로 채움)"""
+    def make(**overrides) -> dict:
+        record = {
+            "student_name": "홍길동",
+            "grade": 3,
+            "class_num": 2,
+            "consult_date": "2024-04-01",
+            "consult_content": "친구와 다툼이 있어 교우관계 상담을 진행함",
+            "counselor": "김선생",
+            "notes": None,
+        }
+        record.update(overrides)
+        return record
+    return make
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    return app.SQLiteStore(str(tmp_path / "local.sqlite3"))
+
+
+@pytest.fixture
+def metrics():
+    return app.PerfMetrics(log_path="", prom_path="")
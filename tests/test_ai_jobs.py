@@ -0,0 +1,190 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+
+class FakeStream:
+    """OpenAI 스트리밍 응답 대신 쓰는 조각 목록"""
+
+    def __init__(self, parts: list):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=p))]) for p in parts]
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeOpenAI:
+    """chat.completions.create만 있는 OpenAI 클라이언트
+
+    errors의 예외를 차례로 먼저 발생시키고, gate가 있으면 열릴 때까지 응답을 보내지 않습니다.
+    """
+
+    def __init__(self, parts: list, errors: list = (), gate: threading.Event = None):
+        self.parts = parts
+        self.errors = list(errors)
+        self.gate = gate
+        self.started = threading.Event()
+        self.requests = []
+        self.streams = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.errors:
+            raise self.errors.pop(0)
+        stream = FakeStream(self.parts)
+        self.streams.append(stream)
+        return stream
+
+
+class CountingLimiter:
+    """요청 수 제한 대신 쓰는 카운터 (기다리지 않음)"""
+
+    def __init__(self):
+        self.acquired = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.acquired += 1
+
+
+@pytest.fixture
+def limiter():
+    return CountingLimiter()
+
+
+@pytest.fixture
+def queue(tmp_path, metrics, limiter):
+    cache = app.AICache(str(tmp_path / "ai_cache.sqlite3"))
+    return app.AIJobQueue(str(tmp_path / "ai_jobs.sqlite3"), max_workers=2, cache=cache, metrics=metrics,
+                          rate_limiter=limiter)
+
+
+@pytest.fixture
+def no_retry_delay(monkeypatch):
+    monkeypatch.setattr(app, "AI_JOB_RETRY_BASE_DELAY", 0)
+    monkeypatch.setattr(app.random, "uniform", lambda a, b: 0)
+
+
+def wait_for_job(queue, job_id: str, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.01)
+    pytest.fail(f"작업이 끝나지 않았습니다: {queue.get(job_id)}")
+
+
+def test_job_streams_result(queue, limiter):
+    client = FakeOpenAI(["학생은 ", "친구와 ", "화해했습니다. "])
+
+    job = wait_for_job(queue, queue.submit(client, "친구와 싸움"))
+
+    assert job["status"] == "done"
+    assert job["result_text"] == "학생은 친구와 화해했습니다."
+    assert job["attempts"] == 1
+    assert job["cached"] == 0
+    assert job["ttft"] is not None and job["total"] >= job["ttft"]
+    assert client.requests[0]["stream"] is True
+    assert all(stream.closed for stream in client.streams)
+    assert limiter.acquired == 1
+
+
+def test_same_text_is_served_from_cache(queue, limiter):
+    client = FakeOpenAI(["개선된 내용"])
+    wait_for_job(queue, queue.submit(client, "상담 내용"))
+
+    job = wait_for_job(queue, queue.submit(client, "상담  내용"))  # 공백 차이는 같은 입력
+
+    assert job["status"] == "done"
+    assert job["result_text"] == "개선된 내용"
+    assert job["cached"] == 1
+    assert len(client.requests) == 1
+    assert limiter.acquired == 1  # 캐시 적중은 요청 수 제한에 포함하지 않음
+
+
+@pytest.mark.skipif(not app.OPENAI_AVAILABLE, reason="openai 패키지가 필요합니다")
+def test_retries_transient_errors_through_limiter(queue, limiter, no_retry_delay):
+    client = FakeOpenAI(["다시 시도 성공"], errors=[app.APIConnectionError(request=None)])
+
+    job = wait_for_job(queue, queue.submit(client, "재시도할 내용"))
+
+    assert job["status"] == "done"
+    assert job["result_text"] == "다시 시도 성공"
+    assert job["attempts"] == 2
+    assert len(client.requests) == 2
+    assert limiter.acquired == 2  # 재시도도 요청 1회분을 얻은 뒤 보냄
+
+
+def test_other_errors_fail_without_retry(queue):
+    client = FakeOpenAI([], errors=[ValueError("잘못된 요청")])
+
+    job = wait_for_job(queue, queue.submit(client, "실패할 내용"))
+
+    assert job["status"] == "failed"
+    assert "잘못된 요청" in job["error"]
+    assert job["attempts"] == 1
+    assert len(client.requests) == 1
+
+
+def test_cancel_discards_running_job(queue):
+    gate = threading.Event()
+    client = FakeOpenAI(["취소되어야 함"], gate=gate)
+    job_id = queue.submit(client, "취소할 내용")
+    assert client.started.wait(5)
+
+    queue.cancel(job_id)
+    gate.set()
+    deadline = time.monotonic() + 5
+    while not (client.streams and client.streams[0].closed) and time.monotonic() < deadline:
+        time.sleep(0.01)  # 워커가 응답을 끝까지 받을 때까지 대기
+
+    job = queue.get(job_id)
+    assert job["status"] == "cancelled"
+    assert job["result_text"] is None
+
+
+def interrupted_job(path: str, text: str) -> str:
+    """작업을 등록만 하고 실행하지 않은 채 프로세스가 끝난 상태를 만듦"""
+    queue = app.AIJobQueue(path, max_workers=1)
+    job_id = queue._create_job("improve", text, {"text": text})
+    queue._update(job_id, status="running", partial_text="중간까지 생성된 내용")
+    return job_id
+
+
+def test_restart_resumes_interrupted_jobs(tmp_path, metrics, limiter):
+    path = str(tmp_path / "ai_jobs.sqlite3")
+    job_id = interrupted_job(path, "재시작 전 요청")
+    client = FakeOpenAI(["다시 실행한 결과"])
+
+    queue = app.AIJobQueue(path, cache=app.AICache(str(tmp_path / "ai_cache.sqlite3")), metrics=metrics,
+                           rate_limiter=limiter, client_factory=lambda: client)
+    job = wait_for_job(queue, job_id)
+
+    assert job["status"] == "done"
+    assert job["result_text"] == "다시 실행한 결과"
+    assert "재시작 전 요청" in client.requests[0]["messages"][-1]["content"]
+
+
+def test_restart_without_client_fails_interrupted_jobs(tmp_path):
+    path = str(tmp_path / "ai_jobs.sqlite3")
+    job_id = interrupted_job(path, "재시작 전 요청")
+
+    queue = app.AIJobQueue(path, client_factory=lambda: None)
+
+    job = queue.get(job_id)
+    assert job["status"] == "failed"
+    assert "재시작" in job["error"]
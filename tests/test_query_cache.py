@@ -0,0 +1,101 @@
+import pytest
+
+import app
+
+
+class Clock:
+    """time.monotonic 대신 쓰는 시계 (테스트에서 시간을 직접 진행)"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(app.time, "monotonic", clock)
+    return clock
+
+
+def counting_fetch(value):
+    calls = []
+
+    def fetch():
+        calls.append(value)
+        return value
+
+    return fetch, calls
+
+
+def test_returns_cached_value_within_ttl(clock):
+    cache = app.QueryCache(ttl=60)
+    fetch, calls = counting_fetch(["a"])
+
+    assert cache.get_or_fetch(("records",), fetch) == ["a"]
+    clock.now += 59
+    assert cache.get_or_fetch(("records",), fetch) == ["a"]
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_fetches_again_after_ttl(clock):
+    cache = app.QueryCache(ttl=60)
+    fetch, calls = counting_fetch(["a"])
+
+    cache.get_or_fetch(("records",), fetch)
+    clock.now += 60
+    cache.get_or_fetch(("records",), fetch)
+    assert len(calls) == 2
+
+
+def test_evicts_least_recently_used(clock):
+    cache = app.QueryCache(ttl=60, max_entries=2)
+    fetches = {key: counting_fetch(key) for key in "abc"}
+
+    cache.get_or_fetch(("a",), fetches["a"][0])
+    cache.get_or_fetch(("b",), fetches["b"][0])
+    cache.get_or_fetch(("a",), fetches["a"][0])  # a를 최근 사용으로
+    cache.get_or_fetch(("c",), fetches["c"][0])  # b가 제거됨
+    cache.get_or_fetch(("a",), fetches["a"][0])
+    cache.get_or_fetch(("b",), fetches["b"][0])
+    assert len(fetches["a"][1]) == 1
+    assert len(fetches["b"][1]) == 2
+
+
+def test_invalidate_drops_entries(clock):
+    cache = app.QueryCache(ttl=60)
+    fetch, calls = counting_fetch(["a"])
+
+    cache.get_or_fetch(("records",), fetch)
+    cache.invalidate()
+    cache.get_or_fetch(("records",), fetch)
+    assert len(calls) == 2
+
+
+def test_does_not_store_result_fetched_before_invalidation(clock):
+    cache = app.QueryCache(ttl=60)
+    calls = []
+
+    def fetch_during_write():
+        calls.append(True)
+        cache.invalidate()  # 조회하는 동안 다른 세션에서 쓰기
+        return ["오래된 결과"]
+
+    assert cache.get_or_fetch(("records",), fetch_during_write) == ["오래된 결과"]
+    fetch, fresh_calls = counting_fetch(["새 결과"])
+    assert cache.get_or_fetch(("records",), fetch) == ["새 결과"]
+    assert len(fresh_calls) == 1
+
+
+def test_patch_replaces_or_removes_entries(clock):
+    cache = app.QueryCache(ttl=60)
+    cache.get_or_fetch(("keep",), lambda: [1])
+    cache.get_or_fetch(("drop",), lambda: [2])
+
+    cache.patch(lambda key, value: None if key == ("drop",) else value + [3])
+
+    assert cache.get_or_fetch(("keep",), lambda: pytest.fail("다시 조회하면 안 됨")) == [1, 3]
+    assert cache.get_or_fetch(("drop",), lambda: [4]) == [4]
@@ -0,0 +1,144 @@
+import json
+import os
+
+import pytest
+
+import app
+
+pytestmark = pytest.mark.skipif(not app.SCIPY_AVAILABLE, reason="scipy 패키지가 필요합니다")
+
+RECORDS = [
+    {"id": 1, "version": 1, "consult_content": "친구와 다툼이 있어 교우관계 상담을 진행함", "notes": None},
+    {"id": 2, "version": 1, "consult_content": "수업 시간에 집중력이 부족하여 학습 태도 상담", "notes": "자리 배치 조정"},
+    {"id": 3, "version": 1, "consult_content": "진로 희망과 장래 직업에 대한 진로 상담", "notes": None},
+]
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    return str(tmp_path / "similar_index")
+
+
+@pytest.fixture
+def no_compaction(monkeypatch):
+    """백그라운드 압축 없이 델타 세그먼트만 쌓이도록 함"""
+    monkeypatch.setattr(app.SimilarityIndex, "_needs_compaction", lambda self: False)
+
+
+def wait_for_compaction(index):
+    if index._compacting is not None:
+        index._compacting.join(10)
+        assert not index._compacting.is_alive()
+
+
+def top_ids(index, text: str) -> list:
+    return [record_id for record_id, _ in index.search(text)]
+
+
+def test_empty_index(index_path):
+    index = app.SimilarityIndex(index_path)
+
+    assert index.search("교우관계 상담") == []
+    assert index.stats() == {"documents": 0, "rows": 0, "delta_rows": 0, "generation": None}
+    assert app.SimilarityIndex(index_path).search("교우관계 상담") == []
+
+
+def test_build_finds_similar_records(index_path, no_compaction):
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS)
+
+    results = index.search("친구와 다퉈서 교우관계 상담")
+    assert results[0][0] == 1
+    assert 0 < results[0][1] <= 1.0001
+    assert top_ids(index, "집중력 부족 학습 태도")[0] == 2
+    assert index.search("전혀 관계없는 문장입니다 ㅁㅁㅁ") == []
+    assert index.stats()["documents"] == 3
+
+
+def test_apply_updates_and_removes_rows(index_path, no_compaction):
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS)
+
+    index.apply([{"id": 1, "version": 2, "consult_content": "진로 희망 직업 진로 상담", "notes": None}], removed_ids=[3])
+
+    assert 3 not in top_ids(index, "진로 희망과 장래 직업에 대한 진로 상담")
+    assert top_ids(index, "진로 희망과 장래 직업에 대한 진로 상담")[0] == 1
+    assert 1 not in top_ids(index, "친구와 다툼이 있어 교우관계")
+    assert index.stats()["documents"] == 2
+    # 수정/삭제한 행은 지우지 않고 삭제 표시만 하고 새 행을 덧붙임
+    assert index.stats()["rows"] == 4
+
+
+def test_reload_applies_delta_segments(index_path, no_compaction):
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS[:2])
+    index.apply(RECORDS[2:], removed_ids=[2])
+    expected = index.search("진로 상담")
+
+    reloaded = app.SimilarityIndex(index_path)
+
+    assert reloaded.search("진로 상담") == expected
+    assert reloaded.stats()["documents"] == 2
+    assert len([n for n in os.listdir(index_path) if n.startswith("delta-")]) == 2
+
+
+def test_compaction_writes_memory_mapped_generation(index_path, monkeypatch):
+    monkeypatch.setattr(app, "SIMILAR_DELTA_MAX_ROWS", 2)
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS)  # 델타 행이 많아 백그라운드 압축 시작
+    wait_for_compaction(index)
+
+    assert index.stats() == {"documents": 3, "rows": 3, "delta_rows": 0, "generation": 1}
+    assert not [n for n in os.listdir(index_path) if n.startswith("delta-")]
+    with open(os.path.join(index_path, "meta.json"), encoding="utf-8") as f:
+        assert json.load(f)["generation"] == 1
+
+    # 압축 후 추가한 기록은 새 세대 뒤의 델타로 덧붙임
+    monkeypatch.setattr(app, "SIMILAR_DELTA_BASE_RATIO", 1.0)
+    index.apply([{"id": 4, "version": 1, "consult_content": "교우관계 갈등 중재 상담", "notes": None}])
+    reloaded = app.SimilarityIndex(index_path)
+    assert isinstance(reloaded._base.data, app.np.memmap)
+    assert reloaded.stats() == {"documents": 4, "rows": 4, "delta_rows": 1, "generation": 1}
+    assert set(top_ids(reloaded, "교우관계 상담")[:2]) == {1, 4}
+
+
+def test_compaction_drops_removed_rows(index_path, monkeypatch):
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS)
+    wait_for_compaction(index)
+    monkeypatch.setattr(app, "SIMILAR_COMPACT_RATIO", 0.2)
+    index.apply(removed_ids=[1, 2, 3])
+    wait_for_compaction(index)
+
+    assert index.stats() == {"documents": 0, "rows": 0, "delta_rows": 0, "generation": None}
+    assert app.SimilarityIndex(index_path).search("교우관계 상담") == []
+
+
+def test_changed_settings_rebuild_empty_index(index_path, no_compaction):
+    index = app.SimilarityIndex(index_path)
+    index.apply(RECORDS)
+    meta_path = os.path.join(index_path, "meta.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["hash_bits"] = app.SIMILAR_HASH_BITS + 1
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    assert app.SimilarityIndex(index_path).stats()["documents"] == 0
+
+
+def test_refresh_matches_store(index_path, sqlite_store, make_record, no_compaction):
+    saved = sqlite_store.insert_records([
+        make_record(consult_content=r["consult_content"], notes=r["notes"]) for r in RECORDS
+    ])
+    index = app.SimilarityIndex(index_path)
+    index.refresh(sqlite_store)
+    assert index.stats()["documents"] == 3
+
+    sqlite_store.update_record(saved[0]["id"], {"consult_content": "진로 희망 상담"})
+    sqlite_store.delete_record(saved[1]["id"])
+    index.refresh(sqlite_store)
+
+    assert index.stats()["documents"] == 2
+    assert top_ids(index, "진로 희망 상담")[0] == saved[0]["id"]
+    assert saved[1]["id"] not in top_ids(index, "집중력이 부족하여 학습 태도")
@@ -0,0 +1,282 @@
+import threading
+
+import pytest
+
+import app
+
+
+class FakeRemoteStore(app.SQLiteStore):
+    """Supabase 대신 쓰는 원격 저장소 (SQLite 파일, LocalFirstStore가 쓰는 메서드만 추가)"""
+
+    def get_created_at(self, record_ids: list) -> dict:
+        records = (self.get_record(record_id) for record_id in record_ids)
+        return {r["id"]: r["created_at"] for r in records if r}
+
+
+@pytest.fixture
+def remote_store(tmp_path):
+    return FakeRemoteStore(str(tmp_path / "remote.sqlite3"))
+
+
+@pytest.fixture
+def fetched(remote_store, monkeypatch):
+    """pull에서 원격 저장소로부터 받은 행 목록"""
+    rows = []
+    list_changed_records = remote_store.list_changed_records
+
+    def recording(*args):
+        page = list_changed_records(*args)
+        rows.extend(page)
+        return page
+
+    monkeypatch.setattr(remote_store, "list_changed_records", recording)
+    return rows
+
+
+def set_remote_updated_at(remote_store, record_id, updated_at: str):
+    """원격 기록의 수정 시각 변경 (증분 동기화 기준점보다 오래된 변경으로 만들기)"""
+    with remote_store._conn:
+        remote_store._conn.execute("UPDATE counseling_records SET updated_at = ? WHERE id = ?", (updated_at, record_id))
+
+
+@pytest.fixture
+def local_first(sqlite_store, remote_store):
+    changes = []
+    store = app.LocalFirstStore(sqlite_store, remote_store, on_remote_change=lambda: changes.append(True))
+    store.changes = changes
+    return store
+
+
+# --- SQLiteStore ---
+
+def test_sqlite_insert_and_get(sqlite_store, make_record):
+    [saved] = sqlite_store.insert_records([make_record()])
+    assert saved["id"] > 0
+    assert saved["version"] == 1
+    assert saved["created_at"]
+    assert sqlite_store.get_record(saved["id"]) == saved
+    assert sqlite_store.get_record(saved["id"] + 1) is None
+
+
+def test_sqlite_list_records_filters_and_pages(sqlite_store, make_record):
+    sqlite_store.insert_records([
+        make_record(student_name="홍길동", consult_date="2024-04-01"),
+        make_record(student_name="홍길순", consult_date="2024-05-01"),
+        make_record(student_name="김철수", grade=4, consult_date="2024-06-01"),
+    ])
+    columns = ["id", "student_name", "consult_date"]
+
+    first_page = sqlite_store.list_records({"grade": 3}, columns, limit=1)
+    assert [r["student_name"] for r in first_page] == ["홍길순"]
+    cursor = (first_page[-1]["consult_date"], first_page[-1]["id"])
+    assert [r["student_name"] for r in sqlite_store.list_records({"grade": 3}, columns, cursor, limit=1)] == ["홍길동"]
+
+    assert [r["student_name"] for r in sqlite_store.list_records({"student_name": "길"}, columns)] == ["홍길순", "홍길동"]
+    assert [r["student_name"] for r in sqlite_store.list_records({"date_from": "2024-05-01"}, columns)] == ["김철수", "홍길순"]
+
+
+def test_sqlite_update_checks_version(sqlite_store, make_record):
+    [saved] = sqlite_store.insert_records([make_record()])
+
+    [updated] = sqlite_store.update_record(saved["id"], {"consult_content": "수정한 내용"}, expected_version=1)
+    assert updated["consult_content"] == "수정한 내용"
+    assert updated["version"] == 2
+
+    # 이미 다른 곳에서 수정된 버전을 기준으로 한 수정은 반영하지 않음
+    assert sqlite_store.update_record(saved["id"], {"consult_content": "늦은 수정"}, expected_version=1) == []
+    assert sqlite_store.get_record(saved["id"])["consult_content"] == "수정한 내용"
+
+
+def test_sqlite_search_content_ranks_in_sql(sqlite_store, make_record):
+    sqlite_store.insert_records([
+        make_record(student_name="한번", consult_content="교우관계 상담"),
+        make_record(student_name="두번", consult_content="교우관계 문제로 교우관계 상담", notes="교우관계 확인"),
+        make_record(student_name="없음", consult_content="학습 상담"),
+        make_record(student_name="다른반", class_num=5, consult_content="교우관계 교우관계 교우관계"),
+    ])
+
+    results = sqlite_store.search_content("교우관계 상담", {"class_num": 2}, limit=10)
+    assert [r["student_name"] for r in results] == ["두번", "한번"]
+    assert [r["rank"] for r in results] == [4.0, 2.0]
+    assert results[0]["snippet"] == "교우관계 문제로 교우관계 상담 교우관계 확인"
+    # 상담 내용 전체는 읽지 않고 search_counseling_records와 같은 컬럼만 반환
+    assert set(results[0]) == {"id", "student_name", "grade", "class_num", "consult_date", "counselor",
+                               "created_at", "rank", "snippet"}
+
+    assert [r["student_name"] for r in sqlite_store.search_content("교우관계", {}, limit=1)] == ["다른반"]
+    assert sqlite_store.search_content("  ", {}, limit=10) == []
+
+
+def test_sqlite_search_content_snippet_starts_near_first_word(sqlite_store, make_record):
+    sqlite_store.insert_records([make_record(consult_content="가" * 100 + "집중력 부족" + "나" * 200)])
+
+    [result] = sqlite_store.search_content("집중력", {}, limit=10)
+    assert result["snippet"] == "가" * 40 + "집중력 부족" + "나" * 114
+
+
+def test_sqlite_delete(sqlite_store, make_record):
+    [saved] = sqlite_store.insert_records([make_record()])
+    assert [r["id"] for r in sqlite_store.delete_record(saved["id"])] == [saved["id"]]
+    assert sqlite_store.get_record(saved["id"]) is None
+    assert sqlite_store.delete_record(saved["id"]) == []
+
+
+# --- LocalFirstStore ---
+
+def test_local_first_insert_gets_remote_id_after_push(local_first, remote_store, make_record):
+    [saved] = local_first.insert_records([make_record()])
+    assert saved["id"] < 0
+    assert local_first.sync_status()["pending"] == 1
+
+    assert local_first.push() == 1
+    [remote] = remote_store.list_records({}, app.RECORD_COLUMNS)
+    assert local_first.get_record(saved["id"]) is None
+    assert local_first.get_record(remote["id"])["consult_content"] == saved["consult_content"]
+    assert local_first.sync_status()["pending"] == 0
+
+
+def test_local_first_update_conflicts_when_deleted_remotely(local_first, remote_store, make_record):
+    local_first.insert_records([make_record()])
+    local_first.push()
+    [remote] = remote_store.list_records({}, app.RECORD_COLUMNS)
+    remote_store.delete_record(remote["id"])
+
+    assert local_first.update_record(remote["id"], {"consult_content": "로컬에서 수정"})
+    local_first.push()
+
+    status = local_first.sync_status()
+    assert status["pending"] == 0
+    assert status["conflicts"] == 1
+    assert remote_store.get_record(remote["id"]) is None
+
+
+def test_local_first_update_conflicts_with_newer_remote_version(local_first, remote_store, make_record):
+    [saved] = local_first.insert_records([make_record()])
+    local_first.push()
+    [remote] = remote_store.list_records({}, app.RECORD_COLUMNS)
+    record_id = remote["id"]
+
+    # 다른 곳에서 먼저 수정 (원격 version 2)
+    remote_store.update_record(record_id, {"consult_content": "다른 곳에서 수정"})
+    # 로컬 사본은 아직 version 1 기준으로 수정
+    assert local_first.update_record(record_id, {"consult_content": "로컬에서 수정"}, expected_version=1)
+
+    local_first.push()
+    status = local_first.sync_status()
+    assert status["pending"] == 0
+    assert status["conflicts"] == 1
+    assert remote_store.get_record(record_id)["consult_content"] == "다른 곳에서 수정"
+
+    # 충돌로 남은 작업은 대기 중이 아니므로 pull하면 원격 내용으로 맞춰짐
+    assert local_first.pull() >= 1
+    local = local_first.get_record(record_id)
+    assert local["consult_content"] == "다른 곳에서 수정"
+    assert local["version"] == 2
+
+
+def test_local_first_pull_keeps_pending_changes(local_first, remote_store, make_record):
+    [pending] = local_first.insert_records([make_record(student_name="대기중")])
+    remote_store.insert_records([make_record(student_name="원격")])
+
+    assert local_first.pull() == 1
+    names = {r["student_name"] for r in local_first.list_records({}, ["id", "student_name"])}
+    assert names == {"대기중", "원격"}
+    assert local_first.get_record(pending["id"]) is not None
+
+
+def test_local_first_pull_removes_remote_deletions(local_first, remote_store, make_record):
+    [remote] = remote_store.insert_records([make_record()])
+    local_first.sync_once()
+    assert local_first.get_record(remote["id"]) is not None
+    assert local_first.changes
+
+    remote_store.delete_record(remote["id"])
+    local_first.sync_once()
+    assert local_first.get_record(remote["id"]) is None
+    assert local_first.sync_status()["last_error"] is None
+
+
+def test_local_first_pull_fetches_only_changes(local_first, remote_store, fetched, make_record):
+    old, changed, latest = remote_store.insert_records([
+        make_record(student_name="오래된"), make_record(student_name="수정될"), make_record(student_name="최근")
+    ])
+    set_remote_updated_at(remote_store, old["id"], "2023-01-01T00:00:00")
+    set_remote_updated_at(remote_store, changed["id"], "2023-01-01T00:00:00")
+    set_remote_updated_at(remote_store, latest["id"], "2024-01-01T00:00:00")
+
+    assert local_first.pull() == 3
+    assert len(fetched) == 3
+
+    # 기준점(마지막으로 받은 행) 근처의 행만 다시 받음
+    fetched.clear()
+    assert local_first.pull() == 0
+    assert [r["student_name"] for r in fetched] == ["최근"]
+
+    fetched.clear()
+    remote_store.update_record(changed["id"], {"consult_content": "다른 곳에서 수정"})
+    assert local_first.pull() == 1
+    assert sorted(r["student_name"] for r in fetched) == ["수정될", "최근"]
+    assert local_first.get_record(changed["id"])["consult_content"] == "다른 곳에서 수정"
+
+
+def test_local_first_pull_lists_ids_only_when_counts_differ(local_first, remote_store, make_record, monkeypatch):
+    listed = []
+    list_record_ids = remote_store.list_record_ids
+    monkeypatch.setattr(remote_store, "list_record_ids", lambda *args: listed.append(args) or list_record_ids(*args))
+    first, second = remote_store.insert_records([make_record(), make_record()])
+
+    local_first.pull()
+    assert listed == []
+
+    remote_store.delete_record(first["id"])
+    assert local_first.pull() == 1
+    assert listed
+    assert local_first.get_record(first["id"]) is None
+    assert local_first.get_record(second["id"]) is not None
+
+
+def test_local_first_pull_keeps_watermark_before_pending_rows(local_first, remote_store, make_record):
+    [remote] = remote_store.insert_records([make_record()])
+    set_remote_updated_at(remote_store, remote["id"], "2023-01-01T00:00:00")
+    local_first.pull()
+
+    # 다른 곳에서 수정된 기록을 로컬에서도 수정하여 동기화 대기 중일 때 pull
+    remote_store.update_record(remote["id"], {"consult_content": "다른 곳에서 수정"})
+    set_remote_updated_at(remote_store, remote["id"], "2024-01-01T00:00:00")
+    [newer] = remote_store.insert_records([make_record(student_name="새 기록")])
+    set_remote_updated_at(remote_store, newer["id"], "2025-01-01T00:00:00")
+    assert local_first.update_record(remote["id"], {"consult_content": "로컬에서 수정"}, expected_version=1)
+    local_first.pull()
+    assert local_first.get_record(remote["id"])["consult_content"] == "로컬에서 수정"
+    assert local_first.get_record(newer["id"]) is not None
+
+    # 충돌로 끝난 뒤에는 기준점이 그 기록 앞에 머물러 있으므로 다음 pull에서 원격 내용을 받음
+    local_first.push()
+    assert local_first.sync_status()["conflicts"] == 1
+    local_first.pull()
+    assert local_first.get_record(remote["id"])["consult_content"] == "다른 곳에서 수정"
+
+
+def test_local_first_insert_ids_are_unique_across_connections(tmp_path, remote_store, make_record):
+    path = str(tmp_path / "shared.sqlite3")
+    stores = [app.LocalFirstStore(app.SQLiteStore(path), remote_store) for _ in range(2)]
+    errors = []
+
+    def insert(store):
+        try:
+            for i in range(20):
+                store.insert_records([make_record(student_name=f"학생{i}")])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=insert, args=(stores[i % 2],)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    local = stores[0].local
+    ids = [r["id"] for r in local.list_records({}, ["id"], limit=1000)]
+    assert len(ids) == len(set(ids)) == 80
+    assert sorted(op["record_id"] for op in local.pending_ops(1000)) == sorted(ids)